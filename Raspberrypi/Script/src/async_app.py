@@ -0,0 +1,274 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from util.aio import (
+    AsyncCamera, AsyncIotClient, AsyncStateListener, AsyncUploader, AsyncZigbeeClient
+)
+from util import profiler, trace
+from util.config import config
+from util.lazy import preload
+from util.metrics import start_server as start_metrics_server
+from util.state_manager import Status
+
+
+class AsyncElderlyWatcherApp:
+    """
+    asyncio版のアプリケーション (config.runtime == "asyncio")
+
+    1本のイベントループ上で ボタン受信 / 状態遷移 / 撮影 / アップロード / Lambda呼び出し を
+    タスクとして動かす。ステージ間は上限付きキューでつなぎ、MONITORINGに戻ったら
+    撮影タスクと未処理のフレームをキャンセルする。スレッドで実行中の撮影は
+    SurveillanceService の停止フラグを見て、アップロード・Lambda呼び出しの前で打ち切る
+    (送信が始まっているリクエストは止められない)。
+    """
+
+    def __init__(self, state_manager, iot_client, surveillance_service, zigbee_client, replayer=None):
+        self.state = state_manager
+        self.service = surveillance_service
+        self.replayer = replayer
+        self._iot_client = iot_client
+        self._zigbee_client = zigbee_client
+
+        self._alert_task = None
+        self._prealert_task = None
+        self._inflight = set()     # MONITORING復帰でキャンセルするタスク
+        self._background = set()   # 最後まで走らせるタスク (状態報告など)
+        self._request_sem = None
+        self._uploads = None
+        # スレッドで動く接続リトライを終了時に止める (asyncio.run は既定のスレッドプールの終了を待つため)
+        self._shutdown = threading.Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        if config.trace_path:
+            trace.start(config.trace_path)
+        profiler.install_signal_handlers(loop)
+        if config.profile_enabled:
+            profiler.start()
+        self.iot = AsyncIotClient(self._iot_client)
+        self.zigbee = AsyncZigbeeClient(self._zigbee_client, loop)
+        self.camera = AsyncCamera(self.service.camera)
+        self.uploader = AsyncUploader(self.service.storage, config.async_upload_workers)
+        states = AsyncStateListener(self.state, loop)
+
+        self._uploads = asyncio.Queue(maxsize=config.async_queue_size)
+        self._loop = loop
+        # 緊急前映像・ライブ映像のアップロードをこのループのキューとワーカーで送る
+        self.service.submit_upload = self._submit_upload
+        self._request_sem = asyncio.Semaphore(config.async_max_inflight)
+
+        # ボタンを最優先で受け付け、残りはバックグラウンドで並行して準備する
+        await self.zigbee.connect()
+        await asyncio.to_thread(self.service.start_pipeline)
+        self._spawn(self._connect_iot(), self._background)
+        self._spawn(asyncio.to_thread(self.service.storage.warm_up), self._background)
+        self._spawn(asyncio.to_thread(self.service.trigger.warm_up), self._background)
+        self._spawn(asyncio.to_thread(preload, "cv2", "numpy"), self._background)
+        self._spawn(asyncio.to_thread(start_metrics_server), self._background)
+        await self.iot.report_status(self.state.current)
+        if self.replayer:
+            self.replayer.start()
+
+        workers = [
+            asyncio.create_task(self._upload_worker(), name=f"upload-{i}")
+            for i in range(config.async_upload_workers)
+        ]
+        tasks = [
+            asyncio.create_task(self._button_loop(), name="button"),
+            asyncio.create_task(self._state_loop(states), name="state"),
+        ]
+        if self.state.current == Status.MONITORING:
+            await self._start_prealert()
+
+        print("=" * 50)
+        print("🚀 System Started (asyncio). Waiting for events...")
+        print("=" * 50)
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            print("=" * 50)
+            print("🛑 Shutting down...")
+            self._shutdown.set()
+            await self._stop_alert()
+            await self._stop_prealert()
+            for task in tasks + workers:
+                task.cancel()
+            await asyncio.gather(*tasks, *workers, return_exceptions=True)
+            if self.service.pipeline:
+                await asyncio.to_thread(self.service.pipeline.stop)
+            await self.camera.stop()
+            await asyncio.to_thread(self.service.storage.shutdown)
+            if self.replayer:
+                await asyncio.to_thread(self.replayer.stop)
+            await self.zigbee.disconnect()
+            trace.stop()
+            await asyncio.to_thread(profiler.stop)
+            print("👋 Goodbye.")
+            print("=" * 50)
+
+    async def _connect_iot(self):
+        if await self.iot.connect(self._shutdown) and self.replayer:
+            self.replayer.kick()
+
+    # ---- イベント受信 ----
+
+    async def _button_loop(self):
+        while True:
+            received_at = await self.zigbee.presses.get()
+            if self.state.current != Status.ALERT:
+                self.service.mark_alert_requested(received_at)
+            self.state.update(Status.ALERT)
+            print("=" * 50)
+            print("🔘 Emergency button pressed!")
+            print("=" * 50)
+            changed_at = self.state.last_changed_at
+            if changed_at is not None and changed_at >= received_at:
+                print(f"⏱️ Button -> State: {(changed_at - received_at) * 1000:.2f} ms")
+
+    async def _state_loop(self, states):
+        while True:
+            status = await states.changes.get()
+            self._spawn(self.iot.report_status(status), self._background)
+            if status == "alert":
+                await self._stop_prealert()
+                await self._start_alert()
+            else:
+                await self._stop_alert()
+                await self._start_prealert()
+
+    # ---- 撮影 ----
+
+    async def _start_alert(self):
+        if self._alert_task and not self._alert_task.done():
+            return
+        print("📸 Alert: Capture task starting...")
+        await asyncio.to_thread(self.service._start_sources)
+        if self.service.detector:
+            self.service.detector.reset()
+        self.service.scheduler.reset()
+        self.service.latency.reset()
+        self.service._stop_event.clear()
+        self.service._start_alert_workers()
+        self._alert_task = asyncio.create_task(self._alert_loop(), name="alert")
+
+    async def _stop_alert(self):
+        if not self._alert_task or self._alert_task.done():
+            return
+        print("👁️ Monitoring: Capture task stopping...")
+        # スレッドで実行中の capture_once に、まだ送っていなければ送らずに終わるよう知らせる
+        self.service._stop_event.set()
+        self._alert_task.cancel()
+        await asyncio.gather(self._alert_task, return_exceptions=True)
+        self._alert_task = None
+
+        # 送信待ち・実行中のリクエストとアップロード待ちのフレームを破棄
+        for task in list(self._inflight):
+            task.cancel()
+        while not self._uploads.empty():
+            self._uploads.get_nowait()[0].cancel()
+            self._uploads.task_done()
+        await asyncio.to_thread(self.service._stop_alert_workers)
+        await asyncio.to_thread(self.service._stop_sources)
+        if self.service.prealert is None:
+            await self.camera.stop()
+        print("👁️ Capture task stopped.")
+
+    async def _alert_loop(self):
+        # 緊急前映像をライブより先にキューへ (スレッド版と同じくクリップにも積む)
+        try:
+            await asyncio.to_thread(self.service._flush_prealert)
+        except Exception as e:
+            print(f"⚠️ Pre-alert Flush Error: {type(e).__name__}: {e}")
+
+        scheduler = self.service.scheduler
+        while True:
+            await asyncio.sleep(scheduler.time_until_next())
+            scheduler.tick()
+            # 前回のリクエストがまだ上限まで詰まっていればこの回は見送る
+            if len(self._inflight) >= config.async_max_inflight:
+                scheduler.skipped += 1
+                continue
+            if self.service.pipeline:
+                # エンコード・変化スコアは別プロセスで済んでいる
+                self._spawn(self._trigger(self.service._upload_pipeline_frame), self._inflight)
+                continue
+            if await asyncio.to_thread(self.service._has_changed):
+                self._spawn(self._trigger(self.service.capture_once), self._inflight)
+
+    async def _trigger(self, capture):
+        async with self._request_sem:
+            await asyncio.to_thread(capture)
+
+    async def _start_prealert(self):
+        if self.service.prealert is None:
+            return
+        if self._prealert_task and not self._prealert_task.done():
+            return
+        await self.camera.start()
+        self._prealert_task = asyncio.create_task(self._prealert_loop(), name="prealert")
+
+    async def _stop_prealert(self):
+        if not self._prealert_task or self._prealert_task.done():
+            return
+        self._prealert_task.cancel()
+        await asyncio.gather(self._prealert_task, return_exceptions=True)
+        self._prealert_task = None
+
+    async def _prealert_loop(self):
+        last_ts = 0.0
+        while True:
+            frame, ts = await asyncio.to_thread(self.service._read_frame, "prealert")
+            if frame is not None and ts != last_ts:
+                data = await self.camera.encode(frame, config.prealert_jpeg_quality)
+                if data is not None:
+                    self.service.prealert.append(data, ts)
+                    last_ts = ts
+            await asyncio.sleep(config.prealert_interval)
+
+    # ---- アップロード ----
+
+    def _submit_upload(self, data, filename, folder_name, content_type="image/jpeg", metadata=None,
+                       priority=False, purpose="capture"):
+        """
+        SurveillanceService.submit_upload の差し替え (撮影スレッドから呼ばれる)。
+        イベントループのキューに積み、結果は StorageManager.submit_bytes と同じく Future で返す
+        """
+        future = Future()
+        job = (future, data, filename, folder_name, content_type, metadata, purpose)
+        self._loop.call_soon_threadsafe(self._enqueue_upload, job, priority)
+        return future
+
+    def _enqueue_upload(self, job, priority):
+        # asyncio.Queue は順番を入れ替えられないので priority は使わない。満杯なら一番古いフレームを捨てる
+        if self._uploads.full():
+            old = self._uploads.get_nowait()
+            old[0].cancel()
+            self._uploads.task_done()
+            print(f"⚠️ Upload queue full. Dropped: {old[3]}/{old[2]}")
+        self._uploads.put_nowait(job)
+
+    async def _upload_worker(self):
+        while True:
+            future, data, filename, folder_name, content_type, metadata, purpose = await self._uploads.get()
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                ok = await self.uploader.upload_bytes(
+                    data, filename, folder_name, content_type=content_type, metadata=metadata, purpose=purpose
+                )
+                future.set_result(ok)
+            except Exception as e:
+                print(f"⚠️ Upload Error: {type(e).__name__}: {e}")
+                future.set_exception(e)
+            finally:
+                # 結果を入れられずに抜けた (終了時のキャンセル) ら、待っている側に例外で知らせる
+                if future.running():
+                    future.set_exception(RuntimeError("upload worker stopped"))
+                self._uploads.task_done()
+
+    def _spawn(self, coro, group):
+        task = asyncio.create_task(coro)
+        group.add(task)
+        task.add_done_callback(group.discard)
+        return task
@@ -0,0 +1,210 @@
+"""
+アプリ側のスタンドイン (util.config を読み込むので、環境変数を設定してから import する)
+
+- LocalShadowClient: IotClient の接続先を AWS IoT Core から手元の MQTT ブローカーに差し替える
+- SyntheticCamera:   カメラの代わりに動く四角形の疑似フレームを流す
+- ReplayService / ReplayStorage: トレースに記録されたカメラ・アップロードの結果を用途ごとに順に返す (trace_replay.py)
+"""
+import threading
+import time
+from collections import defaultdict, deque
+import paho.mqtt.client as paho
+from util.camera import CameraManager
+from util.encoder import RenditionEncoder
+from util.mqtt_client import IotClient
+from util.service import SurveillanceService
+from util.storage import StorageManager
+
+
+class _PublishResult:
+    def __init__(self, info):
+        self.info = info
+
+    def result(self, timeout=None):
+        self.info.wait_for_publish(timeout)
+        if not self.info.is_published():
+            raise TimeoutError("publish not acknowledged")
+
+
+class _PahoConnection:
+    """awscrt の MqttConnection と同じ呼び出し方 (subscribe / publish) ができる paho ラッパー"""
+
+    def __init__(self, host, port, client_id):
+        self.client = paho.Client(client_id=client_id)
+        self.client.on_message = self._on_message
+        self.host = host
+        self.port = port
+        self._callbacks = []
+        self._connected = threading.Event()
+        self.client.on_connect = lambda *args: self._connected.set()
+
+    def connect(self):
+        self.client.connect(self.host, self.port, 30)
+        self.client.loop_start()
+        if not self._connected.wait(5):
+            raise TimeoutError("broker connect timed out")
+
+    def disconnect(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def subscribe(self, topic, qos, callback):
+        self._callbacks.append((topic, callback))
+        self.client.subscribe(topic, int(qos))
+
+    def publish(self, topic, payload, qos):
+        return _PublishResult(self.client.publish(topic, payload, qos=int(qos)))
+
+    def _on_message(self, client, userdata, msg):
+        for topic, callback in self._callbacks:
+            if paho.topic_matches_sub(topic, msg.topic):
+                callback(msg.topic, msg.payload)
+
+
+class LocalShadowClient(IotClient):
+    def __init__(self, on_delta_callback, host, port, outbox=None):
+        super().__init__(on_delta_callback, outbox)
+        self.host = host
+        self.port = port
+
+    def connect(self):
+        self.connection = _PahoConnection(self.host, self.port, "bench-agent")
+        self.connection.connect()
+        print("✅ Local shadow broker connected")
+        self._subscribe_delta()
+        self._subscribe_shadow_responses()
+        self._connected.set()
+
+
+class SyntheticCamera(CameraManager):
+    """デバイスを開かずに、fps 枚/秒で疑似フレームを流す"""
+
+    def __init__(self, fps=15, width=1280, height=720):
+        super().__init__(device_index=-1)
+        self.fps = fps
+        self.size = (height, width)
+
+    def _grab_loop(self):
+        import numpy as np
+
+        h, w = self.size
+        base = np.tile(np.linspace(0, 255, w, dtype=np.uint8), (h, 1))
+        base = np.dstack([base, base[:, ::-1], np.full((h, w), 96, dtype=np.uint8)])
+        box = max(h // 6, 1)
+        i = 0
+        interval = 1.0 / self.fps
+        while not self._stop_event.wait(interval):
+            frame = base.copy()
+            x = (i * 16) % max(w - box, 1)
+            frame[h // 3:h // 3 + box, x:x + box] = 255
+            self._on_frame(frame)
+            i += 1
+
+
+_PLACEHOLDER_JPEG = b"\xff\xd8replay\xff\xd9"
+
+
+class _ReplayEncoder(RenditionEncoder):
+    def encode(self, frame):
+        return [(r, _PLACEHOLDER_JPEG) for r in self.renditions]
+
+
+def by_purpose(outcomes):
+    """
+    記録された結果を用途ごとの列に分ける: {purpose: deque}
+    用途のない古いトレースはすべて撮影 ("capture") として扱う
+    """
+    queues = defaultdict(deque)
+    for outcome in outcomes:
+        queues[outcome.get("purpose", "capture")].append(outcome)
+    return queues
+
+
+class ReplayCamera(CameraManager):
+    """デバイスを開かないカメラ。取得結果は ReplayService が記録から返す"""
+
+    def __init__(self):
+        super().__init__(device_index=-1)
+        self.encoder = _ReplayEncoder()
+        self._active = False
+
+    @property
+    def running(self):
+        return self._active
+
+    def start(self):
+        self._active = True
+
+    def stop(self):
+        self._active = False
+
+    def latest_frame(self, timeout=None):
+        if not self._active:
+            return None, 0.0
+        self._count("frames")
+        return "replay-frame", time.time()
+
+    def burst(self, count, window):
+        frame, ts = self.latest_frame()
+        return [(frame, ts)] if frame is not None else []
+
+
+class ReplayService(SurveillanceService):
+    """
+    記録されたカメラの取得結果を、撮影 ("capture")・変化検知 ("motion")・緊急前映像 ("prealert") の
+    用途ごとに順に返す SurveillanceService。変化検知は記録時の判定 (keep) をそのまま使う
+    """
+
+    def __init__(self, camera_outcomes, storage_manager, notify=None, clock=None):
+        super().__init__(ReplayCamera(), storage_manager, notify=notify, clock=clock)
+        self._outcomes = by_purpose(camera_outcomes)
+
+    def _next(self, purpose):
+        queue = self._outcomes.get(purpose)
+        return queue.popleft() if queue else None
+
+    def _read_frame(self, purpose):
+        outcome = self._next(purpose)
+        if outcome is not None and not outcome.get("ok", True):
+            self.camera._count("no_frame")
+            return None, 0.0
+        return self.camera.latest_frame()
+
+    def _grab_frame(self):
+        frame, ts = self._read_frame("capture")
+        return frame, ts, None
+
+    def _has_changed(self):
+        # 記録時に変化検知が無効だった (記録がない) 時は毎回送る
+        outcome = self._next("motion")
+        if outcome is None or not outcome.get("ok", True):
+            return True
+        keep = outcome.get("keep", True)
+        if not keep:
+            print(f"💤 No change (score={outcome.get('score', 0.0):.3f}). Skipped.")
+        return keep
+
+
+class ReplayStorage(StorageManager):
+    """記録されたアップロード結果と所要時間 (仮想時間) を用途ごとに順に返す"""
+
+    def __init__(self, outcomes, clock):
+        super().__init__()
+        self._outcomes = by_purpose(outcomes)
+        self._clock = clock
+
+    def upload_bytes(self, data, filename, folder_name, content_type="image/jpeg", metadata=None, purpose="capture"):
+        queue = self._outcomes.get(purpose)
+        outcome = queue.popleft() if queue else {"ok": True, "latency": 0.0}
+        self._clock.sleep(outcome.get("latency", 0.0))
+        return outcome.get("ok", True)
+
+
+class NullConnection:
+    """送信先のない接続 (IotClient の publish を捨てる)"""
+
+    def publish(self, topic, payload, qos):
+        return None
+
+    def subscribe(self, topic, qos, callback):
+        return None
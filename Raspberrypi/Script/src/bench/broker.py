@@ -0,0 +1,141 @@
+"""
+ベンチマーク用の最小 MQTT 3.1.1 ブローカー
+
+CONNECT / PUBLISH (QoS0・1) / SUBSCRIBE / UNSUBSCRIBE / PINGREQ / DISCONNECT だけに対応する。
+配信は全て QoS0、retain・セッション保持・認証はなし。
+Zigbee (zigbee2mqtt/...) と IoT Shadow ($aws/things/...) の両方のトピックをこれ1つで流す。
+"""
+import asyncio
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(pattern, topic):
+    p_parts = pattern.split("/")
+    t_parts = topic.split("/")
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts):
+            return False
+        if p != "+" and p != t_parts[i]:
+            return False
+    return len(p_parts) == len(t_parts)
+
+
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _packet(kind, flags, body):
+    return bytes([(kind << 4) | flags]) + _encode_length(len(body)) + body
+
+
+def _string(data, offset):
+    length = int.from_bytes(data[offset:offset + 2], "big")
+    return data[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+class MiniBroker:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.published = 0
+        self._sessions = {}  # writer -> [トピックフィルタ]
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mini-broker", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.close()
+
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        multiplier, length = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b""
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    async def _handle(self, reader, writer):
+        self._sessions[writer] = []
+        try:
+            while True:
+                kind, flags, body = await self._read_packet(reader)
+                if kind == CONNECT:
+                    writer.write(_packet(CONNACK, 0, b"\x00\x00"))
+                elif kind == PUBLISH:
+                    self._on_publish(writer, flags, body)
+                elif kind == SUBSCRIBE:
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        topic, offset = _string(body, offset)
+                        offset += 1  # 要求QoS (常にQoS0で配信する)
+                        self._sessions[writer].append(topic)
+                        granted.append(0)
+                    writer.write(_packet(SUBACK, 0, packet_id + bytes(granted)))
+                elif kind == UNSUBSCRIBE:
+                    packet_id, offset = body[:2], 2
+                    while offset < len(body):
+                        topic, offset = _string(body, offset)
+                        if topic in self._sessions[writer]:
+                            self._sessions[writer].remove(topic)
+                    writer.write(_packet(UNSUBACK, 0, packet_id))
+                elif kind == PINGREQ:
+                    writer.write(_packet(PINGRESP, 0, b""))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._sessions.pop(writer, None)
+            writer.close()
+
+    def _on_publish(self, writer, flags, body):
+        qos = (flags >> 1) & 0x03
+        topic, offset = _string(body, 0)
+        if qos:
+            writer.write(_packet(PUBACK, 0, body[offset:offset + 2]))
+            offset += 2
+        payload = body[offset:]
+        self.published += 1
+
+        packet = _packet(PUBLISH, 0, len(topic.encode()).to_bytes(2, "big") + topic.encode() + payload)
+        for subscriber, filters in list(self._sessions.items()):
+            if any(topic_matches(f, topic) for f in filters):
+                subscriber.write(packet)
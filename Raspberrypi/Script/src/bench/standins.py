@@ -0,0 +1,205 @@
+"""
+ベンチマーク用のクラウド側スタンドイン (HTTP)
+
+- FakeS3:     PUT /{bucket}/{key} を受けてメモリに保存する S3 互換サーバー。
+              .jpg を受けたら本番の S3 イベント → 通知Lambda と同じく LINE へ push する
+- FakeLambda: 撮影トリガーの Function URL。受けたら (遅延を入れて) LINE へ push する
+- FakeLine:   LINE Messaging API の push エンドポイント。受信時刻を記録する
+
+受信時刻は全て EventLog に time.perf_counter() で記録する (アプリと同じプロセスで動かすので比較できる)。
+"""
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class EventLog:
+    """名前ごとの発生時刻 (perf_counter) の記録"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._events = {}
+
+    def record(self, name, at=None):
+        with self._cond:
+            self._events.setdefault(name, []).append(time.perf_counter() if at is None else at)
+            self._cond.notify_all()
+
+    def first_after(self, name, since):
+        with self._cond:
+            return next((t for t in self._events.get(name, []) if t >= since), None)
+
+    def wait_for(self, name, since, timeout):
+        """since 以降の最初の発生時刻を待つ。来なければ None"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                found = next((t for t in self._events.get(name, []) if t >= since), None)
+                remaining = deadline - time.monotonic()
+                if found is not None or remaining <= 0:
+                    return found
+                self._cond.wait(remaining)
+
+
+def _read_body(handler):
+    """Content-Length / chunked / aws-chunked のどれでも本文を読む"""
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        raw = bytearray()
+        while True:
+            size_line = handler.rfile.readline()
+            size = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # トレーラーを読み捨てる
+                while handler.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            raw += handler.rfile.read(size)
+            handler.rfile.readline()
+        body = bytes(raw)
+    else:
+        body = handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+
+    if "aws-chunked" in handler.headers.get("Content-Encoding", ""):
+        body = _decode_aws_chunked(body)
+    return body
+
+
+def _decode_aws_chunked(body):
+    out = bytearray()
+    offset = 0
+    while offset < len(body):
+        end = body.index(b"\r\n", offset)
+        size = int(body[offset:end].split(b";")[0], 16)
+        offset = end + 2
+        if size == 0:
+            break
+        out += body[offset:offset + size]
+        offset += size + 2
+    return bytes(out)
+
+
+class _Server:
+    handler = None
+
+    def __init__(self, events, host="127.0.0.1", port=0):
+        self.events = events
+        outer = self
+
+        class Handler(self.handler):
+            protocol_version = "HTTP/1.1"
+            server_ref = outer
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self.url = f"http://{host}:{self.port}/"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _reply(handler, status, body=b"", content_type="application/json", headers=None):
+    handler.send_response(status)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(body)))
+    for k, v in (headers or {}).items():
+        handler.send_header(k, v)
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def _push_line(line_url, text, delay):
+    """通知Lambdaの代わりに LINE push を送る (別スレッド)"""
+    def push():
+        if delay:
+            time.sleep(delay)
+        data = json.dumps({"to": "bench", "messages": [{"type": "text", "text": text}]}).encode()
+        req = urllib.request.Request(line_url + "v2/bot/message/push", data=data,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(req, timeout=5).read()
+        except Exception as e:
+            print(f"⚠️ Fake LINE push failed: {e}")
+    threading.Thread(target=push, daemon=True).start()
+
+
+class _LineHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        _read_body(self)
+        self.server_ref.events.record("line_push")
+        _reply(self, 200, b"{}")
+
+
+class FakeLine(_Server):
+    handler = _LineHandler
+
+
+class _LambdaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        _read_body(self)
+        server = self.server_ref
+        server.events.record("lambda_request")
+        _push_line(server.line_url, "remote capture", server.delay)
+        _reply(self, 200, b'{"ok": true}')
+
+
+class FakeLambda(_Server):
+    handler = _LambdaHandler
+
+    def __init__(self, events, line_url, delay=0.0, **kwargs):
+        self.line_url = line_url
+        # クラウド側で撮影・保存にかかる時間の見込み (秒)
+        self.delay = delay
+        super().__init__(events, **kwargs)
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    def do_PUT(self):
+        body = _read_body(self)
+        server = self.server_ref
+        _, _, path = self.path.partition("/")
+        bucket, _, key = path.split("?")[0].partition("/")
+        with server.lock:
+            server.objects[(bucket, key)] = body
+        server.events.record("s3_put")
+        if key.endswith(".jpg"):
+            # 本番は S3 イベント (suffix .jpg) → 通知Lambda → LINE
+            server.events.record("s3_jpg")
+            _push_line(server.line_url, f"new image: {key}", server.delay)
+        _reply(self, 200, headers={"ETag": f'"{len(body):x}"'})
+
+    def do_HEAD(self):
+        _reply(self, 200)
+
+    def do_GET(self):
+        _, _, path = self.path.partition("/")
+        bucket, _, key = path.split("?")[0].partition("/")
+        with self.server_ref.lock:
+            body = self.server_ref.objects.get((bucket, key))
+        if body is None:
+            _reply(self, 404, b"<Error><Code>NoSuchKey</Code></Error>", "application/xml")
+        else:
+            _reply(self, 200, body, "image/jpeg")
+
+
+class FakeS3(_Server):
+    handler = _S3Handler
+
+    def __init__(self, events, line_url, delay=0.0, **kwargs):
+        self.line_url = line_url
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.objects = {}
+        super().__init__(events, **kwargs)
@@ -0,0 +1,125 @@
+"""
+クリップ (タイムラプス動画) のサイズ・エンコード時間の比較
+
+JPEG を1枚ずつ送った場合の合計バイト数と、ClipBuilder で1本の動画にまとめた場合を比べる。
+入力は JPEG のディレクトリ、または疑似フレーム (グラデーションの上を動く四角形) を JPEG にしたもの。
+
+使い方:
+  python bench_clip.py --synthetic 60 --codec mp4v MJPG
+  python bench_clip.py --images ~/alert_frames --json clip.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from util.clip import ClipBuilder
+from util.config import config
+
+
+class _CollectingStorage:
+    """アップロードせずに submit_bytes() の中身を記録する"""
+
+    def __init__(self):
+        self.objects = []
+
+    def submit_bytes(self, data, filename, folder_name, content_type="image/jpeg", metadata=None, priority=False,
+                     purpose="capture"):
+        self.objects.append({"key": f"{folder_name}/{filename}", "bytes": len(data), "metadata": metadata})
+
+
+def moving_box_frames(count, width, height):
+    import numpy as np
+
+    base = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    base = np.dstack([base, base[:, ::-1], np.full((height, width), 96, dtype=np.uint8)])
+    box = max(height // 6, 1)
+    for i in range(count):
+        frame = base.copy()
+        x = (i * 16) % max(width - box, 1)
+        frame[height // 3:height // 3 + box, x:x + box] = 255
+        yield frame
+
+
+def load_jpegs(args):
+    import cv2
+
+    if args.images:
+        names = sorted(n for n in os.listdir(args.images) if n.lower().endswith((".jpg", ".jpeg")))
+        jpegs = []
+        for name in names:
+            with open(os.path.join(args.images, name), "rb") as f:
+                jpegs.append(f.read())
+        return jpegs
+
+    jpegs = []
+    for frame in moving_box_frames(args.synthetic, config.pipeline_width, config.pipeline_height):
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, config.jpeg_quality])
+        if ok:
+            jpegs.append(buf.tobytes())
+    return jpegs
+
+
+def bench(codec, jpegs, width, fps):
+    storage = _CollectingStorage()
+    builder = ClipBuilder(storage, interval=0, fps=fps, width=width, codec=codec, folder="bench/clips")
+    builder.start()
+    start = time.perf_counter()
+    now = time.time()
+    for i, data in enumerate(jpegs):
+        # キュー満杯で捨てないように空きを待つ
+        while not builder.add(now + i, data):
+            time.sleep(0.01)
+    builder.finish(timeout=600)
+    wall = time.perf_counter() - start
+
+    stats = builder.stats
+    return {
+        "codec": codec,
+        "frames": stats["frames"],
+        "raw_jpeg_bytes": stats["raw_bytes"],
+        "clip_bytes": stats["clip_bytes"],
+        "compression": stats["compression"],
+        "encode_seconds": stats["avg_encode"] * stats["clips"],
+        "wall_seconds": wall,
+        "s3_requests": {"jpeg": len(jpegs), "clip": len(storage.objects)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="クリップのサイズ・エンコード時間の比較")
+    parser.add_argument("--images", help="JPEG のディレクトリ (撮影順にファイル名でソート)")
+    parser.add_argument("--synthetic", type=int, default=60, help="疑似フレームの枚数 (--images がない時)")
+    parser.add_argument("--codec", nargs="+", default=[config.clip_codec], help="fourcc (mp4v / avc1 / MJPG など)")
+    parser.add_argument("--width", type=int, default=config.clip_width)
+    parser.add_argument("--fps", type=float, default=config.clip_fps)
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    jpegs = load_jpegs(args)
+    if not jpegs:
+        print("⚠️ No frames.")
+        return 1
+    print(f"🧪 frames={len(jpegs)} raw JPEG={sum(map(len, jpegs)) / 1024:.0f}KB width={args.width} fps={args.fps:g}")
+
+    results = []
+    for codec in args.codec:
+        result = bench(codec, jpegs, args.width, args.fps)
+        results.append(result)
+        if not result["clip_bytes"]:
+            print(f"⚠️ {codec}: no output (codec not available?)")
+            continue
+        print(f"📊 {codec}: {result['clip_bytes'] / 1024:.0f}KB (x{result['compression']:.1f} smaller) "
+              f"encode={result['encode_seconds']:.2f}s "
+              f"({result['encode_seconds'] / result['frames'] * 1000:.1f}ms/frame) "
+              f"S3 PUT {result['s3_requests']['jpeg']} -> {result['s3_requests']['clip']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"frames": len(jpegs), "width": args.width, "fps": args.fps, "results": results}, f, indent=2)
+        print(f"💾 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
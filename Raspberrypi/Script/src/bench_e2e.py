@@ -0,0 +1,238 @@
+"""
+ボタン押下 → LINE push までのエンドツーエンド遅延ベンチマーク
+
+AWS / LINE の代わりに手元のスタンドインを立てて ElderlyWatcherApp を起動し、
+疑似的なボタン押下と Shadow delta を流して段階ごとの p50/p95/p99 を測る。
+
+  MQTTブローカー (bench.broker)   Zigbee と IoT Shadow のトピック
+  S3互換ストア (bench.standins)   .jpg を受けたら LINE へ push (S3イベント→通知Lambda の代わり)
+  Lambda Function URL             受けたら LINE へ push (クラウド側撮影の代わり)
+  LINE push エンドポイント        受信時刻を記録
+
+使い方:
+  python bench_e2e.py --iterations 30 --output result.json
+  python bench_e2e.py --capture-mode local --lambda-delay 0.8
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from bench.broker import MiniBroker
+from bench.standins import EventLog, FakeLambda, FakeLine, FakeS3
+
+BUCKET = "bench-bucket"
+THING = "bench-thing"
+
+# 押下時刻からの段階
+STAGES = {
+    "button_to_state": "状態が ALERT に変わるまで",
+    "button_to_shadow_report": "Shadow へ alert が報告されるまで",
+    "button_to_capture": "撮影要求 (remote: Lambda到着 / local: S3に.jpg到着) まで",
+    "button_to_line_push": "LINE push が届くまで",
+    "delta_to_state": "Shadow delta (monitoring) から状態が戻るまで",
+}
+
+
+def percentile(ordered, p):
+    """最近傍順位法"""
+    if not ordered:
+        return None
+    rank = max(int(-(-p * len(ordered) // 100)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples):
+    result = {}
+    for stage, values in samples.items():
+        ordered = sorted(v * 1000 for v in values)
+        if not ordered:
+            result[stage] = {"count": 0}
+            continue
+        result[stage] = {
+            "count": len(ordered),
+            "p50_ms": percentile(ordered, 50),
+            "p95_ms": percentile(ordered, 95),
+            "p99_ms": percentile(ordered, 99),
+            "min_ms": ordered[0],
+            "max_ms": ordered[-1],
+            "mean_ms": sum(ordered) / len(ordered),
+        }
+    return result
+
+
+def configure_env(args, broker, s3, lambda_url):
+    """util.config は import 時に環境変数を読むので、アプリを import する前に設定する"""
+    os.environ.update({
+        "THING_NAME": THING,
+        "S3_BUCKET": BUCKET,
+        "IOT_ENDPOINT": f"127.0.0.1:{broker.port}",
+        "LAMBDA_URL": lambda_url,
+        "CAPTURE_MODE": args.capture_mode,
+        "PREALERT_SECONDS": "0",
+        "MOTION_ENABLED": "false",
+        "OUTBOX_ENABLED": "false",
+        "METRICS_PORT": "0",
+        # boto3 の S3 接続先をスタンドインへ
+        "AWS_ENDPOINT_URL_S3": s3.url.rstrip("/"),
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "ap-northeast-1",
+    })
+
+
+def build_app(args, broker):
+    from main import ElderlyWatcherApp
+    from bench.app_standins import LocalShadowClient, SyntheticCamera
+    from infra.local_mqtt import LocalZigbeeClient
+    from util.service import SurveillanceService
+    from util.state_manager import StateManager, Status
+    from util.storage import StorageManager
+
+    state = StateManager(initial_state=Status.MONITORING)
+    iot = LocalShadowClient(state.update, "127.0.0.1", broker.port)
+    storage = StorageManager()
+    camera = SyntheticCamera(fps=args.fps)
+    service = SurveillanceService(camera, storage, notify=iot.publish_event)
+    zigbee = LocalZigbeeClient(host="127.0.0.1", port=broker.port)
+    return ElderlyWatcherApp(state, iot, service, zigbee), state
+
+
+def run_iterations(args, app, state, events, broker):
+    import paho.mqtt.client as paho
+    from util.state_manager import Status
+
+    probe = paho.Client(client_id="bench-probe")
+    connected = threading.Event()
+    probe.on_connect = lambda *a: connected.set()
+
+    def on_message(client, userdata, msg):
+        try:
+            status = json.loads(msg.payload)["state"]["reported"]["status"]
+        except (ValueError, KeyError, TypeError):
+            return
+        events.record(f"shadow_{status}")
+
+    probe.on_message = on_message
+    probe.connect("127.0.0.1", broker.port, 30)
+    probe.loop_start()
+    connected.wait(5)
+    probe.subscribe(f"$aws/things/{THING}/shadow/update", 1)
+
+    capture_event = "lambda_request" if args.capture_mode == "remote" else "s3_jpg"
+    samples = {stage: [] for stage in STAGES}
+    failures = 0
+
+    # 接続・起動を待つ
+    app.iot.ready.wait(10)
+    time.sleep(args.settle)
+
+    for i in range(args.iterations):
+        pressed = time.perf_counter()
+        probe.publish("zigbee2mqtt/emergency_button", json.dumps({"action": "single"}), qos=0)
+
+        line = events.wait_for("line_push", pressed, args.timeout)
+        if line is None:
+            failures += 1
+            print(f"⚠️ [{i + 1}] No LINE push within {args.timeout}s")
+        else:
+            samples["button_to_line_push"].append(line - pressed)
+
+        changed = state.last_changed_at
+        if state.current == Status.ALERT and changed is not None and changed >= pressed:
+            samples["button_to_state"].append(changed - pressed)
+        shadow = events.wait_for("shadow_alert", pressed, 1.0)
+        if shadow is not None:
+            samples["button_to_shadow_report"].append(shadow - pressed)
+        captured = events.first_after(capture_event, pressed)
+        if captured is not None:
+            samples["button_to_capture"].append(captured - pressed)
+
+        # Shadow delta で MONITORING へ戻す
+        delta_sent = time.perf_counter()
+        probe.publish(
+            f"$aws/things/{THING}/shadow/update/delta",
+            json.dumps({"state": {"status": "monitoring"}}), qos=1
+        )
+        deadline = time.monotonic() + args.timeout
+        while state.current != Status.MONITORING and time.monotonic() < deadline:
+            time.sleep(0.001)
+        changed = state.last_changed_at
+        if state.current == Status.MONITORING and changed is not None and changed >= delta_sent:
+            samples["delta_to_state"].append(changed - delta_sent)
+        else:
+            failures += 1
+            print(f"⚠️ [{i + 1}] Delta not applied within {args.timeout}s")
+
+        ms = (line - pressed) * 1000 if line is not None else float("nan")
+        print(f"⏱️ [{i + 1}/{args.iterations}] button -> LINE {ms:.0f} ms")
+        time.sleep(args.gap)
+
+    probe.loop_stop()
+    probe.disconnect()
+    return samples, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ボタン押下→LINE push のE2E遅延ベンチマーク")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--capture-mode", choices=["remote", "local"], default="remote")
+    parser.add_argument("--lambda-delay", type=float, default=0.0, help="疑似Lambda/通知Lambdaの処理時間(秒)")
+    parser.add_argument("--fps", type=float, default=15.0, help="疑似カメラのフレームレート (localモード)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="1回あたりの待ち時間の上限(秒)")
+    parser.add_argument("--gap", type=float, default=0.5, help="押下の間隔(秒)")
+    parser.add_argument("--settle", type=float, default=1.0, help="起動後に待つ時間(秒)")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    events = EventLog()
+    broker = MiniBroker().start()
+    line = FakeLine(events).start()
+    lam = FakeLambda(events, line.url, delay=args.lambda_delay).start()
+    s3 = FakeS3(events, line.url, delay=args.lambda_delay).start()
+    configure_env(args, broker, s3, lam.url)
+
+    app, state = build_app(args, broker)
+    app_thread = threading.Thread(target=app.run, name="app", daemon=True)
+    app_thread.start()
+    try:
+        samples, failures = run_iterations(args, app, state, events, broker)
+    finally:
+        app.stop()
+        app_thread.join(timeout=15)
+        for server in (s3, lam, line):
+            server.stop()
+        broker.stop()
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "capture_mode": args.capture_mode,
+            "iterations": args.iterations,
+            "lambda_delay": args.lambda_delay,
+            "failures": failures,
+            "python": sys.version.split()[0],
+            "machine": platform.machine(),
+        },
+        "stages": summarize(samples),
+        "descriptions": STAGES,
+    }
+
+    print("=" * 50)
+    for stage, s in result["stages"].items():
+        if s["count"]:
+            print(f"📊 {stage}: p50={s['p50_ms']:.1f}ms p95={s['p95_ms']:.1f}ms "
+                  f"p99={s['p99_ms']:.1f}ms (n={s['count']})")
+        else:
+            print(f"📊 {stage}: no samples")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"💾 {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+人物検出の精度・推論時間ベンチマーク
+
+人が写っている画像 (--positives) と写っていない画像 (--negatives) に検出器をかけ、
+検出器 × 推論幅ごとに 推論時間 (p50/p95) と 適合率・再現率・誤検出率 を比べる。
+--negatives の既定は S3/Images/sample_images (無人の部屋の画像)。
+
+使い方:
+  python bench_person.py --positives ~/person_images --widths 320 400 640
+  python bench_person.py --backend hog dnn --model MobileNetSSD_deploy.caffemodel \\
+      --model-config MobileNetSSD_deploy.prototxt --json person.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from util.config import config
+from util.person import PersonDetector
+
+SAMPLE_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "S3", "Images", "sample_images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def list_images(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif os.path.exists(path):
+            files.append(path)
+    return files
+
+
+def load_images(paths, label):
+    import cv2
+
+    images = []
+    for path in list_images(paths):
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f"⚠️ Unreadable: {path}")
+            continue
+        images.append((os.path.basename(path), frame, label))
+    return images
+
+
+def percentile(ordered, p):
+    """最近傍順位法"""
+    if not ordered:
+        return None
+    rank = max(int(-(-p * len(ordered) // 100)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def ratio(a, b):
+    return a / b if b else None
+
+
+def bench(detector, images, repeat):
+    detector.load()
+    if images:
+        # 初回はメモリ確保などで遅いので計測に含めない
+        detector.detect(images[0][1])
+
+    inference = []
+    total = []
+    counts = {"tp": 0, "fp": 0, "tn": 0, "fn": 0}
+    per_image = []
+    for name, frame, label in images:
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = detector.detect(frame)
+            total.append(time.perf_counter() - start)
+            inference.append(result["inference"])
+        predicted = result["person"]
+        counts[("t" if predicted == label else "f") + ("p" if predicted else "n")] += 1
+        per_image.append({
+            "image": name, "label": label, "person": predicted,
+            "count": result["count"], "confidence": result["confidence"],
+        })
+
+    inference.sort()
+    total.sort()
+    tp, fp, tn, fn = counts["tp"], counts["fp"], counts["tn"], counts["fn"]
+    return {
+        "inference_p50_ms": percentile(inference, 50) * 1000 if inference else None,
+        "inference_p95_ms": percentile(inference, 95) * 1000 if inference else None,
+        # 縮小を含めた1フレームあたりの時間
+        "total_p50_ms": percentile(total, 50) * 1000 if total else None,
+        **counts,
+        "precision": ratio(tp, tp + fp),
+        "recall": ratio(tp, tp + fn),
+        "false_positive_rate": ratio(fp, fp + tn),
+        "accuracy": ratio(tp + tn, len(images)),
+        "images": per_image,
+    }
+
+
+def _fmt(value, spec=".2f"):
+    return "n/a" if value is None else format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="人物検出の精度・推論時間ベンチマーク")
+    parser.add_argument("--positives", nargs="*", default=[], help="人が写っている画像 (ファイル or ディレクトリ)")
+    parser.add_argument("--negatives", nargs="*", default=[SAMPLE_IMAGES], help="人が写っていない画像")
+    parser.add_argument("--backend", nargs="+", choices=["hog", "dnn"], default=["hog"])
+    parser.add_argument("--widths", nargs="+", type=int, default=[320, config.person_width, 640])
+    parser.add_argument("--confidence", type=float, default=config.person_confidence)
+    parser.add_argument("--model", default=config.person_model, help="dnn: 重みファイル")
+    parser.add_argument("--model-config", default=config.person_model_config, help="dnn: 構成ファイル")
+    parser.add_argument("--repeat", type=int, default=5, help="1枚あたりの推論回数")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    images = load_images(args.positives, True) + load_images(args.negatives, False)
+    positives = sum(1 for _, _, label in images if label)
+    print(f"🧪 images={len(images)} (person={positives}, empty={len(images) - positives}) "
+          f"repeat={args.repeat} cpu={os.cpu_count()}")
+    if not images:
+        print("⚠️ No images.")
+        return 1
+    if not positives:
+        print("   (no --positives: recall/precision are not measured, only false positives)")
+
+    results = []
+    for backend in args.backend:
+        for width in sorted(set(args.widths)):
+            detector = PersonDetector(
+                backend=backend, width=width, confidence=args.confidence,
+                model=args.model, model_config=args.model_config
+            )
+            try:
+                result = bench(detector, images, args.repeat)
+            except Exception as e:
+                print(f"⚠️ {backend}@{width}: {type(e).__name__}: {e}")
+                continue
+            result.update(backend=backend, width=width)
+            results.append(result)
+            print(f"📊 {backend}@{width}px: inference p50={_fmt(result['inference_p50_ms'], '.1f')}ms "
+                  f"p95={_fmt(result['inference_p95_ms'], '.1f')}ms | precision={_fmt(result['precision'])} "
+                  f"recall={_fmt(result['recall'])} fp_rate={_fmt(result['false_positive_rate'])}")
+
+    if args.json:
+        output = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "confidence": args.confidence,
+                "repeat": args.repeat,
+                "machine": platform.machine(),
+            },
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+        print(f"💾 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
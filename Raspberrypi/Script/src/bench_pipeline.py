@@ -0,0 +1,107 @@
+"""
+撮影パイプラインのスループット比較
+
+  1プロセス (取得 → エンコード → 変化検知を順番に) と
+  ShmPipeline (共有メモリ + 別プロセス) の処理fpsを比べる。
+
+使い方:
+  python bench_pipeline.py --seconds 20            # 実カメラ (CAMERA_INDEX)
+  python bench_pipeline.py --synthetic --json out.json
+"""
+import argparse
+import json
+import os
+import time
+from util.config import config
+from util.encoder import RenditionEncoder
+from util.motion import ChangeDetector
+from util.shm_pipeline import ShmPipeline, synthetic_frames
+
+
+def bench_single(seconds, shape, synthetic):
+    import cv2
+
+    h, w = shape[:2]
+    source = synthetic_frames(shape) if synthetic else None
+    cap = None if synthetic else cv2.VideoCapture(config.camera_index)
+    encoder = RenditionEncoder()
+    detector = ChangeDetector()
+    reference = None
+    frames = 0
+
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        if source is not None:
+            frame = next(source)
+        else:
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            if frame.shape != shape:
+                frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+        encoder.encode(frame)
+        small = detector.prepare(frame)
+        detector.score(small, reference)
+        reference = small
+        frames += 1
+    elapsed = time.monotonic() - start
+
+    if cap is not None:
+        cap.release()
+    return {"frames": frames, "fps": frames / elapsed}
+
+
+def bench_shm(seconds, shape, synthetic, encoders):
+    pipeline = ShmPipeline(shape=shape, encoders=encoders, synthetic=synthetic)
+    pipeline.start()
+    try:
+        # プロセス起動 (spawn) の時間は計測に含めない
+        time.sleep(2)
+        before = pipeline.stats
+        start = time.monotonic()
+        time.sleep(seconds)
+        after = pipeline.stats
+        elapsed = time.monotonic() - start
+    finally:
+        pipeline.stop()
+
+    encoded = after["encoded"] - before["encoded"]
+    return {
+        "frames": encoded,
+        "fps": encoded / elapsed,
+        "capture_fps": (after["captured"] - before["captured"]) / elapsed,
+        "dropped": after["dropped"] - before["dropped"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="撮影パイプラインのスループット比較")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--synthetic", action="store_true", help="カメラの代わりに疑似フレームを使う")
+    parser.add_argument("--encoders", type=int, default=config.pipeline_encoders)
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    shape = (config.pipeline_height, config.pipeline_width, 3)
+    print(f"🧪 {shape[1]}x{shape[0]} / {args.seconds:.0f}s / cpu={os.cpu_count()}")
+
+    single = bench_single(args.seconds, shape, args.synthetic)
+    print(f"   single-process: {single['fps']:.1f} fps")
+    shm = bench_shm(args.seconds, shape, args.synthetic, args.encoders)
+    print(f"   shm x{args.encoders}:      {shm['fps']:.1f} fps "
+          f"(capture {shm['capture_fps']:.1f} fps, dropped {shm['dropped']})")
+    if single["fps"]:
+        print(f"   speedup: x{shm['fps'] / single['fps']:.2f}")
+
+    if args.json:
+        result = {
+            "width": shape[1], "height": shape[0], "seconds": args.seconds,
+            "synthetic": args.synthetic, "encoders": args.encoders,
+            "single": single, "shm": shm,
+        }
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,77 @@
 import paho.mqtt.client as mqtt
 import json
 import threading
+import time
+from util import trace
 
 class LocalZigbeeClient:
-    def __init__(self, host="localhost", port=1883):
+    def __init__(self, host="localhost", port=1883, on_press=None):
         self.client = mqtt.Client()
         self.host = host
         self.port = port
         self._pressed = threading.Event()
+        self._connected = threading.Event()
+        # 押下時に受信スレッドから直接呼ばれる (引数: 受信時刻 perf_counter)
+        # 未設定の場合は is_pressed() でのポーリング
+        self.on_press = on_press
         
         # 設定
         self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
 
-    def connect(self):
+    def connect(self, timeout=3.0):
+        """
+        接続を始める。つながるまで (切れた後も) paho の受信スレッドが自動で接続し直すので、
+        停電復帰直後にブローカーがまだ起動していなくても、起動した時点でボタンが使えるようになる。
+        最初の接続は timeout 秒まで待つ。Returns: その間につながったら True
+        """
         try:
-            self.client.connect(self.host, self.port, 60)
+            self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+            self.client.connect_async(self.host, self.port, 60)
             self.client.loop_start()
-            print("🔌 Zigbee MQTT Connected")
         except Exception as e:
             print(f"⚠️ Zigbee MQTT Failed: {e}")
+            return False
+        if not self._connected.wait(timeout):
+            print("⚠️ Zigbee MQTT not reachable yet. Retrying in background...")
+            return False
+        return True
 
     def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"⚠️ Zigbee MQTT Connect refused (rc={rc})")
+            return
+        # 再接続の度に購読し直す
         client.subscribe("zigbee2mqtt/emergency_button")
+        self._connected.set()
+        print("🔌 Zigbee MQTT Connected")
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._connected.clear()
+        if rc != 0:
+            print(f"⚠️ Zigbee MQTT Disconnected (rc={rc}). Reconnecting...")
 
     def _on_message(self, client, userdata, msg):
+        received_at = time.perf_counter()
+        trace.record("zigbee", msg.payload.decode(errors="replace"))
         try:
             payload = json.loads(msg.payload.decode())
             action = payload.get("action")
-            if action == "single":
-                self._pressed.set()
         except Exception:
-            pass
+            return
+
+        if action != "single":
+            return
+
+        if self.on_press is None:
+            self._pressed.set()
+            return
+
+        try:
+            self.on_press(received_at)
+        except Exception as e:
+            print(f"⚠️ Button Handler Error: {e}")
 
     def is_pressed(self):
         if self._pressed.is_set():
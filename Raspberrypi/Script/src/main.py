@@ -1,61 +1,153 @@
-import time
+from util.startup import StartupTimeline
+import asyncio
+import threading
+from collections import deque
+from util.config import config
+from util import profiler, trace
+from util.lazy import preload
+from util.metrics import start_server as start_metrics_server
 from util.mqtt_client import IotClient
 from util.state_manager import StateManager, Status
 from util.storage import StorageManager
 from util.camera import CameraManager
+from util.multi_camera import MultiCameraManager
 from util.service import SurveillanceService
+from util.outbox import Outbox, OutboxReplayer
 from infra.local_mqtt import LocalZigbeeClient
 
 
 class ElderlyWatcherApp:
-    def __init__(self, state_manager, iot_client, surveillance_service, zigbee_client):
+    def __init__(self, state_manager, iot_client, surveillance_service, zigbee_client, replayer=None):
         self.state = state_manager
         self.iot = iot_client
         self.surveillance_service = surveillance_service
         self.zigbee = zigbee_client
+        self.replayer = replayer
+        self.timeline = StartupTimeline()
+        self._shutdown = threading.Event()
+        self.button_latencies = deque(maxlen=100)  # ボタン押下→状態遷移 (ms)
 
         self.state.add_listener(self.iot.report_status)
         self.state.add_listener(self.surveillance_service._handle_state_change)
+        self.zigbee.on_press = self._on_button_pressed
+
+    def _on_button_pressed(self, received_at):
+        """Zigbee受信スレッドから直接呼ばれる"""
+        if self.state.current != Status.ALERT:
+            self.surveillance_service.mark_alert_requested(received_at)
+        self.state.update(Status.ALERT)
+        print("=" * 50)
+        print("🔘 Emergency button pressed!")
+        print("=" * 50)
+
+        changed_at = self.state.last_changed_at
+        if changed_at is not None and changed_at >= received_at:
+            latency_ms = (changed_at - received_at) * 1000
+            self.button_latencies.append(latency_ms)
+            avg = sum(self.button_latencies) / len(self.button_latencies)
+            print(f"⏱️ Button -> State: {latency_ms:.2f} ms (avg {avg:.2f} ms)")
+
+    def _connect_iot(self):
+        """Returns: 接続できたら True (終了で中断した場合は False。起動タイムラインに失敗として残る)"""
+        connected = self.iot.connect_with_retry(self._shutdown)
+        if connected and self.replayer:
+            self.replayer.kick()
+        return connected
+
+    def _report_startup(self, threads):
+        for t in threads:
+            t.join()
+        self.timeline.report()
 
     def run(self):
-        self.iot.connect()
+        self.timeline.mark("app start")
+        if config.trace_path:
+            trace.start(config.trace_path)
+        profiler.install_signal_handlers()
+        if config.profile_enabled:
+            profiler.start()
+        # ボタンを最優先で受け付けられるようにする
         self.zigbee.connect()
-        
-        time.sleep(1)
+        self.timeline.mark("zigbee armed")
+        # 撮影プロセスは起動に時間がかかるので、ALERTを待たずに一時停止で立ち上げておく
+        self.surveillance_service.start_pipeline()
+
+        # 残りはバックグラウンドで並行して準備する
+        service = self.surveillance_service
+        threads = [
+            self.timeline.run_in_background("aws iot connected", self._connect_iot),
+            self.timeline.run_in_background("s3 client ready", service.storage.warm_up),
+            self.timeline.run_in_background("lambda session ready", service.trigger.warm_up),
+            self.timeline.run_in_background("opencv loaded", preload, "cv2", "numpy"),
+            self.timeline.run_in_background("metrics ready", start_metrics_server),
+        ]
+        threading.Thread(target=self._report_startup, args=(threads,), name="startup-report", daemon=True).start()
+
+        # 接続完了までは IotClient 側で保留され、完了後に送られる
         self.iot.report_status(self.state.current)
+        if self.replayer:
+            self.replayer.start()
+        if self.state.current == Status.MONITORING:
+            service.start_prealert()
 
         print("=" * 50)
         print("🚀 System Started. Waiting for events...")
         print("=" * 50)
         
         try:
-            while True:
-                if self.zigbee.is_pressed(): 
-                    print("=" * 50)
-                    print("🔘 Emergency button pressed!")
-                    print("=" * 50)
-                    self.state.update(Status.ALERT)
-                time.sleep(1)
-
+            # ボタン押下はコールバックで処理されるので、メインスレッドは終了を待つだけ
+            while not self._shutdown.wait(60):
+                pass
         except KeyboardInterrupt:
-            print("=" * 50)
-            print("🛑 Shutting down...")
-            self.surveillance_service.stop_monitoring()
-            self.zigbee.disconnect()
-            print("👋 Goodbye.")
-            print("=" * 50)
+            pass
+        self._cleanup()
+
+    def stop(self):
+        """run() を終わらせる (別スレッドから呼ぶ。ベンチマークなど)"""
+        self._shutdown.set()
+
+    def _cleanup(self):
+        print("=" * 50)
+        print("🛑 Shutting down...")
+        self.surveillance_service.shutdown()
+        if self.replayer:
+            self.replayer.stop()
+        for name, stats in self.state.listener_stats.items():
+            print(f"📊 Listener {name}: calls={stats['calls']} "
+                  f"max_delay={stats['max_delay'] * 1000:.1f}ms max_run={stats['max_duration'] * 1000:.0f}ms")
+        self.state.close()
+        self.zigbee.disconnect()
+        trace.stop()
+        profiler.stop()
+        print("👋 Goodbye.")
+        print("=" * 50)
 
 if __name__ == "__main__":
     print("="*50)
     print("🏠 ElderlyWatcher App Initializing...")
     print("="*50)
     
+    outbox = Outbox() if config.outbox_enabled else None
     state_manager = StateManager(initial_state=Status.MONITORING)
-    iot_client = IotClient(on_delta_callback=state_manager.update)
-    camera_manager = CameraManager()
-    storage_manager = StorageManager()
-    surveillance_service = SurveillanceService(camera_manager, storage_manager)
+    iot_client = IotClient(on_delta_callback=state_manager.update, outbox=outbox)
+    storage_manager = StorageManager(outbox=outbox)
+    cameras = MultiCameraManager(storage_manager) if config.cameras else None
+    camera_manager = cameras.primary if cameras else CameraManager()
+    surveillance_service = SurveillanceService(
+        camera_manager, storage_manager, cameras, notify=iot_client.publish_event
+    )
     zigbee = LocalZigbeeClient()
+    replayer = None
+    if outbox is not None:
+        replayer = OutboxReplayer(outbox, {"s3": storage_manager.replay, "shadow": iot_client.replay})
     
-    app = ElderlyWatcherApp(state_manager, iot_client, surveillance_service, zigbee)
-    app.run()
\ No newline at end of file
+    if config.runtime == "asyncio":
+        from async_app import AsyncElderlyWatcherApp
+        app = AsyncElderlyWatcherApp(state_manager, iot_client, surveillance_service, zigbee, replayer)
+        try:
+            asyncio.run(app.run())
+        except KeyboardInterrupt:
+            pass
+    else:
+        app = ElderlyWatcherApp(state_manager, iot_client, surveillance_service, zigbee, replayer)
+        app.run()
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+記録したトレース (TRACE_PATH) をオフラインで再生する
+
+Zigbee のペイロードは LocalZigbeeClient._on_message、Shadow delta は IotClient._on_message に
+記録時と同じ間隔 (--speed 倍速) で流し込み、StateManager / SurveillanceService を実際に動かす。
+撮影間隔も同じ仮想時間の時計で測る (--speed 0 でも予定されていた撮影を飛ばさない)。
+カメラ・アップロードはデバイスやAWSに触れず、記録された結果 (成否・所要時間・変化検知の判定) を
+用途 (撮影 / 変化検知 / 代表以外のレンディション など) ごとに順に返す。
+最後に、記録時と再生時の状態遷移の列が一致したかを表示する。
+
+使い方:
+  python trace_replay.py ~/.elderlycam/trace.jsonl.gz --speed 60
+  python trace_replay.py trace.jsonl.gz --speed 0 --quiet --output replay.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入力トレースの再生")
+    parser.add_argument("trace", help="TRACE_PATH で記録したファイル")
+    parser.add_argument("--speed", type=float, default=60.0, help="再生速度 (倍)。0 で待たずに流し込む")
+    parser.add_argument("--dispatch", choices=["sync", "async"], help="状態遷移の通知方法 (既定: LISTENER_DISPATCH)")
+    parser.add_argument("--quiet", action="store_true", help="アプリのログを出さない")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    # util.config は import 時に環境変数を読むので先に設定する (再生中は記録しない・外部へ出ない)
+    os.environ.update({
+        "TRACE_PATH": "",
+        "CAPTURE_MODE": "local",
+        # 緊急前映像の録画は実時間で回るので再生しない。変化検知は記録された判定を使う
+        "PREALERT_SECONDS": "0",
+        "MOTION_ENABLED": "false",
+        "QUALITY_ENABLED": "false",
+        "PERSON_DETECTOR": "",
+        "CLIP_MODE": "off",
+        "OUTBOX_ENABLED": "false",
+        "METRICS_PORT": "0",
+    })
+    if args.dispatch:
+        os.environ["LISTENER_DISPATCH"] = args.dispatch
+
+    from main import ElderlyWatcherApp
+    from bench.app_standins import NullConnection, ReplayService, ReplayStorage
+    from infra.local_mqtt import LocalZigbeeClient
+    from util.config import config
+    from util.mqtt_client import IotClient
+    from util.state_manager import StateManager, Status
+    from util.trace import TraceReplayer, VirtualClock, read_trace
+
+    header, records = read_trace(args.trace)
+    cameras = [r[2] for r in records if r[1] == "camera"]
+    uploads = [r[2] for r in records if r[1] == "upload"]
+    recorded_states = [r[2] for r in records if r[1] == "state"]
+    print(f"🧾 {len(records)} records ({records[-1][0] if records else 0:.0f}s) "
+          f"recorded_at={header.get('started_at')}")
+
+    clock = VirtualClock(args.speed)
+    state = StateManager(initial_state=Status.MONITORING)
+    iot = IotClient(on_delta_callback=state.update)
+    iot.connection = NullConnection()
+    iot.ready.set()
+    storage = ReplayStorage(uploads, clock)
+    service = ReplayService(cameras, storage, notify=iot.publish_event, clock=clock)
+    zigbee = LocalZigbeeClient()
+    app = ElderlyWatcherApp(state, iot, service, zigbee)
+
+    replayed_states = []
+    state.add_listener(replayed_states.append)
+    delta_topic = f"$aws/things/{config.thing_name}/shadow/update/delta"
+    handlers = {
+        "zigbee": lambda data: zigbee._on_message(None, None, SimpleNamespace(payload=data.encode())),
+        "delta": lambda data: iot._on_message(delta_topic, data.encode()),
+    }
+    replayer = TraceReplayer(records, handlers, clock)
+
+    log = io.StringIO() if args.quiet else sys.stdout
+    with contextlib.redirect_stdout(log):
+        replayer.run()
+        # 非同期リスナーと送信待ちを流し切る
+        deadline = time.monotonic() + 10
+        while any(s["pending"] for s in state.listener_stats.values()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        service.shutdown()
+        listener_stats = state.listener_stats
+        state.close()
+
+    mismatch = next(
+        (i for i, (a, b) in enumerate(zip(recorded_states, replayed_states)) if a != b),
+        None if len(recorded_states) == len(replayed_states) else min(len(recorded_states), len(replayed_states))
+    )
+    result = {
+        "trace": args.trace,
+        "speed": args.speed,
+        "dispatch": state.dispatch,
+        "replay": replayer.stats,
+        "transitions": {
+            "recorded": len(recorded_states),
+            "replayed": len(replayed_states),
+            "first_mismatch": mismatch,
+        },
+        "uploads": storage.stats,
+        "listeners": listener_stats,
+    }
+
+    stats = result["replay"]
+    print(f"⏩ Replayed {stats['replayed']} events: {stats['trace_seconds']:.0f}s of trace "
+          f"in {stats['wall_seconds']:.2f}s (x{stats['speedup']:.0f})")
+    for kind, s in stats["handlers"].items():
+        print(f"📊 {kind}: p50={s['p50_ms']:.2f}ms p95={s['p95_ms']:.2f}ms max={s['max_ms']:.2f}ms n={s['count']}")
+    if mismatch is None:
+        print(f"✅ State transitions match ({len(replayed_states)})")
+    else:
+        print(f"❌ State transitions differ at #{mismatch} "
+              f"(recorded {len(recorded_states)}, replayed {len(replayed_states)})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return 0 if mismatch is None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+asyncio ランタイム用のアダプタ群
+
+既存コンポーネント (IotClient / LocalZigbeeClient / CameraManager / StorageManager) は
+スレッド前提のブロッキングAPIなので、ここでイベントループから扱える形に包む。
+- ブロッキング呼び出しは asyncio.to_thread でワーカースレッドへ逃がす
+- 他スレッドからのコールバックは call_soon_threadsafe でループ内のキューへ渡す
+"""
+import asyncio
+
+
+def _put_latest(queue, item):
+    """満杯なら一番古い要素を捨てて入れる (ループスレッド内で呼ぶこと)"""
+    if queue.full():
+        try:
+            queue.get_nowait()
+            queue.task_done()
+        except asyncio.QueueEmpty:
+            pass
+    queue.put_nowait(item)
+
+
+class AsyncIotClient:
+    def __init__(self, iot_client):
+        self.iot = iot_client
+
+    async def connect(self, stop_event):
+        """
+        接続できるまで繰り返す。スレッドで待つので、終了時は stop_event (threading.Event) をセットして止める。
+        Returns: 接続できたら True
+        """
+        return await asyncio.to_thread(self.iot.connect_with_retry, stop_event)
+
+    async def report_status(self, status):
+        # IotClient側でキューに積むだけなのでブロックしない
+        self.iot.report_status(status)
+
+
+class AsyncZigbeeClient:
+    """ボタン押下を asyncio.Queue で受け取る"""
+
+    def __init__(self, zigbee_client, loop, maxsize=8):
+        self.zigbee = zigbee_client
+        self.loop = loop
+        self.presses = asyncio.Queue(maxsize=maxsize)
+        self.zigbee.on_press = self._on_press
+
+    def _on_press(self, received_at):
+        # paho の受信スレッドから呼ばれる
+        self.loop.call_soon_threadsafe(_put_latest, self.presses, received_at)
+
+    async def connect(self):
+        await asyncio.to_thread(self.zigbee.connect)
+
+    async def disconnect(self):
+        await asyncio.to_thread(self.zigbee.disconnect)
+
+
+class AsyncStateListener:
+    """StateManager の変更通知を asyncio.Queue で受け取る"""
+
+    def __init__(self, state_manager, loop, maxsize=8):
+        self.loop = loop
+        self.changes = asyncio.Queue(maxsize=maxsize)
+        state_manager.add_listener(self._on_change)
+
+    def _on_change(self, status):
+        self.loop.call_soon_threadsafe(_put_latest, self.changes, status)
+
+
+class AsyncCamera:
+    def __init__(self, camera_manager):
+        self.camera = camera_manager
+
+    async def start(self):
+        await asyncio.to_thread(self.camera.start)
+
+    async def stop(self):
+        await asyncio.to_thread(self.camera.stop)
+
+    async def latest_frame(self):
+        return await asyncio.to_thread(self.camera.latest_frame)
+
+    async def encode(self, frame, quality=None):
+        return await asyncio.to_thread(self.camera.encode, frame, quality)
+
+
+class AsyncUploader:
+    """同時実行数を制限したアップロード"""
+
+    def __init__(self, storage_manager, concurrency):
+        self.storage = storage_manager
+        self._sem = asyncio.Semaphore(concurrency)
+
+    async def upload_bytes(self, data, filename, folder_name, content_type="image/jpeg", metadata=None,
+                           purpose="capture"):
+        async with self._sem:
+            return await asyncio.to_thread(
+                self.storage.upload_bytes, memoryview(data), filename, folder_name,
+                content_type=content_type, metadata=metadata, purpose=purpose
+            )
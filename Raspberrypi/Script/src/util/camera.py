@@ -1,31 +1,344 @@
-import cv2
 import time
 import os
+import threading
+from util.config import config
+from util.encoder import RenditionEncoder
+from util.lazy import lazy_import
+from util.metrics import registry
+
+cv2 = lazy_import("cv2")
+
+CAPTURE_SECONDS = registry.histogram(
+    "elderlycam_camera_capture_seconds", "1枚撮影する時間 (フレーム取得〜エンコード/書き出し)", ["method"]
+)
+CAMERA_HEALTH = registry.gauge("elderlycam_camera_health", "カメラのヘルスカウンタ", ["camera", "counter"])
+
+
+class _DeviceReader:
+    """
+    デバイス1回分のオープン〜連続読み取りを行うスレッド
+
+    cv2 の open()/read() は途中で止められないため、固まったら監視側がこのリーダーごと見捨てて
+    新しいリーダーで開き直す。見捨てられたスレッドは read() が戻った時点でデバイスを解放して終わる。
+    """
+
+    def __init__(self, device_index, on_frame, on_error):
+        self.device_index = device_index
+        self.on_frame = on_frame
+        self.on_error = on_error
+
+        self.wake = threading.Event()  # 状態が変わったら立つ (監視側が待つ)
+        self.dead = threading.Event()
+        self.open_failed = False
+        self.frames = 0
+        self._abandoned = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="camera-reader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def abandon(self):
+        self._abandoned.set()
+        self.wake.set()
+
+    def join(self, timeout):
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self):
+        cap = cv2.VideoCapture(self.device_index)
+        try:
+            if not cap.isOpened():
+                self.open_failed = True
+                return
+
+            # 接続直後のフレームは露出が安定していないので捨てる
+            for _ in range(config.camera_warmup_frames):
+                if self._abandoned.is_set():
+                    return
+                cap.read()
+
+            failures = 0
+            while not self._abandoned.is_set():
+                ret, frame = cap.read()
+                if self._abandoned.is_set():
+                    return
+                if not ret:
+                    failures += 1
+                    self.on_error()
+                    if failures >= config.camera_reopen_after:
+                        return
+                    continue
+
+                failures = 0
+                self.frames += 1
+                self.on_frame(frame)
+                self.wake.set()
+        finally:
+            cap.release()
+            self.dead.set()
+            self.wake.set()
+
 
 class CameraManager:
-    def __init__(self):
+    """
+    カメラ操作 (OpenCVラッパー)
+
+    start() でバックグラウンドの取得スレッドがデバイスを開きっぱなしにし、
+    常に最新フレームを保持する。capture() はそのフレームを使うため、
+    撮影ごとのオープン/露出調整のコストがかからない。
+
+    読み取りが camera_read_timeout 秒返ってこない・失敗が続く場合はデバイスを開き直す
+    (待機は camera_reopen_delay から倍々、上限 camera_reopen_max_delay)。
+    フレームが取れない時は偽の画像を作らず None を返す。
+    """
+
+    def __init__(self, device_index=None, camera_id=None):
         self.tmp_dir = "/tmp"
+        self.device_index = config.camera_index if device_index is None else device_index
+        self.camera_id = config.storage_folder if camera_id is None else camera_id
+        self.encoder = RenditionEncoder()
 
-    def capture(self):
-        timestamp = int(time.time())
-        filename = f"{timestamp}.jpg"
-        filepath = os.path.join(self.tmp_dir, filename)
-
-        cap = cv2.VideoCapture(0)
-        if cap.isOpened():
-            ret, frame = cap.read()
-            if ret:
-                cv2.imwrite(filepath, frame)
+        self._reader = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._frame_lock = threading.Lock()
+        self._frame_cond = threading.Condition(self._frame_lock)
+        self._latest_frame = None
+        self._latest_ts = 0.0
+
+        # ヘルスカウンタ
+        self._health_lock = threading.Lock()
+        self._health = {
+            "frames": 0, "read_errors": 0, "timeouts": 0, "reopens": 0, "open_failures": 0, "no_frame": 0
+        }
+        self._stuck_readers = []
+        for key in self._health:
+            CAMERA_HEALTH.labels(self.camera_id, key).set_function(lambda key=key: self._health[key])
+
+    # ---- セッション制御 (ALERT/MONITORING遷移から呼ばれる) ----
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._grab_loop, name="camera-grabber", daemon=True)
+        self._thread.start()
+        print(f"🎥 Camera session started (device={self.device_index})")
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self._stop_event.set()
+        reader = self._reader
+        if reader is not None:
+            reader.wake.set()
+        self._thread.join(timeout=2)
+        self._thread = None
+        with self._frame_lock:
+            self._latest_frame = None
+            self._latest_ts = 0.0
+        print("🎥 Camera session stopped.")
+
+    def latest_frame(self, timeout=None):
+        """
+        最新フレームと取得時刻を返す。
+        camera_frame_timeout 秒より古いフレームは使わず、新しいフレームを timeout 秒まで待つ。
+        セッション未起動・タイムアウト時は (None, 0.0)
+        """
+        if not self.running:
+            return None, 0.0
+
+        if timeout is None:
+            timeout = config.camera_frame_timeout
+        with CAPTURE_SECONDS.labels("latest_frame").time(), self._frame_cond:
+            if not self._frame_cond.wait_for(self._is_fresh, timeout):
+                self._count("no_frame")
+                return None, 0.0
+            return self._latest_frame, self._latest_ts
+
+    def peek_frame(self):
+        """待たずに今ある最新フレームを返す (ヘルスカウンタには数えない)。無ければ (None, 0.0)"""
+        with self._frame_lock:
+            if self._is_fresh():
+                return self._latest_frame, self._latest_ts
+        return None, 0.0
+
+    def burst(self, count, window):
+        """
+        最新フレームから取得時刻の違うフレームを count 枚まで、最大 window 秒かけて集める。
+        Returns: [(frame, ts), ...]。フレームが取れなければ空リスト
+        """
+        frame, ts = self.latest_frame()
+        if frame is None:
+            return []
+
+        frames = [(frame, ts)]
+        deadline = time.monotonic() + window
+        with self._frame_cond:
+            while len(frames) < count:
+                remaining = deadline - time.monotonic()
+                last_ts = frames[-1][1]
+                if remaining <= 0 or not self._frame_cond.wait_for(
+                        lambda: self._latest_frame is not None and self._latest_ts != last_ts, remaining):
+                    break
+                frames.append((self._latest_frame, self._latest_ts))
+        return frames
+
+    def _is_fresh(self):
+        return self._latest_frame is not None and time.time() - self._latest_ts <= config.camera_frame_timeout
+
+    @property
+    def health(self):
+        """カメラの状態 (フレーム数・失敗・タイムアウト・再オープン回数など)"""
+        with self._health_lock:
+            health = dict(self._health)
+            self._stuck_readers = [r for r in self._stuck_readers if not r.dead.is_set()]
+            health["stuck_readers"] = len(self._stuck_readers)
+        with self._frame_lock:
+            health["frame_age"] = time.time() - self._latest_ts if self._latest_ts else None
+        health["running"] = self.running
+        return health
+
+    def _count(self, key):
+        with self._health_lock:
+            self._health[key] += 1
+
+    # ---- 取得スレッド ----
+
+    def _on_frame(self, frame):
+        with self._frame_cond:
+            self._latest_frame = frame
+            self._latest_ts = time.time()
+            self._frame_cond.notify_all()
+        self._count("frames")
+
+    def _on_read_error(self):
+        self._count("read_errors")
+
+    def _grab_loop(self):
+        """リーダーを起動して見張り、止まったら待機時間を延ばしながら開き直す"""
+        delay = config.camera_reopen_delay
+        first = True
+        while not self._stop_event.is_set():
+            if not first:
+                self._count("reopens")
+            first = False
+
+            reader = _DeviceReader(self.device_index, self._on_frame, self._on_read_error)
+            self._reader = reader
+            reader.start()
+            reason, got_frame = self._watch(reader)
+            reader.abandon()
+            self._reader = None
+
+            if not reader.join(timeout=1):
+                # read() が戻らない。スレッドは放置し、デバイスは戻った時点で解放される
+                with self._health_lock:
+                    self._stuck_readers.append(reader)
+            if reason is None:
+                break
+
+            if got_frame:
+                delay = config.camera_reopen_delay
+            print(f"⚠️ Camera {reason}. Reopening in {delay:.0f}s")
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, config.camera_reopen_max_delay)
+
+    def _watch(self, reader):
+        """
+        リーダーが止まる・固まるまで見張る。
+        Returns: (理由 or None(停止要求), 1枚でもフレームが取れたか)
+        """
+        deadline = time.monotonic() + config.camera_open_timeout
+        seen = 0
+        while True:
+            reader.wake.wait(max(deadline - time.monotonic(), 0.0))
+            reader.wake.clear()
+            if self._stop_event.is_set():
+                return None, seen > 0
+
+            if reader.dead.is_set():
+                if reader.open_failed:
+                    self._count("open_failures")
+                    return "open failed", seen > 0
+                return "lost", seen > 0
+
+            if reader.frames > seen:
+                seen = reader.frames
+                deadline = time.monotonic() + config.camera_read_timeout
+                continue
+
+            if time.monotonic() >= deadline:
+                self._count("timeouts")
+                return "read timed out", seen > 0
+
+    # ---- 撮影 ----
+
+    def _read_once(self):
+        """セッション未起動時の従来動作: 1枚だけ開いて読んで閉じる (camera_open_timeout で打ち切る)"""
+        result = []
+
+        def read():
+            cap = cv2.VideoCapture(self.device_index)
+            try:
+                if cap.isOpened():
+                    ret, frame = cap.read()
+                    if ret:
+                        result.append(frame)
+            finally:
                 cap.release()
-                return filepath, filename
-            cap.release()
-        
-        # 失敗時(ダミー)
-        print("⚠️ Camera not found. Creating dummy.")
-        with open(filepath, "w") as f:
-            f.write("Dummy")
-        return filepath, filename
+
+        thread = threading.Thread(target=read, name="camera-oneshot", daemon=True)
+        thread.start()
+        thread.join(config.camera_open_timeout)
+        if thread.is_alive():
+            print("⚠️ Camera read timed out.")
+            self._count("timeouts")
+        return result[0] if result else None
+
+    def _grab(self):
+        if self.running:
+            frame, _ = self.latest_frame()
+            return frame
+        frame = self._read_once()
+        if frame is None:
+            self._count("no_frame")
+        return frame
+
+    def encode(self, frame, quality=None):
+        """フレームをメモリ上でJPEGにエンコードする。失敗時は None"""
+        if quality is None:
+            quality = config.jpeg_quality
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            return None
+        return buf.tobytes()
+
+    def capture(self):
+        """
+        /tmp に書き出して撮影する。
+        Returns: (ファイルパス or None, ファイル名)。フレームが取れなければ何も書かずに None
+        """
+        with CAPTURE_SECONDS.labels("capture").time():
+            timestamp = int(time.time())
+            filename = f"{timestamp}.jpg"
+            filepath = os.path.join(self.tmp_dir, filename)
+
+            frame = self._grab()
+            if frame is None:
+                print("⚠️ Camera not found. No frame.")
+                return None, filename
+            if not cv2.imwrite(filepath, frame):
+                return None, filename
+            return filepath, filename
 
     def cleanup(self, filepath):
         if os.path.exists(filepath):
-            os.remove(filepath)
\ No newline at end of file
+            os.remove(filepath)
@@ -0,0 +1,215 @@
+import os
+import queue
+import threading
+import time
+from util.config import config
+from util.lazy import lazy_import
+from util.metrics import registry
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+CLIP_ENCODE_SECONDS = registry.histogram(
+    "elderlycam_clip_encode_seconds", "クリップ1本のエンコード時間",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+CLIP_BYTES = registry.counter("elderlycam_clip_bytes", "クリップのバイト数", ["kind"])  # kind: clip / raw_jpeg
+
+_SEGMENT_DUE = object()  # 区切りの時刻になった
+
+
+class ClipBuilder:
+    """
+    ALERTセッションのフレームを1本の動画 (タイムラプス) にまとめてアップロードする
+
+    add() はJPEGをキューに積むだけで、デコード・縮小・cv2.VideoWriter への書き込みは専用スレッドで行う。
+    interval 秒ごと (0 ならセッション終了時だけ) に区切って {folder}/clips/{セッション}_{連番}.mp4 に送る。
+    S3 の通知は .jpg などの画像にだけ反応するので、クリップで LINE の push は増えない。
+    """
+
+    def __init__(self, storage, notify=None, interval=None, fps=None, width=None, codec=None, folder=None):
+        self.storage = storage
+        self.notify = notify
+        self.interval = config.clip_interval if interval is None else interval
+        self.fps = config.clip_fps if fps is None else fps
+        self.width = config.clip_width if width is None else width
+        self.codec = config.clip_codec if codec is None else codec
+        self.folder = f"{config.storage_folder}/clips" if folder is None else folder
+        self.extension = ".avi" if self.codec.upper() == "MJPG" else ".mp4"
+
+        self._queue = queue.Queue(maxsize=config.clip_queue_size)
+        self._thread = None
+        self._session = None
+
+        # 計測値
+        self._lock = threading.Lock()
+        self.clips = 0
+        self.frames = 0
+        self.dropped = 0
+        self.clip_bytes = 0
+        self.raw_bytes = 0
+        self.encode_time = 0.0
+
+    # ---- セッション ----
+
+    def start(self):
+        """ALERTセッションを始める"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._session = int(time.time() * 1000)
+        # 前のセッションの終了後に積まれたものは捨てる
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._thread = threading.Thread(target=self._loop, args=(self._session,), name="clip-builder", daemon=True)
+        self._thread.start()
+
+    def finish(self, timeout=30):
+        """セッションを終え、残りのフレームでクリップを作って送る"""
+        if not self._thread:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            print("⚠️ Clip builder did not finish in time.")
+        self._thread = None
+
+    def add(self, ts, jpeg):
+        """
+        JPEG を積む (待たない)。そのサイズは「1枚ずつ送った場合のバイト数」としてクリップと比べる。
+        Returns: 積めたら True (未開始・キュー満杯なら False)
+        """
+        if self._thread is None:
+            return False
+        try:
+            self._queue.put_nowait((ts, jpeg))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    # ---- エンコード ----
+
+    def _loop(self, session):
+        segment = None
+        seq = 0
+        while True:
+            timeout = None
+            if segment is not None and self.interval > 0:
+                timeout = max(segment["started"] + self.interval - time.monotonic(), 0.0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _SEGMENT_DUE
+
+            if item is None or item is _SEGMENT_DUE:
+                # 終了 or 区切りの時刻
+                if segment is not None:
+                    try:
+                        self._close(segment, session, seq)
+                    except Exception as e:
+                        print(f"⚠️ Clip Error: {type(e).__name__}: {e}")
+                    segment = None
+                    seq += 1
+                if item is None:
+                    return
+                continue
+
+            try:
+                segment = self._write(segment, *item)
+            except Exception as e:
+                print(f"⚠️ Clip Error: {type(e).__name__}: {e}")
+
+    def _write(self, segment, ts, jpeg):
+        begin = time.perf_counter()
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return segment
+
+        if segment is None:
+            h, w = frame.shape[:2]
+            width = min(self.width, w)
+            # 多くのコーデックは偶数の幅・高さを要求する
+            size = (width // 2 * 2, int(h * width / w) // 2 * 2)
+            path = os.path.join("/tmp", f"clip_{os.getpid()}_{int(ts * 1000)}{self.extension}")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.codec), self.fps, size)
+            if not writer.isOpened():
+                raise RuntimeError(f"VideoWriter could not open ({self.codec})")
+            segment = {
+                "writer": writer, "path": path, "size": size, "started": time.monotonic(),
+                "first_ts": ts, "last_ts": ts, "frames": 0, "raw_bytes": 0, "encode": 0.0,
+            }
+
+        if (frame.shape[1], frame.shape[0]) != segment["size"]:
+            frame = cv2.resize(frame, segment["size"], interpolation=cv2.INTER_AREA)
+        segment["writer"].write(frame)
+        segment["frames"] += 1
+        segment["last_ts"] = ts
+        segment["raw_bytes"] += len(jpeg)
+        segment["encode"] += time.perf_counter() - begin
+        return segment
+
+    def _close(self, segment, session, seq):
+        begin = time.perf_counter()
+        segment["writer"].release()
+        encode = segment["encode"] + time.perf_counter() - begin
+        try:
+            with open(segment["path"], "rb") as f:
+                data = f.read()
+        finally:
+            if os.path.exists(segment["path"]):
+                os.remove(segment["path"])
+
+        frames, raw = segment["frames"], segment["raw_bytes"]
+        with self._lock:
+            self.clips += 1
+            self.frames += frames
+            self.clip_bytes += len(data)
+            self.raw_bytes += raw
+            self.encode_time += encode
+        CLIP_ENCODE_SECONDS.observe(encode)
+        CLIP_BYTES.labels("clip").inc(len(data))
+        CLIP_BYTES.labels("raw_jpeg").inc(raw)
+
+        ratio = f" (raw JPEG {raw / 1024:.0f}KB, x{raw / len(data):.1f} smaller)" if raw and data else ""
+        print(f"🎞️ Clip #{seq}: {frames} frames {len(data) / 1024:.0f}KB{ratio} encode={encode:.2f}s")
+        if not data:
+            return
+
+        filename = f"{session}_{seq:03d}{self.extension}"
+        self.storage.submit_bytes(
+            data, filename, self.folder,
+            content_type="video/mp4" if self.extension == ".mp4" else "video/x-msvideo",
+            metadata={
+                "frames": str(frames),
+                "first-captured-at": f"{segment['first_ts']:.3f}",
+                "last-captured-at": f"{segment['last_ts']:.3f}",
+                "raw-jpeg-bytes": str(raw),
+                "encode-seconds": f"{encode:.3f}",
+            },
+            purpose="clip"
+        )
+        if self.notify is not None:
+            self.notify({
+                "event": "clip",
+                "key": f"{self.folder}/{filename}",
+                "frames": frames,
+                "first_captured_at": segment["first_ts"],
+                "last_captured_at": segment["last_ts"],
+            })
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "clips": self.clips,
+                "frames": self.frames,
+                "dropped": self.dropped,
+                "clip_bytes": self.clip_bytes,
+                "raw_bytes": self.raw_bytes,
+                "compression": self.raw_bytes / self.clip_bytes if self.clip_bytes else 0.0,
+                "avg_encode": self.encode_time / self.clips if self.clips else 0.0,
+            }
@@ -16,6 +16,8 @@ class Config:
     # AWS IoT Core設定
     endpoint: str = os.getenv("IOT_ENDPOINT", "")
     thing_name: str = os.getenv("THING_NAME", "")
+    publish_timeout: float = 5.0  # PUBACK待ちの上限(秒)
+    report_retries: int = 3       # 状態報告のリトライ回数 (超えたらOutboxへ)
     
     # 証明書パス
     cert_path: str = f"{_HOME}/certs/certificate.pem.crt"
@@ -25,15 +27,159 @@ class Config:
     # S3設定
     bucket_name: str = os.getenv("S3_BUCKET", "")
     region: str = "ap-northeast-1"
+    # "memory": JPEGをメモリ上でエンコードしてそのままアップロード
+    # "file":   アップロードキューに積む前に /tmp へ書き出し、upload_file で送る (フォールバック)
+    storage_mode: str = os.getenv("STORAGE_MODE", "memory")
+    jpeg_quality: int = int(os.getenv("JPEG_QUALITY", "90"))
+    # 解像度違いのJPEG: "名前:幅:品質[:gray]" のカンマ区切り (例: "full:0:85,preview:320:60")
+    renditions: str = os.getenv("RENDITIONS", "")
+    # アップロードキュー
+    upload_workers: int = int(os.getenv("UPLOAD_WORKERS", "2"))
+    upload_queue_size: int = 32
+    # 満杯時: drop_oldest(古いものを捨てる) / drop_newest(新しいものを捨てる) / block(空くまで待つ)
+    upload_queue_policy: str = os.getenv("UPLOAD_QUEUE_POLICY", "drop_oldest")
+    upload_drain_timeout: float = 10.0  # 終了時に送り切るまで待つ上限(秒)
+
+    # Outbox (オフライン時の未送信データ)
+    outbox_enabled: bool = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"
+    outbox_path: str = os.getenv("OUTBOX_PATH", f"{_HOME}/.elderlycam/outbox.db")
+    outbox_max_bytes: int = int(os.getenv("OUTBOX_MAX_MB", "200")) * 1024 * 1024
+    outbox_batch_size: int = 20
+    outbox_retry_interval: float = 10.0  # 再送を試みる間隔(秒)
+
+    # Lambda Function URL (撮影・通知トリガー)
+    lambda_url: str = os.getenv(
+        "LAMBDA_URL", "https://zrv7g2ggwfbdxwm6ppeii4smdu0gjwoz.lambda-url.ap-northeast-1.on.aws/"
+    )
+    lambda_connect_timeout: float = float(os.getenv("LAMBDA_CONNECT_TIMEOUT", "3.05"))
+    lambda_read_timeout: float = float(os.getenv("LAMBDA_READ_TIMEOUT", "10"))
+    lambda_retries: int = int(os.getenv("LAMBDA_RETRIES", "2"))
+    lambda_pool_size: int = 4
 
     # アプリ設定
     image_interval: int = 5  # 撮影間隔(秒)
+    # ALERT中の撮影方法
+    # "remote": Lambda Function URLを叩いてクラウド側で撮影・通知させる (従来)
+    # "local":  このデバイスで撮影してS3へ直接アップロードし、MQTTで軽量な通知イベントを送る
+    capture_mode: str = os.getenv("CAPTURE_MODE", "remote")
+    # 撮影スケジュール ("fixed": 一定間隔 / "burst": ALERT直後に連写してから通常間隔へ)
+    # remote モードでは撮影1回ごとに LINE の push が届くので、burst は明示的に選んだ時だけ使う
+    schedule_policy: str = os.getenv("SCHEDULE_POLICY", "fixed")
+    schedule_burst_interval: float = 1.0    # 連写中の間隔(秒)
+    schedule_burst_seconds: float = 10.0    # 連写する時間(秒)
+    schedule_decay_seconds: float = 20.0    # 通常間隔へ戻すまでの時間(秒)
+    schedule_queue_high: int = 8            # アップロード待ちがこれ以上なら間隔を広げる
+    schedule_latency_high: float = 3.0      # 送信遅延(秒)がこれ以上なら間隔を広げる
+    schedule_max_backoff: float = 8.0       # 間隔を広げる最大倍率
+    # 状態遷移の通知方法 ("async": リスナーごとの専用スレッド / "sync": update()を呼んだスレッドで順番に)
+    listener_dispatch: str = os.getenv("LISTENER_DISPATCH", "async")
+    listener_timeout: float = 5.0  # これより長く動いているリスナーを警告する(秒)
+    # "thread": 従来のスレッド構成 / "asyncio": イベントループ1本で動かす
+    runtime: str = os.getenv("RUNTIME", "thread")
+    async_upload_workers: int = 4    # 同時アップロード数
+    async_max_inflight: int = 4      # 同時に投げるLambda呼び出し数
+    async_queue_size: int = 16       # ステージ間キューの上限
+
+    # メトリクス (Prometheus形式で http://METRICS_HOST:METRICS_PORT/metrics に公開。0で無効)
+    metrics_host: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    metrics_port: int = int(os.getenv("METRICS_PORT", "9108"))
+
+    # 入力トレース (Zigbee / Shadow delta / カメラ・アップロード結果 / 状態遷移) の記録先。空なら記録しない
+    trace_path: str = os.getenv("TRACE_PATH", "")
+
+    # プロファイラ (スタックのサンプリング + tracemalloc の差分)。実行中は SIGUSR1 でもオン・オフできる
+    profile_enabled: bool = os.getenv("PROFILE_ENABLED", "false").lower() == "true"
+    profile_dir: str = os.getenv("PROFILE_DIR", f"{_HOME}/.elderlycam/profile")
+    profile_sample_interval: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.05"))  # サンプリング間隔(秒)
+    profile_dump_interval: float = float(os.getenv("PROFILE_DUMP_INTERVAL", "300"))      # ファイルに書く間隔(秒)
+    profile_keep: int = 24  # 種類ごとに残すファイル数
+
+    # カメラ設定
+    camera_index: int = int(os.getenv("CAMERA_INDEX", "0"))
+    # 複数カメラ: "ID:デバイス" をカンマ区切り (例: "living:0,entrance:/dev/video2")
+    cameras: str = os.getenv("CAMERAS", "")
+    camera_warmup_frames: int = 5       # 接続直後に捨てるフレーム数(露出安定待ち)
+    camera_reopen_after: int = 10       # 連続読み取り失敗でデバイスを再オープンする回数
+    camera_reopen_delay: float = 2.0    # 再オープンまでの待機(秒)。失敗が続くと倍々に延ばす
+    camera_reopen_max_delay: float = 30.0  # 再オープン待機の上限(秒)
+    camera_read_timeout: float = float(os.getenv("CAMERA_READ_TIMEOUT", "2.0"))  # read()が返らなければ固まったとみなす(秒)
+    camera_open_timeout: float = 10.0   # オープン〜最初のフレームまでの上限(秒)
+    camera_frame_timeout: float = 3.0   # capture()が最初のフレームを待つ上限(秒)。これより古いフレームも使わない
+    # ALERT中の撮影経路 ("thread": 従来のスレッド構成 / "shm": 共有メモリ経由のマルチプロセス)
+    pipeline_mode: str = os.getenv("PIPELINE", "thread")
+    pipeline_slots: int = 8              # 共有メモリのリングに置くフレーム数
+    pipeline_encoders: int = int(os.getenv("PIPELINE_ENCODERS", "2"))  # エンコードプロセス数
+    pipeline_width: int = 1280           # リングのフレームサイズ (違う解像度は縮小して格納)
+    pipeline_height: int = 720
+
+    # 緊急前映像 (MONITORING中に直近数秒を低レートで録っておく)
+    prealert_seconds: int = int(os.getenv("PREALERT_SECONDS", "10"))  # 0で無効
+    prealert_interval: float = 1.0                # 録画間隔(秒)
+    prealert_max_bytes: int = 4 * 1024 * 1024     # バッファのメモリ上限
+    prealert_jpeg_quality: int = 70
+
+    # 変化検知 (静止している間はフレームを送らない)
+    # 既定は無効。静止した場面 (床に倒れて動かない人など) で通知がキーフレーム間隔まで減るため
+    motion_enabled: bool = os.getenv("MOTION_ENABLED", "false").lower() == "true"
+    motion_threshold: float = float(os.getenv("MOTION_THRESHOLD", "0.01"))  # 変化画素の割合
+    motion_pixel_delta: int = 25            # 変化とみなす画素値の差 (0-255)
+    motion_keyframe_interval: float = 30.0  # 変化がなくても送る間隔(秒)
+    motion_width: int = 160                 # 差分計算用に縮小する幅(px)
+
+    # 品質スコア (ブレ・露出・白飛び黒つぶれ) と連写 (1回の撮影で数枚撮り、スコアが最も高い1枚だけ送る)
+    quality_enabled: bool = os.getenv("QUALITY_ENABLED", "true").lower() == "true"
+    burst_frames: int = int(os.getenv("BURST_FRAMES", "3"))  # 1で連写しない
+    burst_window: float = 0.3               # 連写で集める時間の上限(秒)
+    quality_width: int = 320                # スコア計算用に縮小する幅(px)
+    quality_sharpness_ref: float = 100.0    # ラプラシアン分散がこの値でシャープさ0.5とみなす
+
+    # ALERTセッションのクリップ ("off": 作らない / "append": 1枚ずつのJPEGに加えて作る /
+    # "replace": セッション最初の1枚だけJPEGで送り、残りはクリップにまとめる)
+    clip_mode: str = os.getenv("CLIP_MODE", "off")
+    clip_interval: float = float(os.getenv("CLIP_INTERVAL", "30"))  # クリップを区切る間隔(秒)。0でセッション終了時だけ
+    clip_codec: str = os.getenv("CLIP_CODEC", "mp4v")  # cv2.VideoWriter の fourcc ("MJPG" なら .avi)
+    clip_fps: float = 2.0                # 再生時のフレームレート
+    clip_width: int = 640                # クリップの幅(px)
+    clip_queue_size: int = 32            # エンコード待ちのフレーム数の上限
+
+    # 人物検出 ("": 無効 / "hog": HOG歩行者検出 / "dnn": cv2.dnn の CPU 推論 (MobileNet-SSD など))
+    person_detector: str = os.getenv("PERSON_DETECTOR", "")
+    person_model: str = os.getenv("PERSON_MODEL", "")                # dnn: 重みファイル (.caffemodel など)
+    person_model_config: str = os.getenv("PERSON_MODEL_CONFIG", "")  # dnn: 構成ファイル (.prototxt など)
+    person_confidence: float = float(os.getenv("PERSON_CONFIDENCE", "0.5"))
+    person_width: int = 400                 # 推論用に縮小する幅(px)
+    person_interval: float = 0.5            # 検出を回す間隔(秒)
+    person_max_age: float = 3.0             # これより古い検出結果はフレームのタグに使わない(秒)
+    # 複数カメラ構成で、人が映らなくなってこの秒数を過ぎたカメラは PERSON_IDLE_INTERVAL 秒に1枚まで間引く
+    person_idle_seconds: float = 15.0
+    person_idle_interval: float = float(os.getenv("PERSON_IDLE_INTERVAL", "15"))
 
     @property
     def client_id(self) -> str:
         """CLIENT_IDはTHING_NAMEと同じ"""
         return self.thing_name
 
+    @property
+    def storage_folder(self) -> str:
+        """S3のアップロード先フォルダはTHING_NAMEと同じ"""
+        return self.thing_name
+
+    @property
+    def event_topic(self) -> str:
+        """撮影通知イベントのMQTTトピック"""
+        return f"elderlycam/{self.thing_name}/events"
+
+    @property
+    def camera_specs(self) -> list:
+        """[(カメラID, デバイス番号 or パス), ...]。CAMERAS未設定なら1台構成"""
+        if not self.cameras:
+            return [(self.storage_folder, self.camera_index)]
+        specs = []
+        for item in self.cameras.split(","):
+            camera_id, _, device = item.strip().partition(":")
+            specs.append((camera_id, int(device) if device.isdigit() else device))
+        return specs
+
 
 # シングルトンインスタンス
 config = Config()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import namedtuple
+from util.config import config
+from util.lazy import lazy_import
+from util.metrics import registry
+from util.storage import quiet_name
+
+cv2 = lazy_import("cv2")
+
+ENCODE_SECONDS = registry.histogram("elderlycam_encode_seconds", "JPEGエンコード時間", ["rendition"])
+ENCODED_BYTES = registry.counter("elderlycam_encoded_bytes", "エンコード後のバイト数", ["rendition"])
+
+# name: S3キーに使う名前 / width: 横幅px (0 = 元の解像度) / quality: JPEG品質 / grayscale: 白黒
+Rendition = namedtuple("Rendition", ["name", "width", "quality", "grayscale"])
+
+
+def parse_renditions(spec=None):
+    """
+    "名前:幅:品質[:gray]" のカンマ区切りを解釈する (例: "full:0:85,preview:320:60:gray")
+    未指定なら元の解像度1種類のみ
+    """
+    spec = config.renditions if spec is None else spec
+    if not spec:
+        return [Rendition("full", 0, config.jpeg_quality, False)]
+
+    renditions = []
+    for item in spec.split(","):
+        parts = item.strip().split(":")
+        name = parts[0]
+        width = int(parts[1]) if len(parts) > 1 and parts[1] else 0
+        quality = int(parts[2]) if len(parts) > 2 and parts[2] else config.jpeg_quality
+        grayscale = len(parts) > 3 and parts[3] == "gray"
+        renditions.append(Rendition(name, width, quality, grayscale))
+    return renditions
+
+
+class RenditionEncoder:
+    """
+    1フレームから複数解像度のJPEGを作る
+
+    先頭のレンディションが代表 (従来と同じS3キー)、それ以外は {name}/ 以下に .jfif で置く
+    (S3 の通知は .jpg などにだけ反応するので、LINE へ送られるのは代表の1枚だけになる)。
+    レンディションごとのサイズとエンコード時間を記録する。
+    """
+
+    def __init__(self, renditions=None):
+        self.renditions = parse_renditions() if renditions is None else renditions
+        self.primary = self.renditions[0]
+        self._lock = threading.Lock()
+        self._stats = {r.name: {"frames": 0, "bytes": 0, "encode": 0.0} for r in self.renditions}
+
+    def key(self, rendition, filename):
+        if rendition.name == self.primary.name:
+            return filename
+        return quiet_name(f"{rendition.name}/{filename}")
+
+    def representative(self, renditions):
+        """
+        encode() の結果から代表 (通知・クリップに使う1枚) を名前で選ぶ。
+        代表のエンコードに失敗していたら残りの先頭で代わりにする。1枚もなければ None
+        """
+        for item in renditions:
+            if item[0].name == self.primary.name:
+                return item
+        return renditions[0] if renditions else None
+
+    def _resize(self, frame, width):
+        h, w = frame.shape[:2]
+        if width <= 0 or width >= w:
+            return frame
+        return cv2.resize(frame, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+
+    def encode(self, frame):
+        """Returns: [(Rendition, JPEGバイト列), ...]。エンコードに失敗したものは含まない"""
+        results = []
+        gray = None
+        for r in self.renditions:
+            start = time.perf_counter()
+            src = frame
+            if r.grayscale and frame.ndim == 3:
+                if gray is None:
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                src = gray
+            src = self._resize(src, r.width)
+            ok, buf = cv2.imencode(".jpg", src, [cv2.IMWRITE_JPEG_QUALITY, r.quality])
+            elapsed = time.perf_counter() - start
+            if not ok:
+                continue
+
+            data = buf.tobytes()
+            ENCODE_SECONDS.labels(r.name).observe(elapsed)
+            ENCODED_BYTES.labels(r.name).inc(len(data))
+            with self._lock:
+                s = self._stats[r.name]
+                s["frames"] += 1
+                s["bytes"] += len(data)
+                s["encode"] += elapsed
+            results.append((r, data))
+        return results
+
+    @property
+    def stats(self):
+        """{name: {"frames", "avg_bytes", "avg_encode"}}"""
+        with self._lock:
+            return {
+                name: {
+                    "frames": s["frames"],
+                    "avg_bytes": s["bytes"] / s["frames"] if s["frames"] else 0,
+                    "avg_encode": s["encode"] / s["frames"] if s["frames"] else 0.0,
+                }
+                for name, s in self._stats.items()
+            }
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+# 撮影時刻(epoch秒)とエンコード済みJPEG
+BufferedFrame = namedtuple("BufferedFrame", ["timestamp", "data"])
+
+
+class FrameRingBuffer:
+    """
+    直近のフレームをJPEGバイト列で保持するリングバッファ (Thread-safe)
+
+    - max_frames 枚を超えるか、合計サイズが max_bytes を超えると古いものから捨てる
+    - max_age 秒より古いフレームも捨てる
+    """
+
+    def __init__(self, max_frames, max_bytes, max_age=None):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._frames = deque()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return self._total_bytes
+
+    def append(self, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        # 1枚でも上限を超えるフレームは保持できない
+        if len(data) > self.max_bytes:
+            return False
+
+        with self._lock:
+            self._frames.append(BufferedFrame(timestamp, data))
+            self._total_bytes += len(data)
+            self._evict(timestamp)
+        return True
+
+    def drain(self):
+        """保持している全フレームを古い順に取り出し、バッファを空にする"""
+        with self._lock:
+            self._evict(time.time())
+            frames = list(self._frames)
+            self._frames.clear()
+            self._total_bytes = 0
+        return frames
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._total_bytes = 0
+
+    def _evict(self, now):
+        while self._frames and (
+            len(self._frames) > self.max_frames
+            or self._total_bytes > self.max_bytes
+            or (self.max_age is not None and now - self._frames[0].timestamp > self.max_age)
+        ):
+            old = self._frames.popleft()
+            self._total_bytes -= len(old.data)
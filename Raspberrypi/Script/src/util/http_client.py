@@ -0,0 +1,139 @@
+import threading
+import time
+from util.config import config
+from util.metrics import registry
+
+LAMBDA_SECONDS = registry.histogram("elderlycam_lambda_request_seconds", "Lambda呼び出し時間", ["connection"])
+LAMBDA_HANDSHAKE_SECONDS = registry.histogram("elderlycam_lambda_handshake_seconds", "TCP+TLSハンドシェイク時間")
+
+
+def _timed_connection_class(on_connect):
+    """TCP+TLSハンドシェイクにかかった時間を on_connect に渡す接続クラスを作る"""
+    from urllib3.connection import HTTPSConnection
+
+    class TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            on_connect(time.perf_counter() - start)
+
+    return TimedHTTPSConnection
+
+
+def _timed_adapter(on_connect, **kwargs):
+    """
+    https のプールに計測付き接続クラスを使わせる HTTPAdapter を作る。
+    プールはリクエストごとに PoolManager が pool_kwargs 付きのキーで作るので、
+    個々のプールではなくプールのクラスを差し替える
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPSConnectionPool
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = _timed_connection_class(on_connect)
+
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kw):
+            super().init_poolmanager(*args, **kw)
+            # モジュール共通の辞書を書き換えないようにコピーする
+            self.poolmanager.pool_classes_by_scheme = dict(
+                self.poolmanager.pool_classes_by_scheme, https=TimedHTTPSConnectionPool
+            )
+
+    return TimedHTTPAdapter(**kwargs)
+
+
+class LambdaTrigger:
+    """
+    Lambda Function URL 呼び出し用のHTTPクライアント
+
+    requests.Session でコネクションを使い回し (keep-alive)、
+    毎回のTCP/TLSハンドシェイクを避ける。ハンドシェイクとリクエスト全体の時間を記録して
+    実際に再利用されているかを確認できるようにする。
+    """
+
+    def __init__(self, url=None):
+        self.url = config.lambda_url if url is None else url
+        self.timeout = (config.lambda_connect_timeout, config.lambda_read_timeout)
+        self.session = None
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.calls = 0
+        self.handshakes = 0
+        self.last_handshake = 0.0
+        self.last_request = 0.0
+        self.total_handshake = 0.0
+        self.total_request = 0.0
+
+    def _ensure_session(self):
+        """セッションは初回呼び出し時に作る (requestsのimportを起動時に行わないため)"""
+        with self._lock:
+            if self.session is not None:
+                return self.session
+
+            import requests
+            from urllib3.util.retry import Retry
+
+            # POST は冪等でないので、リクエストが届いていない接続エラーだけ再試行する
+            # (504 などの後に再送すると Lambda が2回動いて LINE が二重に届く)
+            retry = Retry(
+                total=config.lambda_retries,
+                connect=config.lambda_retries,
+                read=0,
+                status=0,
+                backoff_factor=0.3,
+            )
+            adapter = _timed_adapter(
+                self._on_connect, pool_connections=1, pool_maxsize=config.lambda_pool_size, max_retries=retry
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+
+            self.session = session
+            return session
+
+    def _on_connect(self, seconds):
+        self._local.handshake = getattr(self._local, "handshake", 0.0) + seconds
+
+    def post(self, payload):
+        session = self._ensure_session()
+        self._local.handshake = 0.0
+        start = time.perf_counter()
+        try:
+            return session.post(self.url, json=payload, timeout=self.timeout)
+        finally:
+            elapsed = time.perf_counter() - start
+            handshake = self._local.handshake
+            LAMBDA_SECONDS.labels("new" if handshake else "reused").observe(elapsed)
+            if handshake:
+                LAMBDA_HANDSHAKE_SECONDS.observe(handshake)
+            with self._lock:
+                self.calls += 1
+                if handshake:
+                    self.handshakes += 1
+                self.last_handshake = handshake
+                self.last_request = elapsed
+                self.total_handshake += handshake
+                self.total_request += elapsed
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "handshakes": self.handshakes,
+                "reused": self.calls - self.handshakes,
+                "last_handshake": self.last_handshake,
+                "last_request": self.last_request,
+                "avg_request": self.total_request / self.calls if self.calls else 0.0,
+                "avg_handshake": self.total_handshake / self.handshakes if self.handshakes else 0.0,
+            }
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def warm_up(self):
+        """起動時にバックグラウンドでセッションを用意しておく"""
+        self._ensure_session()
@@ -0,0 +1,51 @@
+import threading
+from collections import deque
+
+
+class StageLatency:
+    """
+    処理段階ごとの所要時間を直近 window 件だけ保持し、平均・パーセンタイルを出す
+    (撮影モードごとの比較用)
+    """
+
+    def __init__(self, window=200, histogram=None, labels=()):
+        self.window = window
+        # メトリクスにも流す場合のヒストグラム (ラベルは labels + (段階名,))
+        self.histogram = histogram
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+        if self.histogram is not None:
+            self.histogram.labels(*self.labels, stage).observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    @staticmethod
+    def _percentile(ordered, p):
+        index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+    @property
+    def stats(self):
+        """{段階名: {"count", "avg", "p50", "p95", "max"}} (秒)"""
+        with self._lock:
+            snapshot = {stage: sorted(samples) for stage, samples in self._samples.items()}
+        return {
+            stage: {
+                "count": len(ordered),
+                "avg": sum(ordered) / len(ordered),
+                "p50": self._percentile(ordered, 50),
+                "p95": self._percentile(ordered, 95),
+                "max": ordered[-1],
+            }
+            for stage, ordered in snapshot.items() if ordered
+        }
@@ -0,0 +1,40 @@
+import importlib
+import threading
+
+
+class _LazyModule:
+    """属性に初めて触れた時点でモジュールをimportするプロキシ"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    """
+    重いライブラリ (cv2 / numpy / boto3 / requests / awscrt) のimportを初回使用時まで遅らせる。
+    起動直後にボタンを受け付けられるようにするため。
+
+        cv2 = lazy_import("cv2")
+    """
+    return _LazyModule(name)
+
+
+def preload(*names):
+    """バックグラウンドで先にimportしておく (初回使用時の待ちを減らす)"""
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"⚠️ Preload failed: {name}: {e}")
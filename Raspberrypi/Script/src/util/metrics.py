@@ -0,0 +1,281 @@
+"""
+プロセス内メトリクス (カウンタ / ゲージ / 固定バケットのヒストグラム)
+
+    from util.metrics import registry
+    UPLOAD = registry.histogram("elderlycam_s3_upload_seconds", "S3アップロード時間", ["method"])
+    with UPLOAD.labels("put_object").time():
+        ...
+
+start_server() で Prometheus のテキスト形式をローカルポートで公開する。
+記録は「ロック1回 + 加算」だけなので本番でも常時有効にしておける。
+"""
+import bisect
+import threading
+import time
+from util.config import config
+
+# 秒単位の既定バケット (5ms〜30s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Timer:
+    """with ブロックの経過時間を observe する"""
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self._fn = None
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, fn):
+        """読み出し時に fn() を呼んで値にする (キュー長など)"""
+        self._fn = fn
+
+    def samples(self, name, labels):
+        if self._fn is not None:
+            try:
+                return [(name, labels, self._fn())]
+            except Exception:
+                return []
+        return [(name, labels, self.value)]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        result = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            result.append((name + "_bucket", labels + (("le", _format_value(bound)),), cumulative))
+        result.append((name + "_sum", labels, total))
+        result.append((name + "_count", labels, count))
+        return result
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=(), **kwargs):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._children = {}
+        self._default = None if self.labelnames else self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            for sample_name, labels, value in child.samples(self.name, tuple(zip(self.labelnames, values))):
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set_function(self, fn):
+        self._default.set_function(fn)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def _new_child(self):
+        return _HistogramChild(self._kwargs.get("buckets") or DEFAULT_BUCKETS)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class Registry:
+    """名前ごとに1つだけメトリクスを持つ。同じ名前で登録すると既存のものを返す"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        # TYPE 行とサンプルを同じ名前にする (text format 0.0.4 ではカウンタも名前が一致している必要がある)
+        if not name.endswith("_total"):
+            name += "_total"
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self._register(Histogram, name, documentation, labelnames, buckets=tuple(buckets or DEFAULT_BUCKETS))
+
+    def render(self):
+        """Prometheus テキスト形式 (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def start_server(host=None, port=None):
+    """
+    /metrics をバックグラウンドスレッドで公開する。
+    config.metrics_port が 0 なら何もしない。Returns: サーバー or None
+    """
+    host = config.metrics_host if host is None else host
+    port = config.metrics_port if port is None else port
+    if not port:
+        return None
+    # http.server は起動時間に響くので公開する時だけ読み込む
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # アクセスログは出さない (スクレイプ毎に print されるのを避ける)
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"⚠️ Metrics server failed to start: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Metrics: http://{host}:{port}/metrics")
+    return server
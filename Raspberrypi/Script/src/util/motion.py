@@ -0,0 +1,94 @@
+import threading
+import time
+from util.config import config
+from util.lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+class ChangeDetector:
+    """
+    フレーム差分による変化検知
+
+    縮小したグレースケール画像同士を NumPy で差分し、
+    画素値が pixel_delta 以上変化した画素の割合が threshold 以上なら「変化あり」とみなす。
+    変化がなくても keyframe_interval 秒ごとに1枚は通す。
+    """
+
+    def __init__(self, threshold=None, pixel_delta=None, keyframe_interval=None, width=None):
+        self.threshold = config.motion_threshold if threshold is None else threshold
+        self.pixel_delta = config.motion_pixel_delta if pixel_delta is None else pixel_delta
+        self.keyframe_interval = config.motion_keyframe_interval if keyframe_interval is None else keyframe_interval
+        self.width = config.motion_width if width is None else width
+
+        self._lock = threading.Lock()
+        self._reference = None
+        self._last_keep = 0.0
+        self.kept = 0
+        self.dropped = 0
+        self.last_score = 0.0
+
+    def reset(self):
+        """参照フレームを捨てる (次のフレームは必ず通る)"""
+        with self._lock:
+            self._reference = None
+            self._last_keep = 0.0
+
+    def prepare(self, frame):
+        """差分計算用に縮小・グレースケール化する"""
+        h, w = frame.shape[:2]
+        if w > self.width:
+            frame = cv2.resize(frame, (self.width, int(h * self.width / w)), interpolation=cv2.INTER_AREA)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame.astype(np.int16)
+
+    def score(self, small, reference):
+        """変化した画素の割合 (0.0〜1.0)"""
+        if reference is None or reference.shape != small.shape:
+            return 1.0
+        return float(np.count_nonzero(np.abs(small - reference) >= self.pixel_delta)) / small.size
+
+    def keep(self, frame, now=None):
+        """フレームを送るべきなら True。送る場合はそのフレームを次の参照にする"""
+        if now is None:
+            now = time.time()
+        small = self.prepare(frame)
+
+        with self._lock:
+            if self._decide(self.score(small, self._reference), now):
+                self._reference = small
+                return True
+            return False
+
+    def keep_score(self, score, now=None):
+        """別プロセスで計算済みのスコアで判定する (共有メモリパイプライン用)"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            return self._decide(score, now)
+
+    def _decide(self, score, now):
+        self.last_score = score
+        changed = score >= self.threshold
+        keyframe_due = now - self._last_keep >= self.keyframe_interval
+
+        if changed or keyframe_due:
+            self._last_keep = now
+            self.kept += 1
+            return True
+
+        self.dropped += 1
+        return False
+
+    @property
+    def stats(self):
+        with self._lock:
+            total = self.kept + self.dropped
+            return {
+                "kept": self.kept,
+                "dropped": self.dropped,
+                "drop_ratio": self.dropped / total if total else 0.0,
+                "last_score": self.last_score,
+            }
@@ -1,13 +1,62 @@
 import json
-from awscrt import io, mqtt
-from awsiot import mqtt_connection_builder
+import threading
+import time
 from util.config import config
+from util import trace
+from util.lazy import lazy_import
+from util.metrics import registry
 from util.state_manager import Status
 
+io = lazy_import("awscrt.io")
+mqtt = lazy_import("awscrt.mqtt")
+mqtt_connection_builder = lazy_import("awsiot.mqtt_connection_builder")
+
+REPORT_STATUS_SECONDS = registry.histogram(
+    "elderlycam_report_status_seconds", "report_status() の呼び出し時間 (キューに積むまで)",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+PUBLISH_SECONDS = registry.histogram("elderlycam_mqtt_publish_seconds", "状態報告のPUBACKまでの時間")
+REPORT_QUEUE_DEPTH = registry.gauge("elderlycam_report_queue_depth", "未送信の状態報告 (0 or 1)")
+EVENTS = registry.counter("elderlycam_events", "通知イベントの送信数", ["result"])
+
 class IotClient:
-    def __init__(self, on_delta_callback):
+    def __init__(self, on_delta_callback, outbox=None):
         self.connection = None
         self.on_delta_callback = on_delta_callback
+        # 送れなかった状態報告はここに溜めて、接続回復後に順番に再送する
+        self.outbox = outbox
+
+        # 状態報告はバックグラウンドで送る。未送信の間に次の状態が来たら最新だけ送る
+        self._connected = threading.Event()
+        self._report_cond = threading.Condition()
+        self._pending_report = None
+        self._reporter = None
+        self.coalesced = 0
+        self.events_sent = 0
+        self.events_dropped = 0
+        self.last_publish_latency = 0.0
+        self.avg_publish_latency = 0.0
+        REPORT_QUEUE_DEPTH.set_function(lambda: self.report_queue_depth)
+
+    @property
+    def ready(self):
+        """接続・購読が完了したらセットされる Event"""
+        return self._connected
+
+    def connect_with_retry(self, stop_event=None):
+        """接続できるまで間隔を空けて繰り返す (停電復帰直後はネットワークが未準備のことがある)"""
+        delay = 1.0
+        while True:
+            try:
+                self.connect()
+                return True
+            except Exception as e:
+                print(f"⚠️ AWS IoT Connect Failed: {e}. Retrying in {delay:.0f}s")
+            if stop_event is not None and stop_event.wait(delay):
+                return False
+            if stop_event is None:
+                time.sleep(delay)
+            delay = min(delay * 2, 30.0)
 
     def connect(self):
         event_loop_group = io.EventLoopGroup(1)
@@ -29,6 +78,7 @@ class IotClient:
         
         self._subscribe_delta()
         self._subscribe_shadow_responses()
+        self._connected.set()
 
     def _subscribe_delta(self):
         topic = f"$aws/things/{config.thing_name}/shadow/update/delta"
@@ -55,6 +105,7 @@ class IotClient:
         )
     
     def _on_message(self, topic, payload, **kwargs):
+        trace.record("delta", payload.decode(errors="replace") if isinstance(payload, bytes) else payload)
         try:
             data = json.loads(payload)
             if "state" in data and "status" in data["state"]:
@@ -67,24 +118,121 @@ class IotClient:
             print(f"⚠️ Delta Parse Error: {e}")
 
     def report_status(self, status):
-        if isinstance(status, Status):
-            status = status.name.lower()
-        
+        """状態報告をキューに積んで即座に戻る (StateManagerのリスナーをブロックしない)"""
+        with REPORT_STATUS_SECONDS.time():
+            if isinstance(status, Status):
+                status = status.name.lower()
+
+            with self._report_cond:
+                if self._pending_report is not None:
+                    self.coalesced += 1
+                self._pending_report = status
+                self._report_cond.notify()
+                if self._reporter is None or not self._reporter.is_alive():
+                    self._reporter = threading.Thread(target=self._report_loop, name="shadow-reporter", daemon=True)
+                    self._reporter.start()
+
+    @property
+    def report_queue_depth(self):
+        with self._report_cond:
+            return 0 if self._pending_report is None else 1
+
+    def _report_loop(self):
+        while True:
+            with self._report_cond:
+                while self._pending_report is None:
+                    self._report_cond.wait()
+                status = self._pending_report
+                self._pending_report = None
+
+            # 接続前の報告は接続完了まで待つ (その間に来た新しい状態で上書きされる)
+            self._connected.wait()
+            self._send_report(status)
+
+    def _has_newer_report(self):
+        with self._report_cond:
+            return self._pending_report is not None
+
+    def _send_report(self, status):
         payload = json.dumps({"state": {"reported": {"status": status}}})
         topic = f"$aws/things/{config.thing_name}/shadow/update"
-        
+
+        # 未送信の報告が残っている間は順序を守るため後ろに並べる
+        if self.outbox is not None and self.outbox.has_pending("shadow"):
+            self.outbox.put("shadow", payload.encode(), topic=topic)
+            print(f"📮 Report queued: {status}")
+            return
+
+        for attempt in range(config.report_retries + 1):
+            # 新しい状態が来ていれば古い報告のリトライはやめる
+            if attempt > 0 and self._has_newer_report():
+                return
+            try:
+                start = time.perf_counter()
+                self._publish(topic, payload)
+                self._record_publish(time.perf_counter() - start)
+                print(f"📤 Reported: {status} ({self.last_publish_latency * 1000:.0f}ms)")
+                return
+            except Exception as e:
+                print(f"❌ Report Error: {e}")
+                # 最後の試行の後は待たずに Outbox へ回す
+                if attempt < config.report_retries:
+                    time.sleep(min(0.5 * 2 ** attempt, 5.0))
+
+        if self.outbox is not None and not self._has_newer_report():
+            self.outbox.put("shadow", payload.encode(), topic=topic)
+            print(f"📮 Report queued: {status}")
+
+    def _record_publish(self, latency):
+        PUBLISH_SECONDS.observe(latency)
+        self.last_publish_latency = latency
+        # 指数移動平均
+        self.avg_publish_latency = latency if self.avg_publish_latency == 0.0 else self.avg_publish_latency * 0.8 + latency * 0.2
+
+    def _publish(self, topic, payload):
+        result = self.connection.publish(
+            topic=topic,
+            payload=payload,
+            qos=mqtt.QoS.AT_LEAST_ONCE
+        )
+        # SDKバージョンによって戻り値が異なる
+        # resultメソッドがあれば呼ぶ
+        if hasattr(result, 'result'):
+            result.result(config.publish_timeout)
+        elif isinstance(result, tuple) and len(result) > 1 and hasattr(result[1], 'result'):
+            result[1].result(config.publish_timeout)
+
+    def publish_event(self, event):
+        """
+        軽量な通知イベントを送る (QoS0で完了を待たない)。
+        未接続の間は捨てる (画像本体はS3側に残るので再送しない)
+        """
+        if not self._connected.is_set():
+            self.events_dropped += 1
+            EVENTS.labels("dropped").inc()
+            return False
         try:
-            result = self.connection.publish(
-                topic=topic,
-                payload=payload,
-                qos=mqtt.QoS.AT_LEAST_ONCE
+            self.connection.publish(
+                topic=config.event_topic,
+                payload=json.dumps(event),
+                qos=mqtt.QoS.AT_MOST_ONCE
             )
-            # SDKバージョンによって戻り値が異なる
-            # resultメソッドがあれば呼ぶ
-            if hasattr(result, 'result'):
-                result.result()
-            elif isinstance(result, tuple) and len(result) > 1 and hasattr(result[1], 'result'):
-                result[1].result()
-            print(f"� Reported: {status}")
+            self.events_sent += 1
+            EVENTS.labels("sent").inc()
+            return True
+        except Exception as e:
+            print(f"⚠️ Event Publish Error: {e}")
+            self.events_dropped += 1
+            EVENTS.labels("error").inc()
+            return False
+
+    def replay(self, meta, payload):
+        """Outbox からの再送ハンドラ"""
+        if self.connection is None:
+            return False
+        try:
+            self._publish(meta["topic"], payload)
+            return True
         except Exception as e:
-            print(f"❌ Report Error: {e}")
\ No newline at end of file
+            print(f"⚠️ Report Replay Error: {e}")
+            return False
@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import deque
+from util import trace
+from util.camera import CameraManager
+from util.config import config
+from util.person import PersonWatcher
+from util.quality import QualityScorer
+from util.storage import quiet_name
+
+
+class _CameraWorker:
+    """
+    カメラ1台分の撮影ワーカー
+
+    capture_all() の度にジョブを1つ受け取り、最新フレームのエンコードとアップロード投入を行う。
+    前のジョブが終わっていなければ (カメラが固まっているなど) その回は見送るので、
+    遅いカメラが他のカメラを待たせることはない。
+    """
+
+    def __init__(self, camera_id, camera, storage):
+        self.camera_id = camera_id
+        self.camera = camera
+        self.storage = storage
+        self.quality = QualityScorer() if config.quality_enabled else None
+        self.person = None  # PersonWatcher (SurveillanceService が設定する)
+        self._last_request = 0.0
+
+        self._job = threading.Event()
+        self._busy = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self._lock = threading.Lock()
+        self._captured = deque(maxlen=30)
+        self.frames = 0
+        self.failures = 0
+        self.skipped = 0
+        self.throttled = 0
+        self.total_encode = 0.0
+        self.last_encode = 0.0
+
+    def start(self):
+        self.camera.start()
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._busy.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"camera-{self.camera_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._job.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.camera.stop()
+
+    def request(self):
+        if self._busy.is_set():
+            with self._lock:
+                self.skipped += 1
+            return False
+        # しばらく人が映っていないカメラは間引く (止めはしない)
+        now = time.monotonic()
+        if (self.person and self.person.idle_for(self.camera_id) >= config.person_idle_seconds
+                and now - self._last_request < config.person_idle_interval):
+            with self._lock:
+                self.throttled += 1
+            return False
+        self._last_request = now
+        self._busy.set()
+        self._job.set()
+        return True
+
+    def _loop(self):
+        while True:
+            self._job.wait()
+            self._job.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                self._capture_once()
+            except Exception as e:
+                print(f"⚠️ Camera {self.camera_id} Error: {type(e).__name__}: {e}")
+                with self._lock:
+                    self.failures += 1
+            finally:
+                self._busy.clear()
+
+    def _capture_once(self):
+        quality = None
+        if self.quality is None:
+            frame, ts = self.camera.latest_frame()
+        else:
+            # 数枚連写して最も品質スコアの高い1枚だけ送る
+            frame, ts, quality = self.quality.best(self.camera.burst(config.burst_frames, config.burst_window))
+        trace.record("camera", {"camera": self.camera_id, "purpose": "cameras", "ok": frame is not None})
+        if frame is None:
+            with self._lock:
+                self.failures += 1
+            return
+
+        start = time.perf_counter()
+        renditions = self.camera.encoder.encode(frame)
+        encode_time = time.perf_counter() - start
+        if not renditions:
+            with self._lock:
+                self.failures += 1
+            return
+
+        with self._lock:
+            self.frames += 1
+            self.last_encode = encode_time
+            self.total_encode += encode_time
+            self._captured.append(time.monotonic())
+
+        person = self.person.latest(self.camera_id) if self.person else None
+        metadata = {
+            "camera-id": self.camera_id, "captured-at": f"{ts:.3f}",
+            **QualityScorer.metadata(quality), **PersonWatcher.metadata(person)
+        }
+        priority = bool(person and person["person"])
+        encoder = self.camera.encoder
+        representative = encoder.representative(renditions)
+        for rendition, data in renditions:
+            if rendition.name != representative[0].name:
+                self.storage.submit_bytes(
+                    data, encoder.key(rendition, f"{int(ts * 1000)}.jpg"), self.camera_id,
+                    metadata=metadata, priority=priority, purpose="cameras"
+                )
+                continue
+            # LINE へ通知される (.jpg の) PUT は1フレーム1回にする。
+            # 記録用は .jfif で置き、ダッシュボードが表示する {cameraId}/latest.jpg だけを通知させる。
+            # remote では撮影ごとに Lambda が通知するので、latest も通知しない拡張子で置く
+            latest = "latest.jpg" if config.capture_mode == "local" else quiet_name("latest.jpg")
+            self.storage.submit_bytes(
+                data, quiet_name(f"{int(ts * 1000)}.jpg"), self.camera_id,
+                metadata=metadata, priority=priority, purpose="cameras"
+            )
+            self.storage.submit_bytes(
+                data, latest, self.camera_id, metadata=metadata, priority=priority, purpose="cameras"
+            )
+
+    @property
+    def stats(self):
+        health = self.camera.health
+        with self._lock:
+            span = self._captured[-1] - self._captured[0] if len(self._captured) > 1 else 0.0
+            return {
+                "fps": (len(self._captured) - 1) / span if span > 0 else 0.0,
+                "frames": self.frames,
+                "failures": self.failures,
+                "skipped": self.skipped,
+                "throttled": self.throttled,
+                "last_encode": self.last_encode,
+                "avg_encode": self.total_encode / self.frames if self.frames else 0.0,
+                "timeouts": health["timeouts"],
+                "reopens": health["reopens"],
+            }
+
+
+class MultiCameraManager:
+    """
+    複数カメラの管理 (config.camera_specs から構成)
+
+    カメラごとに CameraManager (取得スレッド) と _CameraWorker (エンコード・投入スレッド) を持ち、
+    アップロード先は {camera_id}/ 以下に分ける。
+    """
+
+    def __init__(self, storage, specs=None):
+        specs = config.camera_specs if specs is None else specs
+        self.workers = {
+            camera_id: _CameraWorker(camera_id, CameraManager(device, camera_id=camera_id), storage)
+            for camera_id, device in specs
+        }
+        self.primary_id = specs[0][0]
+
+    @property
+    def primary(self):
+        """変化検知・緊急前映像に使う代表カメラ"""
+        return self.workers[self.primary_id].camera
+
+    def start(self):
+        for worker in self.workers.values():
+            worker.start()
+
+    def stop(self, keep_primary=False):
+        for camera_id, worker in self.workers.items():
+            if keep_primary and camera_id == self.primary_id:
+                continue
+            worker.stop()
+
+    def capture_all(self):
+        """全カメラに撮影を依頼する (待たない)"""
+        for worker in self.workers.values():
+            worker.request()
+
+    @property
+    def stats(self):
+        per_camera = {camera_id: w.stats for camera_id, w in self.workers.items()}
+        frames = sum(s["frames"] for s in per_camera.values())
+        encode = sum(s["avg_encode"] * s["frames"] for s in per_camera.values())
+        return {
+            "cameras": per_camera,
+            "fps": sum(s["fps"] for s in per_camera.values()),
+            "frames": frames,
+            "failures": sum(s["failures"] for s in per_camera.values()),
+            "avg_encode": encode / frames if frames else 0.0,
+        }
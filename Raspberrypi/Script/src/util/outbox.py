@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from util.config import config
+
+
+class Outbox:
+    """
+    送信できなかったデータを溜めておくディスク上のキュー (SQLite WAL)
+
+    - 1行 = 1メッセージ。id順 (= 投入順) に再送する
+    - 合計サイズが max_bytes を超えたら古いものから捨てる
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = config.outbox_path if path is None else path
+        self.max_bytes = config.outbox_max_bytes if max_bytes is None else max_bytes
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " meta TEXT NOT NULL,"
+            " payload BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        row = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outbox").fetchone()
+        self._count, self._bytes = row
+        self.evicted = 0
+        self.replayed = 0
+
+    def put(self, kind, payload, **meta):
+        """メッセージを追加する。kind ごとに再送ハンドラを切り替える"""
+        payload = bytes(payload)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO outbox (kind, meta, payload, size, created) VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(meta), payload, len(payload), time.time())
+            )
+            self._count += 1
+            self._bytes += len(payload)
+            self._enforce_budget()
+            self._db.commit()
+
+    def _enforce_budget(self):
+        while self._bytes > self.max_bytes and self._count > 0:
+            row = self._db.execute("SELECT id, size FROM outbox ORDER BY id LIMIT 1").fetchone()
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (row[0],))
+            self._count -= 1
+            self._bytes -= row[1]
+            self.evicted += 1
+
+    def peek(self, limit, kinds=None):
+        """
+        古い順に最大 limit 件を返す: [(id, kind, meta(dict), payload), ...]
+        kinds を渡すとその種類のメッセージだけを返す
+        """
+        query = "SELECT id, kind, meta, payload FROM outbox"
+        params = []
+        if kinds is not None:
+            if not kinds:
+                return []
+            query += f" WHERE kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [(r[0], r[1], json.loads(r[2]), r[3]) for r in rows]
+
+    def ack(self, ids):
+        """送信できたメッセージをまとめて削除する"""
+        if not ids:
+            return
+        with self._lock:
+            marks = ",".join("?" * len(ids))
+            size = self._db.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM outbox WHERE id IN ({marks})", ids
+            ).fetchone()[0]
+            cur = self._db.execute(f"DELETE FROM outbox WHERE id IN ({marks})", ids)
+            self._db.commit()
+            self._count -= cur.rowcount
+            self._bytes -= size
+            self.replayed += cur.rowcount
+
+    def kinds(self):
+        """溜まっているメッセージの種類"""
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT DISTINCT kind FROM outbox")}
+
+    def has_pending(self, kind=None):
+        with self._lock:
+            if kind is None:
+                return self._count > 0
+            return self._db.execute(
+                "SELECT 1 FROM outbox WHERE kind = ? LIMIT 1", (kind,)
+            ).fetchone() is not None
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._count,
+                "pending_bytes": self._bytes,
+                "evicted": self.evicted,
+                "replayed": self.replayed,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class OutboxReplayer:
+    """
+    Outbox を順番に再送するバックグラウンドスレッド
+
+    handlers: {kind: callable(meta, payload) -> bool}
+    先頭のメッセージが送れなかった時点でそのバッチを打ち切り、順序を保ったまま次の機会を待つ。
+    ハンドラのない種類のメッセージは再送も削除もせずに残す。
+    """
+
+    def __init__(self, outbox, handlers):
+        self.outbox = outbox
+        self.handlers = handlers
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.last_rate = 0.0  # 直近バッチの再送スループット (件/秒)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        unknown = self.outbox.kinds() - set(self.handlers)
+        if unknown:
+            print(f"⚠️ Outbox has entries with no handler (kept): {', '.join(sorted(unknown))}")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="outbox-replayer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def kick(self):
+        """接続が戻った可能性があるときに呼ぶ (すぐ再送を試みる)"""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(config.outbox_retry_interval)
+            self._wake.clear()
+            while not self._stop_event.is_set() and self.replay_batch():
+                pass
+
+    def replay_batch(self):
+        """1バッチ分再送する。全件送れてまだ残りがあれば True"""
+        batch = self.outbox.peek(config.outbox_batch_size, kinds=list(self.handlers))
+        if not batch:
+            return False
+
+        start = time.perf_counter()
+        done = []
+        for entry_id, kind, meta, payload in batch:
+            try:
+                ok = self.handlers[kind](meta, payload)
+            except Exception as e:
+                print(f"⚠️ Outbox Replay Error ({kind}): {e}")
+                ok = False
+            if not ok:
+                break
+            done.append(entry_id)
+
+        self.outbox.ack(done)
+        if done:
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            self.last_rate = len(done) / elapsed
+            stats = self.outbox.stats
+            print(f"📮 Outbox replayed {len(done)} ({self.last_rate:.1f}/s), pending={stats['pending']}")
+        return len(done) == len(batch)
@@ -0,0 +1,220 @@
+import threading
+import time
+from util.config import config
+from util.lazy import lazy_import
+from util.metrics import registry
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+INFERENCE_SECONDS = registry.histogram(
+    "elderlycam_person_inference_seconds", "人物検出1回の推論時間", ["backend"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+)
+DETECTIONS = registry.counter("elderlycam_person_detections", "人物検出の結果", ["camera", "result"])
+
+# MobileNet-SSD (Caffe) の前処理と「person」のクラスID
+_SSD_SIZE = (300, 300)
+_SSD_SCALE = 1 / 127.5
+_SSD_MEAN = 127.5
+_SSD_PERSON_CLASS = 15
+
+
+class PersonDetector:
+    """
+    OpenCV の CPU モデルによる人物検出
+
+    backend:
+      "hog": HOG + 線形SVM (OpenCV 同梱の歩行者検出器)。モデルファイル不要。立っている人向き
+      "dnn": SSD形式の出力を持つモデル (MobileNet-SSD など) を cv2.dnn の CPU 推論で使う
+             (config.person_model / person_model_config)
+
+    どちらも width px に縮小したコピーで推論し、枠は元の解像度に戻して返す。
+    """
+
+    def __init__(self, backend=None, width=None, confidence=None, model=None, model_config=None):
+        self.backend = (config.person_detector if backend is None else backend) or "hog"
+        self.width = config.person_width if width is None else width
+        self.confidence = config.person_confidence if confidence is None else confidence
+        self.model = config.person_model if model is None else model
+        self.model_config = config.person_model_config if model_config is None else model_config
+        self._hog = None
+        self._net = None
+        if self.backend not in ("hog", "dnn"):
+            raise ValueError(f"Unknown person detector: {self.backend}")
+
+    def load(self):
+        """モデルを読み込む (初回の detect() でも呼ばれる)"""
+        if self.backend == "hog" and self._hog is None:
+            self._hog = cv2.HOGDescriptor()
+            self._hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        elif self.backend == "dnn" and self._net is None:
+            if not self.model:
+                raise ValueError("PERSON_MODEL is required for the dnn detector")
+            self._net = cv2.dnn.readNet(self.model, self.model_config)
+            self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        return self
+
+    def detect(self, frame):
+        """
+        Returns: {"person": bool, "count": 人数, "confidence": 最大の確からしさ,
+                  "boxes": [(x, y, w, h), ...], "inference": 推論時間(秒)}
+        """
+        self.load()
+        h, w = frame.shape[:2]
+        ratio = min(self.width / w, 1.0)
+        small = frame if ratio == 1.0 else cv2.resize(
+            frame, (self.width, int(h * ratio)), interpolation=cv2.INTER_AREA
+        )
+
+        start = time.perf_counter()
+        if self.backend == "hog":
+            detections = self._detect_hog(small)
+        else:
+            detections = self._detect_dnn(small)
+        inference = time.perf_counter() - start
+        INFERENCE_SECONDS.labels(self.backend).observe(inference)
+
+        boxes = [tuple(int(v / ratio) for v in box) for box, score in detections if score >= self.confidence]
+        scores = [score for _, score in detections if score >= self.confidence]
+        return {
+            "person": bool(boxes),
+            "count": len(boxes),
+            "confidence": max(scores, default=0.0),
+            "boxes": boxes,
+            "inference": inference,
+        }
+
+    def _detect_hog(self, small):
+        rects, weights = self._hog.detectMultiScale(small, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        return [(tuple(int(v) for v in rect), float(np.ravel(weight)[0])) for rect, weight in zip(rects, weights)]
+
+    def _detect_dnn(self, small):
+        h, w = small.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(small, _SSD_SIZE), _SSD_SCALE, _SSD_SIZE, _SSD_MEAN)
+        self._net.setInput(blob)
+        out = self._net.forward()
+        detections = []
+        # (1, 1, N, 7): [image_id, class_id, confidence, x1, y1, x2, y2] (座標は0〜1)
+        for _, class_id, score, x1, y1, x2, y2 in out.reshape(-1, 7):
+            if int(class_id) != _SSD_PERSON_CLASS:
+                continue
+            x, y = int(x1 * w), int(y1 * h)
+            detections.append(((x, y, int(x2 * w) - x, int(y2 * h) - y), float(score)))
+        return detections
+
+
+class PersonWatcher:
+    """
+    撮影とは別のスレッドで、各カメラの最新フレームに人物検出をかけ続ける
+
+    撮影側は latest() で直近の結果を読むだけなので、推論が遅くても撮影・アップロードは待たない。
+    結果はフレームのタグ付け・アップロードの優先度・人のいないカメラの間引きに使う。
+    """
+
+    def __init__(self, cameras, detector=None, interval=None):
+        self.cameras = cameras  # {camera_id: CameraManager}
+        self.detector = PersonDetector() if detector is None else detector
+        self.interval = config.person_interval if interval is None else interval
+
+        self._lock = threading.Lock()
+        self._results = {}    # camera_id -> 直近の結果 (フレームの取得時刻 "frame_ts" 付き)
+        self._last_seen = {}  # camera_id -> 最後に人が映っていた時刻
+        self._started_at = time.time()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.analyzed = 0
+        self.detected = 0
+        self.total_inference = 0.0
+        self.errors = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            self._results.clear()
+            self._last_seen.clear()
+            self._started_at = time.time()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="person-detector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        analyzed_ts = {}
+        while not self._stop_event.is_set():
+            for camera_id, camera in self.cameras.items():
+                if self._stop_event.is_set():
+                    return
+                # 待たずに今ある最新フレームだけを見る
+                frame, ts = camera.peek_frame()
+                if frame is None or analyzed_ts.get(camera_id) == ts:
+                    continue
+                analyzed_ts[camera_id] = ts
+                try:
+                    result = self.detector.detect(frame)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"⚠️ Person Detector Error ({camera_id}): {type(e).__name__}: {e}")
+                    continue
+                self._store(camera_id, ts, result)
+            self._stop_event.wait(self.interval)
+
+    def _store(self, camera_id, ts, result):
+        result = dict(result, frame_ts=ts)
+        with self._lock:
+            self._results[camera_id] = result
+            if result["person"]:
+                self._last_seen[camera_id] = ts
+            self.analyzed += 1
+            self.detected += result["person"]
+            self.total_inference += result["inference"]
+        DETECTIONS.labels(camera_id, "person" if result["person"] else "empty").inc()
+
+    def latest(self, camera_id, max_age=None):
+        """直近の検出結果。max_age 秒より古い (または無い) 場合は None"""
+        max_age = config.person_max_age if max_age is None else max_age
+        with self._lock:
+            result = self._results.get(camera_id)
+        if result is None or time.time() - result["frame_ts"] > max_age:
+            return None
+        return result
+
+    def idle_for(self, camera_id):
+        """
+        最後に人が映ってからの秒数 (開始後一度も映っていなければ開始からの秒数)。
+        まだ一度も検出をかけていないカメラは 0 (検出器が動かない時に間引かないため)
+        """
+        with self._lock:
+            if camera_id not in self._results:
+                return 0.0
+            since = self._last_seen.get(camera_id, self._started_at)
+        return time.time() - since
+
+    @staticmethod
+    def metadata(result):
+        """S3のオブジェクトメタデータ (x-amz-meta-person*) にする"""
+        if result is None:
+            return {}
+        return {
+            "person": "true" if result["person"] else "false",
+            "person-count": str(result["count"]),
+            "person-confidence": f"{result['confidence']:.3f}",
+            "person-frame-at": f"{result['frame_ts']:.3f}",
+        }
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "analyzed": self.analyzed,
+                "detected": self.detected,
+                "errors": self.errors,
+                "avg_inference": self.total_inference / self.analyzed if self.analyzed else 0.0,
+            }
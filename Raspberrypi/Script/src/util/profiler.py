@@ -0,0 +1,313 @@
+"""
+長時間稼働向けのプロファイラ (既定では無効)
+
+有効化: PROFILE_ENABLED=true で起動時から / 実行中に SIGUSR1 でオン・オフ切り替え / SIGUSR2 で即時ダンプ
+    kill -USR1 $(pgrep -f main.py)
+
+- 全スレッドのスタックを一定間隔でサンプリングし、collapsed 形式 (flamegraph.pl / speedscope で読める) に集計する。
+  待機中のスレッドも含む wall-clock のサンプル。先頭のフレームはスレッド名
+- tracemalloc のスナップショットを前回と比較し、増えた確保元を traceback 付きで書き出す
+- RSS と tracemalloc の差 (OpenCV などネイティブ側の確保) と、スレッドの生成数 (名前ごと) も記録する
+
+config.profile_dump_interval ごとに profile_dir へ stacks-*.folded / memory-*.txt を書き、
+古いものから profile_keep 個を超えた分を消す。
+"""
+import glob
+import os
+import re
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from util.config import config
+from util.metrics import registry
+
+PROFILER_SAMPLES = registry.counter("elderlycam_profiler_samples", "プロファイラのスタックサンプル数")
+THREADS = registry.gauge("elderlycam_threads", "生存しているスレッド数")
+RESIDENT_BYTES = registry.gauge("elderlycam_resident_bytes", "プロセスのRSS (バイト)")
+
+_SERIAL = re.compile(r"-\d+")
+
+_profiler = None
+# toggle() が判定と start() / stop() を同じロックの中で行うので再入可能にする
+_lock = threading.RLock()
+
+
+def resident_bytes():
+    """VmRSS (Linux 以外は 0)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+THREADS.set_function(threading.active_count)
+RESIDENT_BYTES.set_function(resident_bytes)
+
+
+def _thread_kind(name):
+    """"Thread-12 (worker)" / "s3-upload-3" のような連番を落として同じ種類のスレッドをまとめる"""
+    return _SERIAL.sub("", name).replace(";", ":")
+
+
+class Profiler:
+    def __init__(self, directory, sample_interval=0.05, dump_interval=300.0, keep=24, memory_frames=8):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.dump_interval = dump_interval
+        self.keep = keep
+        self.memory_frames = memory_frames
+
+        self._stacks = {}        # (スレッドの種類, コードオブジェクトの列) -> サンプル数 (前回ダンプ以降)
+        self._labels = {}        # コードオブジェクト -> フレーム名
+        self._seen = weakref.WeakSet()  # 一度でもサンプルに現れたスレッド
+        self._alive = {}         # 種類 -> 生存数 (直近のサンプル)
+        self._started = {}       # 種類 -> 前回ダンプ以降に現れたスレッド数 (サンプル間隔より短命なものは数えられない)
+        self._data_lock = threading.Lock()
+        self._dump_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._snapshot = None
+        self._owns_tracemalloc = False  # start() で tracemalloc を始めたか (止めるのはその場合だけ)
+        self._window_start = time.time()
+        self.samples = 0
+        self.sample_time = 0.0   # サンプリング自体にかかった時間(秒)
+        self.dumps = 0
+
+    # ---- 開始・終了 ----
+
+    def start(self):
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start(self.memory_frames)
+        self._snapshot = self._take_snapshot()
+        self._window_start = time.time()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+        self._thread.start()
+        print(f"🔬 Profiler started: {self.directory} "
+              f"(sample {self.sample_interval * 1000:.0f}ms, dump every {self.dump_interval:.0f}s)")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.dump()
+        # PYTHONTRACEMALLOC など外で始めたトレースは止めない
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+        self._snapshot = None
+        overhead = self.sample_time / self.samples * 1e6 if self.samples else 0.0
+        print(f"🔬 Profiler stopped: samples={self.samples} dumps={self.dumps} avg_sample={overhead:.0f}µs")
+
+    # ---- サンプリング ----
+
+    def _loop(self):
+        next_dump = time.monotonic() + self.dump_interval
+        while not self._stop_event.wait(self.sample_interval):
+            self._sample()
+            if time.monotonic() >= next_dump:
+                next_dump = time.monotonic() + self.dump_interval
+                try:
+                    self.dump()
+                except Exception as e:
+                    print(f"⚠️ Profiler Dump Error: {e}")
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            path = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+            label = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _sample(self):
+        begin = time.perf_counter()
+        me = threading.get_ident()
+        threads = {t.ident: t for t in threading.enumerate()}
+        frames = sys._current_frames()
+        stacks = []
+        alive = {}
+        started = []
+        for ident, frame in frames.items():
+            if ident == me:
+                continue
+            thread = threads.get(ident)
+            kind = _thread_kind(thread.name) if thread is not None else "unknown"
+            alive[kind] = alive.get(kind, 0) + 1
+            if thread is not None and thread not in self._seen:
+                self._seen.add(thread)
+                started.append(kind)
+            # 文字列にするのはダンプ時だけ (サンプリングはコードオブジェクトを集めるだけ)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            stacks.append((kind, tuple(codes)))
+        del frames
+
+        with self._data_lock:
+            for stack in stacks:
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+            for kind in started:
+                self._started[kind] = self._started.get(kind, 0) + 1
+            self._alive = alive
+            self.samples += 1
+            self.sample_time += time.perf_counter() - begin
+        PROFILER_SAMPLES.inc()
+
+    # ---- ダンプ ----
+
+    def _take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+            # プロファイラ自身 (レポート作成時の linecache など) の確保は除く
+            tracemalloc.Filter(False, __file__, all_frames=True),
+        ])
+
+    def dump(self):
+        """前回ダンプ以降のスタックとメモリの差分をファイルに書く"""
+        with self._dump_lock:
+            with self._data_lock:
+                stacks, self._stacks = self._stacks, {}
+                started, self._started = self._started, {}
+                alive = dict(self._alive)
+                samples, sample_time = self.samples, self.sample_time
+            now = time.time()
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{self.dumps % 1000:03d}"
+
+            lines = sorted(
+                ";".join([kind] + [self._label(code) for code in reversed(codes)]) + f" {count}"
+                for (kind, codes), count in stacks.items()
+            )
+            self._write(f"stacks-{stamp}.folded", "\n".join(lines) + ("\n" if lines else ""))
+
+            report = self._memory_report(now, started, alive, samples, sample_time)
+            self._write(f"memory-{stamp}.txt", report)
+            self._window_start = now
+            self.dumps += 1
+            for prefix in ("stacks-", "memory-"):
+                self._rotate(prefix)
+        print(f"🔬 Profile dumped: {stamp} ({len(stacks)} stacks)")
+
+    def _memory_report(self, now, started, alive, samples, sample_time):
+        window = now - self._window_start
+        rss = resident_bytes()
+        lines = [
+            f"# {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))} window={window:.0f}s",
+            f"rss: {rss / 1e6:.1f} MB",
+        ]
+        if tracemalloc.is_tracing() and self._snapshot is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"traced: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)")
+            # Python から見えない確保 (OpenCV / numpy の内部など)
+            lines.append(f"untraced (rss - traced): {(rss - current) / 1e6:.1f} MB")
+
+        lines.append(f"threads: alive={sum(alive.values()) + 1} (incl. profiler)")
+        for kind in sorted(set(alive) | set(started)):
+            lines.append(f"  {kind}: alive={alive.get(kind, 0)} started={started.get(kind, 0)}")
+        if samples:
+            overhead = sample_time / max(samples * self.sample_interval, 1e-9)
+            lines.append(f"sampler: samples={samples} avg={sample_time / samples * 1e6:.0f}µs "
+                         f"overhead={overhead:.2%}")
+
+        if tracemalloc.is_tracing() and self._snapshot is not None:
+            snapshot = self._take_snapshot()
+            diffs = snapshot.compare_to(self._snapshot, "traceback")
+            self._snapshot = snapshot
+            growth = [d for d in diffs if d.size_diff > 0][:15]
+            lines.append("")
+            lines.append(f"## top allocations grown since last dump ({len(growth)})")
+            for d in growth:
+                lines.append(f"+{d.size_diff / 1024:.1f} KiB ({d.count_diff:+d} blocks) "
+                             f"total={d.size / 1024:.1f} KiB")
+                lines.extend(f"    {line}" for line in d.traceback.format(most_recent_first=True))
+        return "\n".join(lines) + "\n"
+
+    def _write(self, name, text):
+        path = os.path.join(self.directory, name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def _rotate(self, prefix):
+        files = sorted(glob.glob(os.path.join(self.directory, prefix + "*")))
+        for path in files[:max(len(files) - self.keep, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def start(directory=None):
+    """プロファイルを開始する (動いていれば何もしない)"""
+    global _profiler
+    with _lock:
+        if _profiler is None:
+            _profiler = Profiler(
+                directory or config.profile_dir,
+                sample_interval=config.profile_sample_interval,
+                dump_interval=config.profile_dump_interval,
+                keep=config.profile_keep,
+            )
+            _profiler.start()
+        return _profiler
+
+
+def stop():
+    global _profiler
+    with _lock:
+        profiler, _profiler = _profiler, None
+        if profiler is not None:
+            profiler.stop()
+
+
+def toggle():
+    with _lock:
+        if _profiler is None:
+            start()
+        else:
+            stop()
+
+
+def dump():
+    profiler = _profiler
+    if profiler is not None:
+        profiler.dump()
+
+
+def install_signal_handlers(loop=None):
+    """
+    SIGUSR1: オン・オフ切り替え / SIGUSR2: 即時ダンプ
+    ファイル書き出しがあるのでハンドラ内ではスレッドを起こすだけにする。
+    メインスレッド以外や SIGUSR1 のない環境では何もしない。
+    """
+    def spawn(fn):
+        threading.Thread(target=fn, name="profiler-signal", daemon=True).start()
+
+    handlers = (("SIGUSR1", toggle), ("SIGUSR2", dump))
+    for sig_name, fn in handlers:
+        sig = getattr(signal, sig_name, None)
+        if sig is None:
+            continue
+        try:
+            if loop is not None:
+                loop.add_signal_handler(sig, spawn, fn)
+            else:
+                signal.signal(sig, lambda signum, frame, fn=fn: spawn(fn))
+        except (ValueError, RuntimeError, NotImplementedError):
+            return False
+    return True
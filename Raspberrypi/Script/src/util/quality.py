@@ -0,0 +1,100 @@
+import threading
+from util.config import config
+from util.lazy import lazy_import
+from util.metrics import registry
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+QUALITY_SCORE = registry.histogram(
+    "elderlycam_frame_quality", "送ったフレームの品質スコア (0〜1)",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+)
+BURST_DISCARDED = registry.counter("elderlycam_burst_discarded", "連写で選ばれずに捨てたフレーム数")
+
+
+class QualityScorer:
+    """
+    フレームの品質スコア
+
+    縮小したグレースケール画像から NumPy で
+      sharpness:  ラプラシアンの分散 (ブレ・ピンボケで小さくなる)
+      brightness: 平均輝度 (0〜1)
+      clipped:    黒つぶれ・白飛びした画素の割合
+    を求め、score = sharpness/(sharpness+sharpness_ref) × 露出の良さ × (1 - clipped) にまとめる (0〜1)。
+    """
+
+    def __init__(self, width=None, sharpness_ref=None, clip_low=8, clip_high=247):
+        self.width = config.quality_width if width is None else width
+        self.sharpness_ref = config.quality_sharpness_ref if sharpness_ref is None else sharpness_ref
+        self.clip_low = clip_low
+        self.clip_high = clip_high
+
+        self._lock = threading.Lock()
+        self.bursts = 0
+        self.scored = 0
+        self.total_best = 0.0
+        self.total_score = 0.0
+
+    def prepare(self, frame):
+        h, w = frame.shape[:2]
+        if w > self.width:
+            frame = cv2.resize(frame, (self.width, int(h * self.width / w)), interpolation=cv2.INTER_AREA)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame
+
+    def measure(self, frame):
+        """Returns: {"score", "sharpness", "brightness", "clipped"}"""
+        gray = self.prepare(frame)
+        g = gray.astype(np.float32)
+        # 4近傍ラプラシアン
+        lap = g[1:-1, :-2] + g[1:-1, 2:] + g[:-2, 1:-1] + g[2:, 1:-1] - 4.0 * g[1:-1, 1:-1]
+        sharpness = float(lap.var())
+        brightness = float(g.mean()) / 255.0
+        clipped = float(np.count_nonzero((gray <= self.clip_low) | (gray >= self.clip_high))) / gray.size
+
+        exposure = max(1.0 - abs(brightness - 0.5) / 0.5, 0.0)
+        score = sharpness / (sharpness + self.sharpness_ref) * exposure * (1.0 - clipped)
+        return {"score": score, "sharpness": sharpness, "brightness": brightness, "clipped": clipped}
+
+    def best(self, frames):
+        """
+        [(frame, ts), ...] から最もスコアの高いものを選ぶ。
+        Returns: (frame, ts, 品質)。空なら (None, 0.0, None)
+        """
+        if not frames:
+            return None, 0.0, None
+
+        scored = [(self.measure(frame), frame, ts) for frame, ts in frames]
+        quality, frame, ts = max(scored, key=lambda item: item[0]["score"])
+        with self._lock:
+            self.bursts += 1
+            self.scored += len(scored)
+            self.total_best += quality["score"]
+            self.total_score += sum(q["score"] for q, _, _ in scored)
+        QUALITY_SCORE.observe(quality["score"])
+        BURST_DISCARDED.inc(len(scored) - 1)
+        return frame, ts, quality
+
+    @staticmethod
+    def metadata(quality):
+        """S3のオブジェクトメタデータ (x-amz-meta-quality-*) にする"""
+        if not quality:
+            return {}
+        return {
+            "quality-score": f"{quality['score']:.4f}",
+            "quality-sharpness": f"{quality['sharpness']:.1f}",
+            "quality-brightness": f"{quality['brightness']:.3f}",
+            "quality-clipped": f"{quality['clipped']:.4f}",
+        }
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                "bursts": self.bursts,
+                "scored": self.scored,
+                "avg_best": self.total_best / self.bursts if self.bursts else 0.0,
+                "avg_score": self.total_score / self.scored if self.scored else 0.0,
+            }
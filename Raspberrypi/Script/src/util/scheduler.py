@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+from util.config import config
+
+
+class FixedPolicy:
+    """常に一定間隔"""
+
+    def __init__(self, interval=None):
+        self.interval = config.image_interval if interval is None else interval
+
+    def interval_for(self, since_start):
+        return self.interval
+
+    @property
+    def min_interval(self):
+        """最も短い間隔 (撮影側をこれ以上速く回しても使われない)"""
+        return self.interval
+
+
+class BurstDecayPolicy:
+    """
+    ALERT直後は短い間隔で連写し、その後 decay 秒かけて通常間隔へ戻す
+    """
+
+    def __init__(self, burst_interval=None, burst_seconds=None, steady_interval=None, decay_seconds=None):
+        self.burst_interval = config.schedule_burst_interval if burst_interval is None else burst_interval
+        self.burst_seconds = config.schedule_burst_seconds if burst_seconds is None else burst_seconds
+        self.steady_interval = config.image_interval if steady_interval is None else steady_interval
+        self.decay_seconds = config.schedule_decay_seconds if decay_seconds is None else decay_seconds
+
+    def interval_for(self, since_start):
+        if since_start < self.burst_seconds:
+            return self.burst_interval
+        if self.decay_seconds <= 0:
+            return self.steady_interval
+        ratio = min((since_start - self.burst_seconds) / self.decay_seconds, 1.0)
+        return self.burst_interval + (self.steady_interval - self.burst_interval) * ratio
+
+    @property
+    def min_interval(self):
+        return min(self.burst_interval, self.steady_interval)
+
+
+POLICIES = {
+    "fixed": FixedPolicy,
+    "burst": BurstDecayPolicy,
+}
+
+
+def make_policy(name=None):
+    name = config.schedule_policy if name is None else name
+    if name not in POLICIES:
+        print(f"⚠️ Unknown schedule policy: {name}. Using fixed.")
+        name = "fixed"
+    return POLICIES[name]()
+
+
+class MonotonicClock:
+    """実時間の時計 (CaptureScheduler の既定)"""
+
+    def now(self):
+        return time.monotonic()
+
+    def wait(self, event, seconds):
+        """seconds 秒待つ。event がセットされたら True (threading.Event.wait と同じ)"""
+        return event.wait(seconds)
+
+    def enter(self):
+        """撮影スレッドが動き出す (仮想時間の時計が足並みを揃えるためのもの。実時間では何もしない)"""
+
+    def leave(self):
+        """撮影スレッドが終わる"""
+
+
+class CaptureScheduler:
+    """
+    固定レートのクロックで撮影タイミングを決める
+
+    - 次の発火時刻は「前回の予定時刻 + 間隔」。処理時間で周期がずれない
+    - 処理が間隔を超えて遅れた場合、溜まった分を連続発火せずに1回だけ発火する (overlap control)
+    - load_fn() が返す {"queue_depth", "latency"} が閾値を超えたら間隔を広げる (backoff)
+    - 時刻は clock (now() / wait(event, 秒)) で測る。トレース再生では仮想時間の時計に差し替える
+    """
+
+    def __init__(self, policy=None, load_fn=None, clock=None):
+        self.policy = make_policy() if policy is None else policy
+        self.load_fn = load_fn
+        self.clock = MonotonicClock() if clock is None else clock
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._next_at = None
+        self._backoff = 1.0
+        self._fired = deque(maxlen=30)
+        self.skipped = 0
+
+    def reset(self):
+        """撮影セッションを始める。この後、撮影スレッドが wait() を呼ぶ"""
+        self.clock.enter()
+        with self._lock:
+            self._started_at = self.clock.now()
+            self._next_at = self._started_at
+            self._backoff = 1.0
+            self._fired.clear()
+            self.skipped = 0
+
+    def _update_backoff(self):
+        if self.load_fn is None:
+            return
+        try:
+            load = self.load_fn()
+        except Exception:
+            return
+        saturated = (
+            load.get("queue_depth", 0) >= config.schedule_queue_high
+            or load.get("latency", 0.0) >= config.schedule_latency_high
+        )
+        if saturated:
+            self._backoff = min(self._backoff * 2, config.schedule_max_backoff)
+        else:
+            self._backoff = max(self._backoff / 2, 1.0)
+
+    def current_interval(self):
+        since = 0.0 if self._started_at is None else self.clock.now() - self._started_at
+        return self.policy.interval_for(since) * self._backoff
+
+    def _ensure_started(self):
+        # self._lock を保持した状態で呼ぶ
+        if self._started_at is None:
+            self._started_at = self.clock.now()
+            self._next_at = self._started_at
+
+    def time_until_next(self):
+        with self._lock:
+            self._ensure_started()
+            return max(self._next_at - self.clock.now(), 0.0)
+
+    def wait(self, stop_event):
+        """次の発火時刻まで待つ。stop_event がセットされたら False"""
+        delay = self.time_until_next()
+        if delay > 0 and self.clock.wait(stop_event, delay):
+            return False
+        if stop_event.is_set():
+            self.clock.leave()
+            return False
+        self.tick()
+        return True
+
+    def tick(self):
+        """発火を記録して次の予定時刻を決める"""
+        with self._lock:
+            self._ensure_started()
+            now = self.clock.now()
+            self._fired.append(now)
+            self._update_backoff()
+            self._next_at += self.current_interval()
+            if self._next_at < now:
+                # 遅れ分は取り戻さずに今から数え直す
+                missed = int((now - self._next_at) // max(self.current_interval(), 1e-3)) + 1
+                self.skipped += missed
+                self._next_at = now
+
+    @property
+    def achieved_fps(self):
+        with self._lock:
+            if len(self._fired) < 2:
+                return 0.0
+            span = self._fired[-1] - self._fired[0]
+            return (len(self._fired) - 1) / span if span > 0 else 0.0
+
+    @property
+    def stats(self):
+        fps = self.achieved_fps
+        with self._lock:
+            return {
+                "fps": fps,
+                "interval": self.current_interval(),
+                "backoff": self._backoff,
+                "skipped": self.skipped,
+            }
@@ -1,31 +1,118 @@
 import threading
 import time
+from util import trace
 from util.config import config
-import requests
+from util.frame_buffer import FrameRingBuffer
+from util.motion import ChangeDetector
+from util.quality import QualityScorer
+from util.person import PersonWatcher
+from util.clip import ClipBuilder
+from util.http_client import LambdaTrigger
+from util.storage import quiet_name
+from util.scheduler import CaptureScheduler
+from util.latency import StageLatency
+from util.metrics import registry
+from util.lazy import lazy_import
+
+requests = lazy_import("requests")
+
+STAGE_SECONDS = registry.histogram("elderlycam_capture_stage_seconds", "撮影1回の段階ごとの時間", ["mode", "stage"])
+FIRST_CAPTURE_SECONDS = registry.histogram(
+    "elderlycam_button_to_first_capture_seconds",
+    "ボタン押下から最初の撮影完了まで (local: アップロード完了 / remote: Lambda応答)", ["mode"]
+)
 
 class SurveillanceService:
-    def __init__(self, camera_manager, storage_manager):
+    def __init__(self, camera_manager, storage_manager, cameras=None, notify=None, clock=None):
         self.camera = camera_manager
         self.storage = storage_manager
+        # 複数カメラ構成 (MultiCameraManager)。camera_manager はその代表カメラ
+        self.cameras = cameras
+        # 撮影したフレームのアップロード投入先 (StorageManager.submit_bytes と同じ呼び方で Future を返す)。
+        # asyncio版はイベントループ側の上限付きキューに差し替える
+        self.submit_upload = storage_manager.submit_bytes
+        # capture_mode == "local" の時にアップロード完了を知らせるコールバック (dict を受け取る)
+        self.notify = notify
+        self.latency = StageLatency(histogram=STAGE_SECONDS, labels=(config.capture_mode,))
+        # ボタン押下時刻 (perf_counter)。最初の撮影完了までの時間を測ったら None に戻す
+        self._alert_requested_at = None
         self._thread = None
         self._stop_event = threading.Event()
-        
+
+        # 緊急前映像 (MONITORING中に録っておき、ALERTで先頭にアップロード)
+        self.prealert = None
+        if config.prealert_seconds > 0:
+            self.prealert = FrameRingBuffer(
+                max_frames=int(config.prealert_seconds / config.prealert_interval) + 1,
+                max_bytes=config.prealert_max_bytes,
+                max_age=config.prealert_seconds
+            )
+        self._recorder_thread = None
+        self._recorder_stop = threading.Event()
+
+        self.detector = ChangeDetector() if config.motion_enabled else None
+        self.quality = QualityScorer() if config.quality_enabled else None
+        # ALERTセッションのクリップ (ローカル撮影のフレームを動画にまとめる)
+        self.clip = ClipBuilder(self.storage, notify=self._emit) if config.clip_mode != "off" else None
+        self._clip_live_frames = 0  # このセッションでクリップに積んだライブ映像の枚数
+        # 人物検出 (撮影とは別スレッド)。結果でタグ付け・アップロード優先度・カメラの間引きを決める
+        self.person = None
+        if config.person_detector:
+            if cameras:
+                self.person = PersonWatcher({cid: w.camera for cid, w in cameras.workers.items()})
+                for worker in cameras.workers.values():
+                    worker.person = self.person
+            else:
+                self.person = PersonWatcher({self.camera.camera_id: self.camera})
+        self.trigger = LambdaTrigger()
+        # clock: 撮影間隔を測る時計 (既定は実時間。trace_replay.py は再生用の VirtualClock を渡す)
+        self.scheduler = CaptureScheduler(load_fn=self._uplink_load, clock=clock)
+
+        # 撮影・エンコード・変化検知を別プロセスで行う (代表カメラのみ)
+        self.pipeline = None
+        if config.pipeline_mode == "shm":
+            from util.shm_pipeline import ShmPipeline
+            # 発火より速く撮っても捨てるだけなので、撮影・エンコード・解析はスケジューラの最短間隔に合わせる
+            interval = self.scheduler.policy.min_interval
+            self.pipeline = ShmPipeline(device=self.camera.device_index, fps=1 / interval if interval > 0 else 0)
+
+    def mark_alert_requested(self, at):
+        """ボタン押下を受けた時刻を記録する (最初の撮影完了までの計測用)"""
+        self._alert_requested_at = at
+
+    def _observe_first_capture(self, done):
+        requested = self._alert_requested_at
+        if requested is not None and done >= requested:
+            self._alert_requested_at = None
+            FIRST_CAPTURE_SECONDS.labels(config.capture_mode).observe(done - requested)
+            print(f"⏱️ Button -> First capture: {(done - requested) * 1000:.0f} ms")
+
     def _handle_state_change(self, new_status):
+        # カメラは開いたまま録画とキャプチャを切り替える
         if new_status == "alert":
+            self.stop_prealert(release_camera=False)
             self.start_monitoring()
         else:
-            self.stop_monitoring()
+            # 緊急前映像を録らないならカメラは手放す
+            self.stop_monitoring(release_camera=self.prealert is None)
+            self.start_prealert()
 
     def start_monitoring(self):
         if self._thread and self._thread.is_alive():
             return
 
         print("📸 Alert: Capture loop starting...")
+        self._start_sources()
+        if self.detector:
+            self.detector.reset()
+        self._start_alert_workers()
+        self.scheduler.reset()
+        self.latency.reset()
         self._stop_event.clear()
-        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread = threading.Thread(target=self._capture_loop, name="capture-loop", daemon=True)
         self._thread.start()
 
-    def stop_monitoring(self):
+    def stop_monitoring(self, release_camera=True):
         if not self._thread or not self._thread.is_alive():
             return
 
@@ -33,19 +120,412 @@ class SurveillanceService:
         self._stop_event.set()
         self._thread.join(timeout=2)
         self._thread = None
+        self._stop_sources()
+        if release_camera:
+            self._release_camera_if_idle()
+        if self.detector:
+            stats = self.detector.stats
+            print(f"📊 Motion: kept={stats['kept']} dropped={stats['dropped']} ({stats['drop_ratio']:.0%})")
+        self._stop_alert_workers()
+        if self.quality:
+            stats = self.quality.stats
+            print(f"📊 Quality: bursts={stats['bursts']} scored={stats['scored']} "
+                  f"avg_best={stats['avg_best']:.3f} avg_all={stats['avg_score']:.3f}")
+        if self.cameras:
+            stats = self.cameras.stats
+            print(f"📊 Cameras: {stats['fps']:.2f} fps frames={stats['frames']} "
+                  f"failures={stats['failures']} encode={stats['avg_encode'] * 1000:.1f}ms")
+            for camera_id, s in stats["cameras"].items():
+                print(f"   📷 {camera_id}: {s['fps']:.2f} fps frames={s['frames']} failures={s['failures']} "
+                      f"skipped={s['skipped']} encode={s['avg_encode'] * 1000:.1f}ms "
+                      f"timeouts={s['timeouts']} reopens={s['reopens']} throttled={s['throttled']}")
+        health = self.camera.health
+        print(f"📊 Camera: frames={health['frames']} no_frame={health['no_frame']} timeouts={health['timeouts']} "
+              f"reopens={health['reopens']} read_errors={health['read_errors']} stuck={health['stuck_readers']}")
+        for name, s in self.camera.encoder.stats.items():
+            if s["frames"]:
+                print(f"📊 Rendition {name}: {s['avg_bytes'] / 1024:.1f}KB/frame "
+                      f"encode={s['avg_encode'] * 1000:.1f}ms frames={s['frames']}")
+        stats = self.storage.stats
+        print(f"📊 Upload: ok={stats['uploaded']} failed={stats['failed']} dropped={stats['dropped']} "
+              f"queue={stats['queue_depth']} avg={stats['avg_latency'] * 1000:.0f}ms")
+        stats = self.scheduler.stats
+        print(f"📊 Schedule: {stats['fps']:.2f} fps interval={stats['interval']:.1f}s "
+              f"backoff=x{stats['backoff']:g} skipped={stats['skipped']}")
+        for stage, s in self.latency.stats.items():
+            print(f"📊 Latency {config.capture_mode}/{stage}: avg={s['avg'] * 1000:.0f}ms "
+                  f"p50={s['p50'] * 1000:.0f}ms p95={s['p95'] * 1000:.0f}ms n={s['count']}")
+        stats = self.trigger.stats
+        print(f"📊 Lambda: calls={stats['calls']} reused={stats['reused']} "
+              f"avg={stats['avg_request'] * 1000:.0f}ms handshake={stats['avg_handshake'] * 1000:.0f}ms")
         print("👁️ Capture loop stopped.")
 
+    def start_pipeline(self):
+        """共有メモリパイプラインのプロセスを一時停止の状態で起動しておく (ALERTのたびに起動し直さない)"""
+        if self.pipeline:
+            self.pipeline.start(paused=True)
+
+    def _start_sources(self):
+        """ALERT中の撮影元 (共有メモリパイプライン、またはカメラの取得スレッドとカメラごとのワーカー) を開く"""
+        if self.pipeline:
+            # デバイスは撮影プロセスが開くので、こちらの取得スレッドは止めて手放す
+            self.camera.stop()
+            self.start_pipeline()
+            self.pipeline.resume()
+            return
+        self.camera.start()
+        if self.cameras:
+            self.cameras.start()
+
+    def _stop_sources(self):
+        """_start_sources() で開いたものを止める。代表カメラは緊急前映像のために残す"""
+        if self.pipeline:
+            self.pipeline.pause()
+            stats = self.pipeline.stats
+            print(f"📊 Pipeline: capture={stats['capture_fps']:.1f} fps encode={stats['encode_fps']:.1f} fps "
+                  f"dropped={stats['dropped']} analyzed={stats['analyzed']}")
+        elif self.cameras:
+            self.cameras.stop(keep_primary=True)
+
+    def _start_alert_workers(self):
+        """ALERT中だけ動かす補助スレッド (人物検出・クリップ作成) を始める"""
+        if self.person and not self.pipeline:
+            self.person.start()
+        if self.clip:
+            self.clip.start()
+            self._clip_live_frames = 0
+
+    def _stop_alert_workers(self):
+        """補助スレッドを止める。クリップは残りのフレームで最後の1本を作って送る"""
+        if self.clip:
+            self.clip.finish()
+            stats = self.clip.stats
+            print(f"📊 Clip: clips={stats['clips']} frames={stats['frames']} dropped={stats['dropped']} "
+                  f"{stats['clip_bytes'] / 1024:.0f}KB vs raw JPEG {stats['raw_bytes'] / 1024:.0f}KB "
+                  f"(x{stats['compression']:.1f}) encode={stats['avg_encode']:.2f}s/clip")
+        if self.person:
+            self.person.stop()
+            stats = self.person.stats
+            print(f"📊 Person: analyzed={stats['analyzed']} detected={stats['detected']} "
+                  f"avg_inference={stats['avg_inference'] * 1000:.0f}ms errors={stats['errors']}")
+
+    def start_prealert(self):
+        """MONITORING中の低レート録画を開始する"""
+        if self.prealert is None:
+            return
+        if self._recorder_thread and self._recorder_thread.is_alive():
+            return
+
+        self.camera.start()
+        self._recorder_stop.clear()
+        self._recorder_thread = threading.Thread(target=self._prealert_loop, name="prealert-recorder", daemon=True)
+        self._recorder_thread.start()
+        print(f"⏺️ Pre-alert recording ({config.prealert_seconds}s)")
+
+    def stop_prealert(self, release_camera=True):
+        if not self._recorder_thread or not self._recorder_thread.is_alive():
+            return
+
+        self._recorder_stop.set()
+        self._recorder_thread.join(timeout=2)
+        self._recorder_thread = None
+        if release_camera:
+            self._release_camera_if_idle()
+
+    def shutdown(self):
+        self.stop_prealert()
+        self.stop_monitoring()
+        if self.pipeline:
+            self.pipeline.stop()
+        if self.cameras:
+            self.cameras.stop()
+        self.camera.stop()
+        # 緊急時の最後のフレームを送り切る
+        self.storage.shutdown()
+        self.trigger.close()
+
+    def _release_camera_if_idle(self):
+        capturing = self._thread is not None and self._thread.is_alive()
+        recording = self._recorder_thread is not None and self._recorder_thread.is_alive()
+        if not capturing and not recording:
+            self.camera.stop()
+
+    def _prealert_loop(self):
+        last_ts = 0.0
+        while not self._recorder_stop.is_set():
+            frame, ts = self._read_frame("prealert")
+            # 同じフレームを二重に積まない
+            if frame is not None and ts != last_ts:
+                data = self.camera.encode(frame, quality=config.prealert_jpeg_quality)
+                if data is not None:
+                    self.prealert.append(data, ts)
+                    last_ts = ts
+            self._recorder_stop.wait(config.prealert_interval)
+
+    def _flush_prealert(self):
+        """
+        緊急前映像を古い順にアップロードキューへ積む (ライブ映像より先)。
+        1枚ずつ LINE に通知されないよう、S3の通知が反応しない拡張子で置く
+        """
+        if self.prealert is None:
+            return
+
+        frames = self.prealert.drain()
+        if not frames:
+            return
+
+        print(f"⏪ Flushing {len(frames)} pre-alert frames")
+        for frame in frames:
+            if self._stop_event.is_set():
+                break
+            if self.clip:
+                self.clip.add(frame.timestamp, bytes(frame.data))
+            filename = quiet_name(f"prealert_{int(frame.timestamp * 1000)}.jpg")
+            self.submit_upload(
+                memoryview(frame.data), filename, config.storage_folder,
+                metadata={"prealert": "true", "captured-at": f"{frame.timestamp:.3f}"}, purpose="prealert"
+            )
+
+    def trigger_remote(self):
+        """Lambda Function URLを叩いてクラウド側で撮影・通知させる"""
+        try:
+            resp = self.trigger.post({"trigger": "manual"})
+            stats = self.trigger.stats
+            conn = f"handshake {stats['last_handshake'] * 1000:.0f}ms" if stats["last_handshake"] else "reused"
+            print(f"📷 Lambda: {resp.status_code} ({stats['last_request'] * 1000:.0f}ms, {conn})")
+            return resp.ok
+        except requests.exceptions.Timeout:
+            print(f"⚠️ Lambda timeout")
+        except requests.exceptions.ConnectionError:
+            print(f"⚠️ Lambda connection error")
+        except Exception as e:
+            print(f"⚠️ Capture Error: {type(e).__name__}: {e}")
+        return False
+
+    def capture_once(self):
+        """
+        config.capture_mode に応じて1回分の撮影を行う。
+        途中で停止 (MONITORINGへの復帰) が要求されたら、アップロード・Lambda呼び出しの前で打ち切る
+        """
+        if self._stop_event.is_set():
+            return False
+        if config.capture_mode == "local":
+            return self.capture_local()
+
+        if self.cameras:
+            # カメラごとのワーカーへ依頼 ({camera_id}/ 以下にアップロード)
+            self.cameras.capture_all()
+        if self._stop_event.is_set():
+            return False
+        start = time.perf_counter()
+        ok = self.trigger_remote()
+        done = time.perf_counter()
+        self.latency.record("trigger", done - start)
+        if ok:
+            self._observe_first_capture(done)
+        return ok
+
+    def capture_local(self):
+        """
+        このデバイスで撮影してアップロードキューへ積み、
+        代表レンディションのアップロードが終わったら通知イベントを出す。
+        段階ごとの所要時間 (capture / encode / upload / notify / total) を記録する。
+        """
+        if self.cameras:
+            # 各カメラのワーカーが撮影・アップロードまで行う
+            self.cameras.capture_all()
+            self._emit({"event": "capture", "cameras": list(self.cameras.workers), "at": time.time()})
+            return True
+
+        start = time.perf_counter()
+        frame, ts, quality = self._grab_frame()
+        captured = time.perf_counter()
+        self.latency.record("capture", captured - start)
+        if frame is None:
+            print("⚠️ No frame. Skipped.")
+            return False
+
+        renditions = self.camera.encoder.encode(frame)
+        encoded = time.perf_counter()
+        self.latency.record("encode", encoded - captured)
+        if not renditions or self._stop_event.is_set():
+            return False
+
+        if self._add_to_clip(ts, renditions):
+            return True
+        self._submit_and_notify(renditions, ts, start, encoded, quality)
+        return True
+
+    def _add_to_clip(self, ts, renditions):
+        """
+        代表レンディションのJPEGをクリップに積む。CLIP_MODE=replace で、セッション最初の1枚でなければ
+        個別のアップロード・通知を省く (True を返す)。最初の1枚は LINE 通知のため必ず個別に送る
+        """
+        if self.clip is None:
+            return False
+        representative = self.camera.encoder.representative(renditions)
+        if representative is None or not self.clip.add(ts, bytes(representative[1])):
+            return False
+        self._clip_live_frames += 1
+        return config.clip_mode == "replace" and self._clip_live_frames > 1
+
+    def _grab_frame(self):
+        """
+        送るフレームを選ぶ。品質スコアが有効なら config.burst_frames 枚を連写して最もスコアの高いものにする。
+        ボタン押下直後の1枚目は連写を待たずに最新フレームを使う。
+        Returns: (frame or None, 取得時刻, 品質 or None)
+        """
+        if self.quality is None:
+            frame, ts = self._read_frame("capture")
+            return frame, ts, None
+
+        count = 1 if self._alert_requested_at is not None else config.burst_frames
+        if count <= 1:
+            frame, ts = self.camera.latest_frame()
+            frames = [(frame, ts)] if frame is not None else []
+        else:
+            frames = self.camera.burst(count, config.burst_window)
+        trace.record("camera", {"camera": self.camera.camera_id, "purpose": "capture", "ok": bool(frames)})
+        return self.quality.best(frames)
+
+    def _read_frame(self, purpose):
+        """
+        カメラの最新フレームを読み、取得の成否を用途 (capture / prealert) つきでトレースに残す。
+        trace_replay.py は用途ごとに記録を返すので、呼ばれる順番が変わっても結果が入れ替わらない
+        Returns: (frame or None, 取得時刻)
+        """
+        frame, ts = self.camera.latest_frame()
+        trace.record("camera", {"camera": self.camera.camera_id, "purpose": purpose, "ok": frame is not None})
+        return frame, ts
+
+    def _submit_and_notify(self, renditions, ts, start, encoded, quality=None):
+        """エンコード済みのレンディションをキューへ積み、代表のアップロード完了で通知する"""
+        encoder = self.camera.encoder
+        representative = encoder.representative(renditions)
+        if representative is None:
+            return
+        filename = f"{int(ts * 1000)}.jpg"
+        person = self.person.latest(self.camera.camera_id) if self.person else None
+        metadata = {
+            "captured-at": f"{ts:.3f}", **QualityScorer.metadata(quality), **PersonWatcher.metadata(person)
+        }
+        # 人が映っているフレームは他のアップロードより先に送る
+        priority = bool(person and person["person"])
+        future = None
+        for rendition, data in renditions:
+            # 代表は (エンコードに失敗して代わりになったものも) 通知されるキーで送る
+            is_representative = rendition.name == representative[0].name
+            submitted = self.submit_upload(
+                data, filename if is_representative else encoder.key(rendition, filename), config.storage_folder,
+                metadata=metadata, priority=priority, purpose="capture" if is_representative else "rendition"
+            )
+            if is_representative:
+                future = submitted
+
+        def on_uploaded(future):
+            if future.cancelled() or not future.result():
+                return
+            uploaded = time.perf_counter()
+            self.latency.record("upload", uploaded - encoded)
+            self._observe_first_capture(uploaded)
+            event = {
+                "event": "capture",
+                "camera_id": self.camera.camera_id,
+                "key": f"{config.storage_folder}/{filename}",
+                "captured_at": ts,
+            }
+            if quality:
+                event["quality"] = round(quality["score"], 4)
+            if person:
+                event["person"] = person["person"]
+            self._emit(event)
+            done = time.perf_counter()
+            self.latency.record("notify", done - uploaded)
+            self.latency.record("total", done - start)
+
+        future.add_done_callback(on_uploaded)
+
+    def _emit(self, event):
+        if self.notify is None:
+            return
+        try:
+            self.notify(event)
+        except Exception as e:
+            print(f"⚠️ Notify Error: {type(e).__name__}: {e}")
+
+    def _uplink_load(self):
+        """回線の混み具合 (スケジューラのbackoff判定用)"""
+        return {
+            "queue_depth": self.storage.queue_depth,
+            "latency": max(self.storage.avg_latency, self.trigger.last_request),
+        }
+
+    def _has_changed(self):
+        """
+        静止していて送る必要がなければ False。カメラが使えない時は送る側に倒す。
+        フレームは待たずに今あるものを見る (remote でも Lambda の呼び出しを遅らせない)
+        """
+        if self.detector is None:
+            return True
+        frame, ts = self.camera.peek_frame()
+        if frame is None:
+            trace.record("camera", {"camera": self.camera.camera_id, "purpose": "motion", "ok": False})
+            return True
+        # ALERT 直後は reset() で参照フレームがないので比べずに通り、このフレームが参照になる
+        keep = self.detector.keep(frame, ts)
+        score = self.detector.last_score
+        trace.record("camera", {
+            "camera": self.camera.camera_id, "purpose": "motion", "ok": True, "keep": keep, "score": round(score, 4)
+        })
+        if not keep:
+            print(f"💤 No change (score={score:.3f}). Skipped.")
+        return keep
+
+    def _upload_pipeline_frame(self):
+        """共有メモリパイプラインの最新フレームを送る (エンコード・スコア計算は済んでいる)"""
+        latest = self.pipeline.take_latest()
+        if latest is None:
+            print("⚠️ Pipeline: no frame yet")
+            return
+
+        ts, renditions, score = latest
+        if not renditions:
+            print("⚠️ Pipeline: encode failed. Skipped.")
+            return
+        if self.detector and score is not None and not self.detector.keep_score(score, ts):
+            print(f"💤 No change (score={score:.3f}). Skipped.")
+            return
+
+        if config.capture_mode == "local":
+            if self._add_to_clip(ts, renditions):
+                return
+            now = time.perf_counter()
+            self._submit_and_notify(renditions, ts, now, now)
+            return
+
+        # 通知は trigger_remote() の Lambda が行うので、代表も通知しない拡張子で置く
+        encoder = self.camera.encoder
+        metadata = {"captured-at": f"{ts:.3f}"}
+        for rendition, data in renditions:
+            key = quiet_name(encoder.key(rendition, f"{int(ts * 1000)}.jpg"))
+            purpose = "capture" if rendition.name == encoder.primary.name else "rendition"
+            self.submit_upload(data, key, config.storage_folder, metadata=metadata, purpose=purpose)
+        start = time.perf_counter()
+        self.trigger_remote()
+        self.latency.record("trigger", time.perf_counter() - start)
+
     def _capture_loop(self):
-        while not self._stop_event.is_set():
-            try:
-                url = "https://zrv7g2ggwfbdxwm6ppeii4smdu0gjwoz.lambda-url.ap-northeast-1.on.aws/"
-                resp = requests.post(url, json={"trigger": "manual"}, timeout=10)
-                print(f"📷 Lambda: {resp.status_code}")
-            except requests.exceptions.Timeout:
-                print(f"⚠️ Lambda timeout")
-            except requests.exceptions.ConnectionError:
-                print(f"⚠️ Lambda connection error")
-            except Exception as e:
-                print(f"⚠️ Capture Error: {type(e).__name__}: {e}")
-            
-            time.sleep(config.image_interval)
\ No newline at end of file
+        try:
+            self._flush_prealert()
+        except Exception as e:
+            print(f"⚠️ Pre-alert Flush Error: {type(e).__name__}: {e}")
+
+        while self.scheduler.wait(self._stop_event):
+            if self.pipeline:
+                self._upload_pipeline_frame()
+                continue
+
+            if not self._has_changed():
+                continue
+
+            self.capture_once()
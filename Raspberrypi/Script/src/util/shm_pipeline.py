@@ -0,0 +1,396 @@
+"""
+共有メモリを使ったマルチプロセス撮影パイプライン (config.pipeline_mode == "shm")
+
+    [撮影プロセス] --生フレーム--> 共有メモリのリング (固定スロット数)
+                                   ├─> [エンコードプロセス x N] --JPEG--> 親プロセス (アップロード)
+                                   └─> [解析プロセス] --変化スコア--> 親プロセス
+
+- リングは起動時に確保した固定サイズのメモリだけを使う
+- 各スロットの状態 (FREE / WRITING / READY) と「まだ読む必要がある役割」を共有配列で管理し、
+  状態の変更は1つのロック (Condition) の中でだけ行う
+- 空きスロットがなければ、誰も読んでいない一番古いフレームを上書きする (drop-oldest)
+- ワーカーはスロットを np.ndarray として直接参照するのでコピーしない。親には符号化済みのバイト列だけが届く
+- fps を指定すると、リングへ書く (= エンコード・解析する) フレームをその速さに抑える
+- pause() / resume() はプロセスを残したまま撮影だけを止める・再開する (止めている間はカメラを手放す)
+"""
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import OrderedDict
+from util.config import config
+from util.lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+FREE, WRITING, READY = 0, 1, 2
+ROLE_ENCODE, ROLE_ANALYZE = 1, 2
+ALL_ROLES = ROLE_ENCODE | ROLE_ANALYZE
+
+# stats 配列のインデックス
+STAT_CAPTURED, STAT_DROPPED, STAT_ENCODED, STAT_ANALYZED = range(4)
+
+
+def _count(stats, index):
+    """stats 配列の値を1つ増やす (複数のプロセスが書くので配列のロックを取る)"""
+    with stats.get_lock():
+        stats[index] += 1
+
+
+def synthetic_frames(shape, count=8):
+    """カメラなしでベンチマークするための疑似フレーム (事前生成して使い回す)"""
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, size=shape, dtype=np.uint8) for _ in range(count)]
+    i = 0
+    while True:
+        yield frames[i % count]
+        i += 1
+
+
+class _Ring:
+    """プロセス間で共有するスロット管理 (状態は全て共有配列上にある)"""
+
+    def __init__(self, shm, shape, slots, ctrl):
+        self.shm = shm
+        self.shape = shape
+        self.slots = slots
+        self.frame_bytes = int(np.prod(shape))
+        self.state, self.seq, self.need, self.taken, self.active, self.ts, self.cond = ctrl
+
+    def view(self, slot):
+        """スロットを指す ndarray (ゼロコピー)"""
+        return np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.frame_bytes)
+
+    # ---- 書き込み側 (撮影プロセス) ----
+
+    def acquire_write(self, stats):
+        """書き込み先スロットを確保する。全スロットが読み取り中なら None"""
+        with self.cond:
+            for i in range(self.slots):
+                if self.state[i] == FREE:
+                    self.state[i] = WRITING
+                    return i
+
+            # 誰も読んでいない一番古いフレームを捨てて使う
+            oldest = None
+            for i in range(self.slots):
+                if self.state[i] == READY and self.active[i] == 0:
+                    if oldest is None or self.seq[i] < self.seq[oldest]:
+                        oldest = i
+            _count(stats, STAT_DROPPED)
+            if oldest is not None:
+                self.state[oldest] = WRITING
+            return oldest
+
+    def publish(self, slot, seq, ts):
+        with self.cond:
+            self.seq[slot] = seq
+            self.ts[slot] = ts
+            self.need[slot] = ALL_ROLES
+            self.taken[slot] = 0
+            self.state[slot] = READY
+            self.cond.notify_all()
+
+    # ---- 読み取り側 (エンコード / 解析プロセス) ----
+
+    def acquire_read(self, role, timeout):
+        """role がまだ読んでいない一番古いフレームを確保する: (slot, seq, ts) or None"""
+        with self.cond:
+            deadline = time.monotonic() + timeout
+            while True:
+                best = None
+                for i in range(self.slots):
+                    if self.state[i] == READY and self.need[i] & role and not self.taken[i] & role:
+                        if best is None or self.seq[i] < self.seq[best]:
+                            best = i
+                if best is not None:
+                    self.taken[best] |= role
+                    self.active[best] += 1
+                    return best, self.seq[best], self.ts[best]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+    def release_read(self, slot, role):
+        with self.cond:
+            self.need[slot] &= ~role
+            self.active[slot] -= 1
+            if self.need[slot] == 0 and self.active[slot] == 0:
+                self.state[slot] = FREE
+                self.cond.notify_all()
+
+
+def _attach(shm_name, shape, slots, ctrl):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return _Ring(shm, shape, slots, ctrl)
+
+
+def _capture_proc(shm_name, shape, slots, ctrl, stats, stop, active, device, synthetic, fps):
+    ring = _attach(shm_name, shape, slots, ctrl)
+    h, w = shape[:2]
+    cap = None
+    source = synthetic_frames(shape) if synthetic else None
+    interval = 1.0 / fps if fps > 0 else 0.0
+    next_at = time.monotonic()
+    seq = 0
+    try:
+        while not stop.is_set():
+            if not active.is_set():
+                # 一時停止中はデバイスを手放す (MONITORING中は親の取得スレッドが緊急前映像に使う)
+                if cap is not None:
+                    cap.release()
+                    cap = None
+                active.wait(0.5)
+                next_at = time.monotonic()
+                continue
+            if source is not None:
+                if interval:
+                    stop.wait(max(next_at - time.monotonic(), 0.0))
+                frame = next(source)
+            else:
+                if cap is None:
+                    cap = cv2.VideoCapture(device)
+                    if not cap.isOpened():
+                        cap.release()
+                        cap = None
+                        stop.wait(config.camera_reopen_delay)
+                        continue
+                # 間隔が来るまでは grab() でカメラのバッファを空けるだけにして、
+                # 出すフレームが古くならないようにする (デコード・コピーはしない)
+                if not cap.grab():
+                    cap.release()
+                    cap = None
+                    continue
+                if time.monotonic() < next_at:
+                    continue
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+                if frame.shape != tuple(shape):
+                    frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+            next_at = max(next_at + interval, time.monotonic())
+
+            slot = ring.acquire_write(stats)
+            if slot is None:
+                continue
+            np.copyto(ring.view(slot), frame)
+            seq += 1
+            ring.publish(slot, seq, time.time())
+            _count(stats, STAT_CAPTURED)
+    finally:
+        if cap is not None:
+            cap.release()
+        ring.shm.close()
+
+
+def _encode_proc(shm_name, shape, slots, ctrl, stats, stop, out_q, renditions):
+    from util.encoder import RenditionEncoder
+    ring = _attach(shm_name, shape, slots, ctrl)
+    encoder = RenditionEncoder(renditions)
+    try:
+        while not stop.is_set():
+            got = ring.acquire_read(ROLE_ENCODE, 0.5)
+            if got is None:
+                continue
+            slot, seq, ts = got
+            try:
+                encoded = encoder.encode(ring.view(slot))
+            finally:
+                ring.release_read(slot, ROLE_ENCODE)
+            _count(stats, STAT_ENCODED)
+            out_q.put(("frame", seq, ts, encoded))
+    finally:
+        ring.shm.close()
+
+
+def _analyze_proc(shm_name, shape, slots, ctrl, stats, stop, active, out_q):
+    from util.motion import ChangeDetector
+    ring = _attach(shm_name, shape, slots, ctrl)
+    detector = ChangeDetector()
+    reference = None
+    try:
+        while not stop.is_set():
+            if not active.is_set() and reference is not None:
+                # 再開後は親の detector.reset() と同じく参照なしから始める
+                reference = None
+                detector.reset()
+            got = ring.acquire_read(ROLE_ANALYZE, 0.5)
+            if got is None:
+                continue
+            slot, seq, ts = got
+            try:
+                small = detector.prepare(ring.view(slot))
+            finally:
+                ring.release_read(slot, ROLE_ANALYZE)
+            score = detector.score(small, reference)
+            # 親の keep_score() と同じ判定で、送られる (変化あり・キーフレーム) フレームだけを次の参照にする。
+            # 毎フレーム更新すると、ゆっくりした変化はずっと閾値を超えない
+            if detector.keep_score(score, ts):
+                reference = small
+            _count(stats, STAT_ANALYZED)
+            out_q.put(("score", seq, ts, score))
+    finally:
+        ring.shm.close()
+
+
+class ShmPipeline:
+    """
+    親プロセス側の管理クラス
+
+    start() でリングとワーカープロセスを起動し、take_latest() で
+    前回以降に届いた一番新しいエンコード済みフレームを受け取る。
+    プロセスの起動は重い (spawn) ので、ALERTのたびには起動し直さず pause() / resume() で切り替える。
+    """
+
+    def __init__(self, device=None, shape=None, slots=None, encoders=None, synthetic=False, fps=0):
+        self.device = config.camera_index if device is None else device
+        self.shape = (config.pipeline_height, config.pipeline_width, 3) if shape is None else tuple(shape)
+        self.slots = config.pipeline_slots if slots is None else slots
+        self.encoders = config.pipeline_encoders if encoders is None else encoders
+        self.synthetic = synthetic
+        self.fps = fps
+
+        self._ctx = mp.get_context("spawn")
+        self._shm = None
+        self._procs = []
+        self._collector = None
+        self._lock = threading.Lock()
+        self._latest = None
+        self._scores = OrderedDict()
+        self._started_at = 0.0
+        self._resumed_at = 0.0
+        self._baseline = [0, 0, 0, 0]
+
+    def start(self, paused=False):
+        """プロセスを起動する (起動済みなら何もしない)。paused=True なら resume() まで撮影しない"""
+        if self._procs:
+            return
+        from multiprocessing import shared_memory
+        from util.encoder import parse_renditions
+
+        frame_bytes = int(np.prod(self.shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=frame_bytes * self.slots)
+        lock = self._ctx.Lock()
+        ctrl = (
+            self._ctx.Array("b", self.slots, lock=False),   # state
+            self._ctx.Array("q", self.slots, lock=False),   # seq
+            self._ctx.Array("b", self.slots, lock=False),   # need
+            self._ctx.Array("b", self.slots, lock=False),   # taken
+            self._ctx.Array("i", self.slots, lock=False),   # active
+            self._ctx.Array("d", self.slots, lock=False),   # ts
+            self._ctx.Condition(lock),
+        )
+        self.stats_array = self._ctx.Array("q", 4)
+        self._baseline = [0, 0, 0, 0]
+        self._stop = self._ctx.Event()
+        self._active = self._ctx.Event()
+        self._out = self._ctx.Queue(maxsize=self.slots * 4)
+
+        common = (self._shm.name, self.shape, self.slots, ctrl, self.stats_array, self._stop)
+        self._procs = [
+            self._ctx.Process(
+                target=_capture_proc, args=common + (self._active, self.device, self.synthetic, self.fps),
+                name="shm-capture", daemon=True
+            ),
+            self._ctx.Process(
+                target=_analyze_proc, args=common + (self._active, self._out), name="shm-analyze", daemon=True
+            ),
+        ]
+        renditions = parse_renditions()
+        for i in range(self.encoders):
+            self._procs.append(self._ctx.Process(
+                target=_encode_proc, args=common + (self._out, renditions), name=f"shm-encode-{i}", daemon=True
+            ))
+        for p in self._procs:
+            p.start()
+
+        self._started_at = time.monotonic()
+        self._collector = threading.Thread(target=self._collect, name="shm-collector", daemon=True)
+        self._collector.start()
+        print(f"🧵 Shared-memory pipeline started ({self.slots} slots, {self.encoders} encoders)")
+        if not paused:
+            self.resume()
+
+    def pause(self):
+        """撮影を止める (プロセスと共有メモリは残す)"""
+        if self._procs:
+            self._active.clear()
+
+    def resume(self):
+        """撮影を再開する。止める前のフレームは take_latest() で返さず、stats もここから数え直す"""
+        if not self._procs:
+            return
+        with self._lock:
+            self._latest = None
+            self._scores.clear()
+            self._resumed_at = time.time()
+            self._baseline = list(self.stats_array)
+            self._started_at = time.monotonic()
+        self._active.set()
+
+    def _collect(self):
+        while not self._stop.is_set():
+            try:
+                kind, seq, ts, value = self._out.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                # 一時停止前にリングへ残っていたフレームは捨てる
+                if ts < self._resumed_at:
+                    continue
+                if kind == "score":
+                    self._scores[seq] = value
+                    while len(self._scores) > self.slots * 4:
+                        self._scores.popitem(last=False)
+                elif self._latest is None or seq > self._latest[0]:
+                    self._latest = (seq, ts, value)
+
+    def take_latest(self):
+        """
+        前回以降で一番新しいフレームを取り出す。
+        Returns: (撮影時刻, [(Rendition, JPEGバイト列), ...], 変化スコア or None) / なければ None
+        """
+        with self._lock:
+            if self._latest is None:
+                return None
+            seq, ts, encoded = self._latest
+            self._latest = None
+            return ts, encoded, self._scores.get(seq)
+
+    @property
+    def stats(self):
+        """resume() 以降の件数と速さ"""
+        with self._lock:
+            baseline = self._baseline
+        values = list(self.stats_array) if self._procs else baseline
+        values = [v - b for v, b in zip(values, baseline)]
+        elapsed = max(time.monotonic() - self._started_at, 1e-9)
+        return {
+            "captured": values[STAT_CAPTURED],
+            "dropped": values[STAT_DROPPED],
+            "encoded": values[STAT_ENCODED],
+            "analyzed": values[STAT_ANALYZED],
+            "capture_fps": values[STAT_CAPTURED] / elapsed,
+            "encode_fps": values[STAT_ENCODED] / elapsed,
+        }
+
+    def stop(self):
+        if not self._procs:
+            return
+        self._stop.set()
+        for p in self._procs:
+            p.join(timeout=2)
+            if p.is_alive():
+                p.terminate()
+        if self._collector:
+            self._collector.join(timeout=1)
+        self._procs = []
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        print("🧵 Shared-memory pipeline stopped.")
@@ -0,0 +1,45 @@
+import threading
+import time
+
+# プロセス起動 (このモジュールのimport) 時刻を基準にする
+_T0 = time.perf_counter()
+
+
+class StartupTimeline:
+    """起動時に各コンポーネントが使えるようになった時刻を記録する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._marks = []
+
+    def mark(self, name):
+        elapsed = time.perf_counter() - _T0
+        with self._lock:
+            self._marks.append((name, elapsed))
+        return elapsed
+
+    def run_in_background(self, name, func, *args):
+        """
+        func を別スレッドで実行し、終わったら name で記録する。Thread を返す。
+        func が False を返した (接続できずに諦めた・終了で中断した) 場合は失敗として記録する
+        """
+        def _run():
+            try:
+                if func(*args) is False:
+                    self.mark(f"{name} (failed)")
+                    return
+                self.mark(name)
+            except Exception as e:
+                print(f"⚠️ Startup Error ({name}): {e}")
+                self.mark(f"{name} (failed)")
+
+        t = threading.Thread(target=_run, name=f"startup-{name}", daemon=True)
+        t.start()
+        return t
+
+    def report(self):
+        with self._lock:
+            marks = sorted(self._marks, key=lambda m: m[1])
+        print("⏱️ Startup timeline:")
+        for name, elapsed in marks:
+            print(f"   {elapsed * 1000:8.1f} ms  {name}")
@@ -1,5 +1,21 @@
+import queue
 import threading
+import time
+import weakref
 from enum import Enum, auto
+from util import trace
+from util.config import config
+from util.metrics import registry
+
+STATE_UPDATE_SECONDS = registry.histogram(
+    "elderlycam_state_update_seconds", "StateManager.update() の所要時間",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+LISTENER_DELAY_SECONDS = registry.histogram(
+    "elderlycam_listener_delay_seconds", "状態遷移からリスナーが呼ばれるまで", ["listener"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+STATE = registry.gauge("elderlycam_state", "現在の状態 (0: MONITORING / 1: ALERT)")
 
 
 class Status(Enum):
@@ -7,11 +23,124 @@ class Status(Enum):
     ALERT = auto()
 
 
+class _Watchdog:
+    """
+    全リスナーの実行時間を1本のスレッドで見張る (呼び出しごとにタイマースレッドを作らない)。
+    各ワーカーは実行中の呼び出しの開始時刻を持っておき、ここが定期的に超過を調べる
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self._workers = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, worker):
+        with self._lock:
+            self._workers.add(worker)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="listener-watchdog", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                workers = list(self._workers)
+            for worker in workers:
+                worker.check_overrun(now)
+
+
+_watchdog = _Watchdog()
+
+
+class _ListenerWorker:
+    """
+    リスナー1つ分の専用スレッドとキュー
+
+    遷移はキューに積まれた順に1つずつ処理されるので、リスナーごとの順序は保たれる。
+    遅いリスナーがいても他のリスナーや update() の呼び出し元は待たされない。
+    """
+
+    def __init__(self, callback, timeout):
+        self.callback = callback
+        self.name = getattr(callback, "__qualname__", repr(callback))
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"listener-{self.name}", daemon=True)
+
+        self.calls = 0
+        self.timeouts = 0
+        self.last_delay = 0.0     # 積まれてから呼ばれるまで
+        self.max_delay = 0.0
+        self.last_duration = 0.0  # リスナーの実行時間
+        self.max_duration = 0.0
+        # 実行中の呼び出し: (状態, 開始時刻, 警告済みか)。_Watchdog が読む
+        self._running = None
+        self._thread.start()
+        _watchdog.watch(self)
+
+    def submit(self, status_str):
+        self._queue.put((status_str, time.perf_counter()))
+
+    def close(self):
+        self._queue.put(None)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def check_overrun(self, now):
+        """timeout 秒を超えて実行中なら1回だけ警告する (_Watchdog のスレッドから呼ばれる)"""
+        running = self._running
+        if running is None or running[2] or now - running[1] < self.timeout:
+            return
+        self._running = (running[0], running[1], True)
+        self.timeouts += 1
+        print(f"⚠️ Listener slow ({self.name}): '{running[0]}' still running after {self.timeout}s")
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            status_str, queued_at = item
+
+            start = time.perf_counter()
+            self.last_delay = start - queued_at
+            LISTENER_DELAY_SECONDS.labels(self.name).observe(self.last_delay)
+            self.max_delay = max(self.max_delay, self.last_delay)
+
+            self._running = (status_str, start, False)
+            try:
+                self.callback(status_str)
+            except Exception as e:
+                print(f"⚠️ Listener Error ({self.name}): {e}")
+            finally:
+                self._running = None
+                self.calls += 1
+                self.last_duration = time.perf_counter() - start
+                self.max_duration = max(self.max_duration, self.last_duration)
+
+
 class StateManager:
-    def __init__(self, initial_state: Status = Status.MONITORING):
+    """
+    状態管理 (Thread-safe & Observer Pattern)
+
+    dispatch="sync" : update() を呼んだスレッドでリスナーを順番に呼ぶ (従来動作)
+    dispatch="async": リスナーごとの専用スレッドへ渡して、update() はすぐ戻る
+    """
+
+    def __init__(self, initial_state: Status = Status.MONITORING, dispatch=None):
         self._status = initial_state
         self._lock = threading.Lock()
         self._listeners = []
+        self._workers = {}
+        self.dispatch = config.listener_dispatch if dispatch is None else dispatch
+        # 直近の状態遷移時刻 (perf_counter)。遅延計測用
+        self.last_changed_at = None
+        STATE.set_function(lambda: 1 if self._status == Status.ALERT else 0)
 
     @property
     def current(self):
@@ -21,13 +150,40 @@ class StateManager:
     def add_listener(self, callback):
         with self._lock:
             self._listeners.append(callback)
+            if self.dispatch == "async":
+                self._workers[callback] = _ListenerWorker(callback, config.listener_timeout)
         
     def remove_listener(self, callback):
         with self._lock:
             if callback in self._listeners:
                 self._listeners.remove(callback)
+            worker = self._workers.pop(callback, None)
+        if worker is not None:
+            worker.close()
+
+    @property
+    def listener_stats(self):
+        """リスナーごとの呼び出し遅延・実行時間 (asyncモードのみ)"""
+        with self._lock:
+            workers = list(self._workers.values())
+        return {
+            w.name: {
+                "calls": w.calls,
+                "pending": w.pending,
+                "timeouts": w.timeouts,
+                "last_delay": w.last_delay,
+                "max_delay": w.max_delay,
+                "last_duration": w.last_duration,
+                "max_duration": w.max_duration,
+            }
+            for w in workers
+        }
 
     def update(self, new_status):
+        with STATE_UPDATE_SECONDS.time():
+            self._update(new_status)
+
+    def _update(self, new_status):
         if isinstance(new_status, str):
             try:
                 new_status = Status[new_status.upper()]
@@ -41,16 +197,34 @@ class StateManager:
             
             old = self._status
             self._status = new_status
+            self.last_changed_at = time.perf_counter()
+            trace.record("state", new_status.name.lower())
+            if self.dispatch == "async":
+                # ロック内で積むことで、遷移の順序とリスナーに届く順序を一致させる
+                status_str = new_status.name.lower()
+                for worker in self._workers.values():
+                    worker.submit(status_str)
         
         print("-" * 40)
         print(f"🔄 State: {old.name} -> {new_status.name}")
         print("-" * 40)
-        self._notify(new_status)
+        if self.dispatch != "async":
+            self._notify(new_status)
 
     def _notify(self, new_status):
         status_str = new_status.name.lower() if isinstance(new_status, Status) else new_status
-        for callback in self._listeners:
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
             try:
                 callback(status_str)
             except Exception as e:
-                print(f"⚠️ Listener Error ({callback.__qualname__}): {e}")
\ No newline at end of file
+                print(f"⚠️ Listener Error ({callback.__qualname__}): {e}")
+
+    def close(self):
+        """asyncモードのリスナースレッドを止める"""
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
\ No newline at end of file
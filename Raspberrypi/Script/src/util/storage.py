@@ -1,21 +1,350 @@
+import io
 import os
-import boto3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from util import trace
 from util.config import config
+from util.lazy import lazy_import
+from util.metrics import registry
+
+boto3 = lazy_import("boto3")
+
+UPLOAD_SECONDS = registry.histogram("elderlycam_s3_upload_seconds", "S3アップロード時間", ["method", "result"])
+UPLOAD_QUEUE_DEPTH = registry.gauge("elderlycam_upload_queue_depth", "アップロード待ち + 送信中の件数")
+UPLOAD_DROPPED = registry.counter("elderlycam_upload_dropped", "キュー満杯で捨てたアップロード数")
+
+# S3のイベント通知 (→ LINE の push) は .jpg / .jpeg / .png / .gif で終わるキーにだけ反応する (S3/Images/s3.tf)。
+# 通知を起こさずに置きたいJPEG (緊急前映像など) はこの拡張子にする
+QUIET_JPEG_SUFFIX = ".jfif"
+
+
+def quiet_name(filename):
+    """S3の通知を起こさないファイル名にする (例: 1700000000000.jpg -> 1700000000000.jfif)"""
+    root, ext = os.path.splitext(filename)
+    if ext in (".jpg", ".jpeg"):
+        return root + QUIET_JPEG_SUFFIX
+    return filename
+
 
 class StorageManager:
-    def __init__(self):
-        self.s3 = boto3.client('s3', region_name=config.region)
+    """
+    S3アップロード
+
+    upload() / upload_bytes() は同期API。
+    submit_bytes() はアップロードキューに積んで Future を返し、ワーカースレッドが並行して送る。
+    config.storage_mode == "file" の時は、積む前に /tmp へ書き出して upload_file で送る
+    (キュー待ちのJPEGをメモリに持たないフォールバック)。
+    """
+
+    def __init__(self, outbox=None):
+        self._s3 = None
+        self._s3_lock = threading.Lock()
         self.bucket = config.bucket_name
+        self.tmp_dir = "/tmp"
+        # 送れなかったフレームはここに溜めて、接続回復後に順番に再送する
+        self.outbox = outbox
+
+        # アップロードキュー
+        self.workers = config.upload_workers
+        self.max_queue = config.upload_queue_size
+        self.policy = config.upload_queue_policy  # drop_oldest / drop_newest / block
+        self._queue = deque()
+        self._priority = 0  # キュー先頭にある優先ジョブの数
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self._active = 0
+
+        # 計測値
+        self._started_at = time.time()
+        self.submitted = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.dropped = 0
+        self.uploaded_bytes = 0
+        self.last_latency = 0.0
+        self.avg_latency = 0.0
+        UPLOAD_QUEUE_DEPTH.set_function(lambda: self.queue_depth)
 
-    def upload(self, local_path, filename, folder_name):
+    @property
+    def s3(self):
+        """boto3クライアントは初回使用時に作る (起動を速くするため)"""
+        if self._s3 is None:
+            with self._s3_lock:
+                if self._s3 is None:
+                    self._s3 = boto3.client('s3', region_name=config.region)
+        return self._s3
+
+    def warm_up(self):
+        """起動時にバックグラウンドでクライアントを用意しておく"""
+        return self.s3 is not None
+
+    def upload(self, local_path, filename, folder_name, content_type="image/jpeg", metadata=None, purpose="capture"):
+        """
+        ファイルをアップロードする。成否にかかわらずファイルは消す。
+        purpose はトレースに残す用途 (capture / rendition / prealert / clip / cameras)。trace_replay.py が用途ごとに再生する
+        """
         s3_key = f"{folder_name}/{filename}"
+        start = time.perf_counter()
         try:
-            self.s3.upload_file(local_path, self.bucket, s3_key)
+            self.s3.upload_file(
+                local_path, self.bucket, s3_key,
+                ExtraArgs={"ContentType": content_type, "Metadata": metadata or {}}
+            )
+            UPLOAD_SECONDS.labels("upload_file", "ok").observe(time.perf_counter() - start)
+            trace.record("upload", {
+                "key": s3_key, "purpose": purpose, "ok": True, "latency": round(time.perf_counter() - start, 4)
+            })
             print(f"☁️ Uploaded: {s3_key}")
             return True
         except Exception as e:
+            UPLOAD_SECONDS.labels("upload_file", "error").observe(time.perf_counter() - start)
+            trace.record("upload", {
+                "key": s3_key, "purpose": purpose, "ok": False, "latency": round(time.perf_counter() - start, 4)
+            })
             print(f"❌ S3 Error: {e}")
+            if self.outbox is not None and os.path.exists(local_path):
+                with open(local_path, "rb") as f:
+                    self._defer(f.read(), filename, folder_name, content_type, metadata)
             return False
         finally:
             if os.path.exists(local_path):
-                os.remove(local_path)
\ No newline at end of file
+                os.remove(local_path)
+
+    def upload_bytes(self, data, filename, folder_name, content_type="image/jpeg", metadata=None, purpose="capture"):
+        """
+        メモリ上のデータ(bytes / bytearray / memoryview)を直接アップロードする。
+        失敗したら Outbox に退避する (Outbox がある場合)。purpose は upload() と同じ
+        """
+        start = time.perf_counter()
+        ok = self._put_object(data, filename, folder_name, content_type, metadata)
+        trace.record("upload", {
+            "key": f"{folder_name}/{filename}", "purpose": purpose, "ok": ok,
+            "latency": round(time.perf_counter() - start, 4)
+        })
+        if not ok and self.outbox is not None:
+            self._defer(data, filename, folder_name, content_type, metadata)
+        return ok
+
+    def _put_object(self, data, filename, folder_name, content_type, metadata):
+        s3_key = f"{folder_name}/{filename}"
+        body = data if isinstance(data, (bytes, bytearray)) else io.BytesIO(data)
+        start = time.perf_counter()
+        try:
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=s3_key,
+                Body=body,
+                ContentType=content_type,
+                Metadata=metadata or {}
+            )
+            UPLOAD_SECONDS.labels("put_object", "ok").observe(time.perf_counter() - start)
+            print(f"☁️ Uploaded: {s3_key} ({len(data)} bytes)")
+            return True
+        except Exception as e:
+            UPLOAD_SECONDS.labels("put_object", "error").observe(time.perf_counter() - start)
+            print(f"❌ S3 Error: {e}")
+            return False
+
+    # ---- アップロードキュー ----
+
+    def submit_bytes(self, data, filename, folder_name, content_type="image/jpeg", metadata=None, priority=False,
+                     purpose="capture"):
+        """
+        アップロードをキューに積む。
+        priority=True のジョブは通常のジョブより先に送り、満杯時も通常のジョブから先に捨てる。
+        Returns: Future (結果は upload_bytes と同じ True/False。キューから捨てられた場合はキャンセル)
+        """
+        future = Future()
+        path = None
+        if config.storage_mode == "file":
+            path = self._spool(data, folder_name, filename)
+            data = None
+        job = (future, data, filename, folder_name, content_type, metadata, path, purpose)
+
+        with self._cond:
+            if self._closed:
+                self._cancel(job)
+                return future
+            self._ensure_workers()
+
+            if len(self._queue) >= self.max_queue:
+                if priority and len(self._queue) > self._priority:
+                    # 優先ジョブは一番新しい通常のジョブを押し出して入る
+                    self._discard(self._queue.pop())
+                elif self.policy == "block":
+                    while len(self._queue) >= self.max_queue and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        self._cancel(job)
+                        return future
+                elif self.policy == "drop_newest":
+                    self.dropped += 1
+                    UPLOAD_DROPPED.inc()
+                    self._cancel(job)
+                    return future
+                else:
+                    # 通常のジョブの一番古いもの (なければ優先ジョブの一番古いもの)
+                    index = self._priority if len(self._queue) > self._priority else 0
+                    old = self._queue[index]
+                    del self._queue[index]
+                    if index == 0 and self._priority:
+                        self._priority -= 1
+                    self._discard(old)
+
+            if priority:
+                self._queue.insert(self._priority, job)
+                self._priority += 1
+            else:
+                self._queue.append(job)
+            self.submitted += 1
+            self._cond.notify_all()
+        return future
+
+    def _spool(self, data, folder_name, filename):
+        """STORAGE_MODE=file: キューに積む前に /tmp へ書き出す"""
+        path = os.path.join(self.tmp_dir, f"upload_{folder_name}_{filename}".replace("/", "_"))
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _cancel(self, job):
+        """送らずに終えるジョブ。書き出したファイルがあれば消す"""
+        job[0].cancel()
+        path = job[6]
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def _discard(self, job):
+        # self._cond を保持した状態で呼ぶ
+        self._cancel(job)
+        self.dropped += 1
+        UPLOAD_DROPPED.inc()
+        print(f"⚠️ Upload queue full. Dropped: {job[3]}/{job[2]}")
+
+    def _ensure_workers(self):
+        # self._cond を保持した状態で呼ぶ
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._worker, name=f"s3-upload-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                job = self._queue.popleft()
+                if self._priority:
+                    self._priority -= 1
+                self._active += 1
+                self._cond.notify_all()
+
+            future, data, filename, folder_name, content_type, metadata, path, purpose = job
+            error = None
+            try:
+                if not future.set_running_or_notify_cancel():
+                    self._cancel(job)
+                    continue
+                start = time.perf_counter()
+                if path is not None:
+                    size = os.path.getsize(path)
+                    ok = self.upload(path, filename, folder_name, content_type, metadata, purpose=purpose)
+                else:
+                    size = len(data)
+                    ok = self.upload_bytes(data, filename, folder_name, content_type, metadata, purpose=purpose)
+                latency = time.perf_counter() - start
+                self._record(ok, size, latency)
+                future.set_result(ok)
+            except Exception as e:
+                error = e
+                print(f"⚠️ Upload Error: {type(e).__name__}: {e}")
+            finally:
+                # 結果を入れられずに抜けた (Outboxへの退避の失敗など) ら、待っている側に例外で知らせる
+                if future.running():
+                    future.set_exception(error or RuntimeError("upload worker stopped"))
+                with self._cond:
+                    self._active -= 1
+                    self._cond.notify_all()
+
+    # ---- Outbox ----
+
+    def _defer(self, data, filename, folder_name, content_type, metadata):
+        self.outbox.put(
+            "s3", data,
+            filename=filename, folder_name=folder_name,
+            content_type=content_type, metadata=metadata
+        )
+        print(f"📮 Upload queued to outbox: {folder_name}/{filename}")
+
+    def replay(self, meta, payload):
+        """Outbox からの再送ハンドラ (失敗してもエントリは Outbox に残るので、積み直さない)"""
+        return self._put_object(
+            payload, meta["filename"], meta["folder_name"],
+            meta["content_type"], meta["metadata"]
+        )
+
+    def _record(self, ok, size, latency):
+        with self._cond:
+            if ok:
+                self.uploaded += 1
+                self.uploaded_bytes += size
+            else:
+                self.failed += 1
+            self.last_latency = latency
+            # 指数移動平均
+            self.avg_latency = latency if self.avg_latency == 0.0 else self.avg_latency * 0.8 + latency * 0.2
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue) + self._active
+
+    @property
+    def stats(self):
+        with self._cond:
+            elapsed = max(time.time() - self._started_at, 1e-9)
+            return {
+                "queue_depth": len(self._queue),
+                "in_flight": self._active,
+                "submitted": self.submitted,
+                "uploaded": self.uploaded,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "last_latency": self.last_latency,
+                "avg_latency": self.avg_latency,
+                "uploads_per_sec": self.uploaded / elapsed,
+                "bytes_per_sec": self.uploaded_bytes / elapsed,
+            }
+
+    def drain(self, timeout=None):
+        """キューが空になり、実行中のアップロードが終わるまで待つ。間に合えば True"""
+        deadline = time.monotonic() + (config.upload_drain_timeout if timeout is None else timeout)
+        with self._cond:
+            while self._queue or self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=None):
+        """期限付きで送り切ってからワーカーを止める。送れなかったものはキャンセル"""
+        drained = self.drain(timeout)
+        with self._cond:
+            self._closed = True
+            pending = list(self._queue)
+            self._queue.clear()
+            self._priority = 0
+            self._cond.notify_all()
+        for job in pending:
+            self._cancel(job)
+        if not drained:
+            print(f"⚠️ Upload drain timed out. {len(pending)} pending upload(s) discarded.")
+        for t in self._threads:
+            t.join(timeout=1)
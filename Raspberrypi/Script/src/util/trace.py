@@ -0,0 +1,268 @@
+"""
+入力トレースの記録と再生
+
+記録 (config.trace_path を設定すると有効):
+    Zigbeeのペイロード / Shadow delta / カメラの取得結果 / アップロード結果 / 状態遷移 を
+    gzip の JSON Lines に追記する。1行目はヘッダー、以降は [経過秒, 種類, データ]。
+    カメラ・アップロードの結果は呼び出し側で用途 ("purpose": capture / motion / prealert / ...) を付けて記録する。
+    無効時の record() は None チェック1回だけ。
+
+再生 (trace_replay.py):
+    TraceReplayer が VirtualClock に従って記録を順に handlers へ渡す。
+    speed=60 なら1時間分を1分で、speed=0 なら待たずに流し込む。
+"""
+import gzip
+import json
+import os
+import threading
+import time
+
+FORMAT_VERSION = 1
+
+_recorder = None
+
+
+class TraceRecorder:
+    def __init__(self, path, flush_interval=1.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.records = 0
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._last_flush = self._t0
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._write({"version": FORMAT_VERSION, "started_at": time.time()})
+
+    def _write(self, obj):
+        self._file.write(json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def record(self, kind, data):
+        now = time.perf_counter()
+        with self._lock:
+            if self._file is None:
+                return
+            self._write([round(now - self._t0, 6), kind, data])
+            self.records += 1
+            # 落ちても直前までは読めるように定期的に同期フラッシュする
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def start(path):
+    """記録を開始する (以降の record() がファイルに書かれる)"""
+    global _recorder
+    stop()
+    _recorder = TraceRecorder(path)
+    print(f"🧾 Trace recording: {path}")
+    return _recorder
+
+
+def stop():
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+        print(f"🧾 Trace closed ({recorder.records} records)")
+
+
+def record(kind, data):
+    recorder = _recorder
+    if recorder is not None:
+        recorder.record(kind, data)
+
+
+def read_trace(path):
+    """
+    Returns: (ヘッダー, [(経過秒, 種類, データ), ...])
+    同じファイルに複数回記録した場合は、各セッションの経過秒を前のセッションの後ろにつなげる
+    """
+    header = None
+    records = []
+    offset = 0.0
+    last = 0.0
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    header = header or item
+                    offset = last
+                    continue
+                t, kind, data = item
+                last = offset + t
+                records.append((last, kind, data))
+        except (EOFError, OSError, ValueError):
+            # 記録中に落ちたファイルは読めたところまで使う
+            pass
+    return header or {}, records
+
+
+class VirtualClock:
+    """
+    トレース上の時刻 (秒) を実時間に対応づける。
+    speed > 0: 実時間の speed 倍で進む / speed == 0: 待たずに次の時刻へ飛ぶ
+
+    CaptureScheduler の時計にもなる (now() / wait(event, 秒) / enter() / leave())。
+    speed == 0 では、wait() で待っているスレッドの起床時刻まで wait_until() が1つずつ時刻を進め、
+    起こしたスレッドが処理を終えて次の wait() に入るまで次へ進まない。
+    これで次の入力を流す前に、記録時と同じ回数だけ撮影が行われる。
+    """
+
+    def __init__(self, speed=1.0, settle_timeout=5.0):
+        self.speed = speed
+        self.settle_timeout = settle_timeout  # 動いているスレッドを待つ上限 (実時間・秒)
+        self._start = None
+        self._virtual = 0.0
+        self._cond = threading.Condition()
+        self._waiters = {}  # スレッドID -> 起床する仮想時刻
+        self._busy = 0      # 時計を使っていて、いま wait() に入っていないスレッドの数
+
+    def start(self):
+        self._start = time.perf_counter()
+        with self._cond:
+            self._virtual = 0.0
+
+    def now(self):
+        if self.speed > 0 and self._start is not None:
+            return (time.perf_counter() - self._start) * self.speed
+        return self._virtual
+
+    def sleep(self, seconds):
+        """仮想時間で seconds 秒待つ (speed=0 なら待たない。時計は進めない)"""
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def enter(self):
+        """これから wait() を使うスレッドが動き出す (開始側のスレッドで呼ぶ)"""
+        with self._cond:
+            self._busy += 1
+
+    def leave(self):
+        """enter() したスレッドが wait() に戻らずに終わる"""
+        with self._cond:
+            self._busy = max(self._busy - 1, 0)
+            self._cond.notify_all()
+
+    def wait(self, event, seconds):
+        """
+        仮想時間で seconds 秒待つ。event がセットされたら True (threading.Event.wait と同じ)。
+        True を返したスレッドは leave() したものとして扱う
+        """
+        if self.speed > 0:
+            return event.wait(max(seconds, 0.0) / self.speed)
+
+        me = threading.get_ident()
+        with self._cond:
+            self._busy = max(self._busy - 1, 0)
+            self._waiters[me] = self._virtual + max(seconds, 0.0)
+            self._cond.notify_all()
+            # event.set() はこの Condition を起こさないので短い間隔で見直す
+            while me in self._waiters and not event.is_set():
+                self._cond.wait(0.05)
+            if self._waiters.pop(me, None) is None:
+                # wait_until() に起こされた (busy に数えられている)
+                if not event.is_set():
+                    return False
+                self._busy = max(self._busy - 1, 0)
+                self._cond.notify_all()
+            return True
+
+    def _settle(self):
+        # self._cond を保持した状態で呼ぶ
+        if not self._cond.wait_for(lambda: self._busy == 0, self.settle_timeout):
+            print("⚠️ VirtualClock: a waiter did not come back in time")
+            self._busy = 0
+
+    def wait_until(self, t):
+        if self.speed > 0:
+            delay = t / self.speed - (time.perf_counter() - self._start)
+            if delay > 0:
+                time.sleep(delay)
+            with self._cond:
+                self._virtual = max(self._virtual, t)
+            return
+
+        with self._cond:
+            self._settle()
+            while True:
+                due = [at for at in self._waiters.values() if at <= t]
+                if not due:
+                    break
+                self._virtual = max(self._virtual, min(due))
+                for ident, at in list(self._waiters.items()):
+                    if at <= self._virtual:
+                        del self._waiters[ident]
+                        self._busy += 1
+                self._cond.notify_all()
+                self._settle()
+            self._virtual = max(self._virtual, t)
+
+
+class TraceReplayer:
+    """
+    記録を時刻順に handlers[種類](データ) へ渡す。
+    handlers にない種類 (カメラ・アップロード結果など、呼ばれた時に消費するもの) は飛ばす。
+    """
+
+    def __init__(self, records, handlers, clock=None):
+        self.records = records
+        self.handlers = handlers
+        self.clock = clock or VirtualClock()
+        self.replayed = 0
+        self.errors = 0
+        self.wall_time = 0.0
+        self.latencies = {}  # 種類 -> [ハンドラ実行時間(秒)]
+
+    def run(self, stop_event=None):
+        self.clock.start()
+        start = time.perf_counter()
+        for t, kind, data in self.records:
+            if stop_event is not None and stop_event.is_set():
+                break
+            handler = self.handlers.get(kind)
+            if handler is None:
+                continue
+            self.clock.wait_until(t)
+            begin = time.perf_counter()
+            try:
+                handler(data)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Replay Error ({kind}): {type(e).__name__}: {e}")
+            self.latencies.setdefault(kind, []).append(time.perf_counter() - begin)
+            self.replayed += 1
+        self.wall_time = time.perf_counter() - start
+
+    @property
+    def stats(self):
+        span = self.records[-1][0] if self.records else 0.0
+        per_kind = {}
+        for kind, values in self.latencies.items():
+            ordered = sorted(values)
+            per_kind[kind] = {
+                "count": len(ordered),
+                "p50_ms": ordered[len(ordered) // 2] * 1000,
+                "p95_ms": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return {
+            "replayed": self.replayed,
+            "errors": self.errors,
+            "trace_seconds": span,
+            "wall_seconds": self.wall_time,
+            "speedup": span / self.wall_time if self.wall_time else 0.0,
+            "handlers": per_kind,
+        }